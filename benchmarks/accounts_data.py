@@ -0,0 +1,117 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterator
+
+# cursor.description of ACCOUNTS_47_QUERY as reported by pymssql
+ACCOUNTS_47_DESCRIPTION = [
+    ('Data', 4, None, None, None, None, None),
+    ('SymbolKonta', 1, None, None, None, None, None),
+    ('NazwaKonta', 1, None, None, None, None, None),
+    ('Nazwa', 1, None, None, None, None, None),
+    ('NumerDokumentu', 1, None, None, None, None, None),
+    ('NazwaDokEwidencji', 1, None, None, None, None, None),
+    ('Wn_KwotaOperacji', 5, None, None, None, None, None),
+    ('Ma_KwotaOperacji', 5, None, None, None, None, None),
+    ('RozliczonaKwotaOperacjiSymbol', 1, None, None, None, None, None),
+    ('mpk', 1, None, None, None, None, None),
+    ('firma', 1, None, None, None, None, None),
+]
+
+ACCOUNTS_47_HEADERS = [col[0] for col in ACCOUNTS_47_DESCRIPTION]
+ACCOUNTS_47_DATA_TYPES = [col[1] for col in ACCOUNTS_47_DESCRIPTION]
+
+ACCOUNTS = [
+    ('401-01', 'Zużycie materiałów'),
+    ('402-01', 'Usługi obce - transport'),
+    ('402-05', 'Usługi księgowe'),
+    ('403-01', 'Podatki i opłaty'),
+    ('404-01', 'Wynagrodzenia'),
+    ('405-01', 'Ubezpieczenia społeczne'),
+    ('409-01', 'Pozostałe koszty rodzajowe'),
+    ('701-01', 'Przychody ze sprzedaży produktów'),
+    ('702-01', 'Przychody ze sprzedaży usług'),
+    ('731-01', 'Przychody ze sprzedaży towarów'),
+    ('741-01', 'Wartość sprzedanych towarów'),
+    ('751-01', 'Przychody finansowe - odsetki'),
+]
+DOCUMENT_TYPES = ['Faktura sprzedaży', 'Faktura zakupu', 'Wyciąg bankowy',
+                  'Polecenie księgowania', 'Lista płac', 'Różnice kursowe']
+CURRENCIES = ['PLN', 'EUR', 'USD']
+COST_CENTERS = [None, 'Magazyn Łódź', 'Biuro Warszawa', 'Sprzedaż e-commerce', 'Zarząd']
+
+
+def generate_account_rows(rows: int,
+                          company_name: str = 'SAVVY sp. z o.o.',
+                          start_date: str = '2023-01-01',
+                          days: int = 730,
+                          batch_size: int = 50_000,
+                          seed: int = 47,
+                          first_row: int = 0,
+                          last_row: int = None) -> Iterator[list]:
+    """
+    Generates synthetic ACCOUNTS_47_QUERY rows in batches.
+
+    The rows are spread evenly over the days in date order, so a date range
+    of the ledger is a contiguous range of rows (see rows_between()).
+
+    Args:
+        rows (int): Total number of rows of the ledger.
+        company_name (str): Value of the constant 'firma' column.
+        start_date (str): First ledger date.
+        days (int): Number of days the ledger dates are spread over.
+        batch_size (int): Number of rows per yielded batch.
+        seed (int): Seed of the random generator, for repeatable runs.
+        first_row (int): First row to generate, to generate part of the ledger.
+        last_row (int): Row after the last one to generate, by default all rows.
+
+    Yields:
+        list: Rows (tuples) in the column order of ACCOUNTS_47_DESCRIPTION.
+    """
+    rng = random.Random(seed + first_row)
+    first_day = datetime.strptime(start_date, '%Y-%m-%d')
+    dates = [first_day + timedelta(days=i) for i in range(days)]
+    contractors = [f'Kontrahent {i} sp. z o.o.' for i in range(2_000)]
+
+    last_row = rows if last_row is None else min(last_row, rows)
+    generated = first_row
+    while generated < last_row:
+        batch = []
+        for i in range(generated, min(generated + batch_size, last_row)):
+            symbol, account_name = ACCOUNTS[i % len(ACCOUNTS)]
+            amount = Decimal(rng.randint(1, 10_000_000)).scaleb(-2)
+            debit = rng.random() < 0.5
+            batch.append((
+                dates[i * days // rows],
+                symbol,
+                account_name,
+                rng.choice(contractors) if i % 5 else None,
+                f'FV/{i % 100_000}/{dates[i * days // rows].year}',
+                DOCUMENT_TYPES[i % len(DOCUMENT_TYPES)],
+                amount if debit else Decimal(0),
+                Decimal(0) if debit else amount,
+                CURRENCIES[1] if i % 17 == 0 else CURRENCIES[0],
+                COST_CENTERS[i % len(COST_CENTERS)],
+                company_name,
+            ))
+        generated += len(batch)
+        yield batch
+
+
+def rows_between(rows: int, days: int, first_day: int, last_day: int) -> tuple[int, int]:
+    """
+    Range of rows of a generated ledger dated between two days.
+
+    Args:
+        rows (int): Total number of rows of the ledger.
+        days (int): Number of days of the ledger.
+        first_day (int): First day, counted from start_date (inclusive).
+        last_day (int): Last day, counted from start_date (inclusive).
+
+    Returns:
+        tuple: (first_row, last_row) for generate_account_rows(), last_row exclusive.
+    """
+    def first_row_of(day: int) -> int:
+        # Row i is dated on day i * days // rows
+        return min(rows, max(0, -(-day * rows // days)))
+    return first_row_of(first_day), first_row_of(last_day + 1)
@@ -0,0 +1,94 @@
+"""
+Benchmark of the rows → Arrow conversion on synthetic accounts data.
+
+Compares the untyped data_chunk_to_pyarrow() with the typed conversion in
+el_arrow, with the coarse type map and with the exact decimal type that
+el_schema describes for the amounts. 'scaled' converts the amounts to int64
+scaled by 10^scale in Python and reinterprets them as decimal128, the fast
+path for decimals as scaled integers. Only the conversion is timed,
+generating the rows is not.
+
+    python -m benchmarks.bench_arrow_convert --rows 10000000
+"""
+import argparse
+import time
+import pyarrow as pa
+from repositorium.el_functions import el_arrow, el_func
+from benchmarks.accounts_data import (
+    generate_account_rows,
+    ACCOUNTS_47_HEADERS,
+    ACCOUNTS_47_DATA_TYPES)
+
+# Type of the amount columns as described by sp_describe_first_result_set
+DESCRIBED_DECIMAL = pa.decimal128(18, 2)
+
+
+def described_schema(schema: pa.Schema) -> pa.Schema:
+    """The schema with the exact decimal type of the amounts instead of the coarse mapping."""
+    for i, field in enumerate(schema):
+        if pa.types.is_decimal(field.type):
+            schema = schema.set(i, field.with_type(DESCRIBED_DECIMAL))
+    return schema
+
+
+def scaled_decimal_array(values: tuple, arrow_type: pa.DataType) -> pa.Array:
+    """Decimal column built from int64 values scaled by 10^scale, reinterpreted as decimal128."""
+    scale = arrow_type.scale
+    scaled = pa.array([None if value is None else int(value.scaleb(scale)) for value in values], pa.int64())
+    # decimal128 with scale 0 holds the unscaled integers; the buffers are the same for any scale
+    unscaled = scaled.cast(pa.decimal128(38, 0))
+    return pa.Array.from_buffers(arrow_type, len(unscaled), unscaled.buffers(), unscaled.null_count)
+
+
+def scaled_record_batch(rows: list, schema: pa.Schema) -> pa.RecordBatch:
+    """rows_to_record_batch() with the decimal columns built by scaled_decimal_array()."""
+    arrays = [
+        scaled_decimal_array(values, field.type) if pa.types.is_decimal(field.type)
+        else el_arrow.column_to_arrow(values, field.type)
+        for values, field in zip(zip(*rows), schema)
+        ]
+    return pa.RecordBatch.from_arrays(arrays, names=schema.names)
+
+
+def run(rows: int, batch_size: int) -> dict:
+    schema = el_arrow.build_arrow_schema(
+        headers=ACCOUNTS_47_HEADERS,
+        data_types=ACCOUNTS_47_DATA_TYPES)
+    exact_schema = described_schema(schema)
+    timings = {'untyped': 0.0, 'typed': 0.0, 'described': 0.0, 'scaled': 0.0}
+
+    for batch in generate_account_rows(rows=rows, batch_size=batch_size):
+        start = time.perf_counter()
+        el_func.data_chunk_to_pyarrow(headers=ACCOUNTS_47_HEADERS, data=batch)
+        timings['untyped'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        el_arrow.rows_to_record_batch(rows=batch, schema=schema)
+        timings['typed'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        described = el_arrow.rows_to_record_batch(rows=batch, schema=exact_schema)
+        timings['described'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        scaled = scaled_record_batch(rows=batch, schema=exact_schema)
+        timings['scaled'] += time.perf_counter() - start
+        assert scaled.equals(described)
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--batch-size', type=int, default=el_func.FETCH_BATCH_SIZE)
+    args = parser.parse_args()
+
+    timings = run(rows=args.rows, batch_size=args.batch_size)
+    for name, seconds in timings.items():
+        print(f'{name:>9}: {seconds:8.2f} s  {args.rows / seconds:12,.0f} rows/s')
+    print(f'  speedup: {timings["untyped"] / timings["typed"]:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
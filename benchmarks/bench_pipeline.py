@@ -0,0 +1,149 @@
+"""
+End-to-end benchmark of the extraction and load paths on a synthetic Enova server.
+
+Runs, each in a fresh process so peak memory is measured per path:
+    static  DatabaseTablesExtractor.create_parquet() (one query, streamed)
+    paged   DatabaseTablesExtractor.create_parquet_date_depended() (date pages)
+    load    ParquetPostgresLoader.load_file() of the static output into a local DuckDB file
+    stream  create_parquet() with the postgres sink, loading into a local DuckDB file without Parquet
+
+The source is benchmarks.fake_mssql, so the numbers measure our code and not
+the server. Save the results with --json to keep a baseline to compare with.
+
+    python -m benchmarks.bench_pipeline --rows 2000000 --sink parquet
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from repositorium.el_functions import el_func, el_memory, el_metrics, el_sinks
+from repositorium.el_functions.el_throttle import ThrottlePolicy
+from benchmarks.fake_mssql import FakeMssqlConnection
+from benchmarks.duckdb_target import DuckDBTargetLoader
+
+PATHS = ['static', 'paged', 'load', 'stream']
+TABLE_NAME = 'accounts_47_bench'
+
+
+def run_path(path: str, options: dict) -> dict:
+    """Runs one path in the current process and returns its measurements."""
+    from repositorium.el_functions.el_mssql_classes import DatabaseTablesExtractor
+
+    if not options['verbose']:
+        logging.disable(logging.INFO)
+
+    work_dir = options['work_dir']
+    data_dir, temp_dir = os.path.join(work_dir, 'data'), os.path.join(work_dir, 'temp')
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(temp_dir, exist_ok=True)
+
+    if options['memory_budget']:
+        el_memory.governor.configure(budget_bytes=el_memory.parse_bytes(options['memory_budget']), temp_dir=temp_dir)
+
+    conn = FakeMssqlConnection(rows=options['rows'], days=options['days'])
+    extractor = DatabaseTablesExtractor(data_dir=data_dir,
+                                        temp_dir=temp_dir,
+                                        fetch_batch_size=options['batch_size'],
+                                        sink_type=options['sink'],
+                                        throttle=ThrottlePolicy(mode='off'))
+    extractor.set_connection(conn)
+    el_metrics.run_report.reset(job=f'bench_{path}')
+
+    start = time.perf_counter()
+    if path == 'static':
+        extractor.create_parquet(table_query='ACCOUNTS_47_QUERY', table_name=TABLE_NAME)
+        rows = options['rows']
+    elif path == 'stream':
+        with DuckDBTargetLoader(database=os.path.join(work_dir, 'stream.duckdb')) as loader:
+            extractor.sink_type = el_sinks.SINK_POSTGRES
+            extractor.loader = loader
+            extractor.create_parquet(table_query='ACCOUNTS_47_QUERY', table_name=TABLE_NAME)
+        rows = options['rows']
+    elif path == 'paged':
+        extractor.date_range = {
+            'start_date': conn.start_date,
+            'end_date': conn.end_date.strftime('%Y-%m-%d'),
+            'days_per_page': options['days_per_page'],
+        }
+        extractor.create_parquet_date_depended(table_query='ACCOUNTS_47_DATE_QUERY',
+                                               table_name=f'{TABLE_NAME}_paged')
+        rows = options['rows']
+    else:
+        with DuckDBTargetLoader(database=os.path.join(work_dir, 'target.duckdb')) as loader:
+            rows = loader.load_file(os.path.join(data_dir, f'{TABLE_NAME}.parquet'))['rows']
+    seconds = time.perf_counter() - start
+
+    report = el_metrics.run_report.to_dict()
+    return {
+        'path': path,
+        'rows': rows,
+        'queries': conn.queries,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds),
+        'peak_rss_mb': report['peak_rss_mb'],
+        'stages': [{key: stats[key] for key in ('stage', 'calls', 'wall_seconds', 'cpu_seconds', 'rows_per_sec')}
+                   for stats in report['stages']],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=730, help='days the rows are spread over')
+    parser.add_argument('--days-per-page', type=int, default=31)
+    parser.add_argument('--batch-size', type=int, default=el_func.FETCH_BATCH_SIZE)
+    parser.add_argument('--sink', choices=list(el_sinks.SINKS), default=el_sinks.SINK_PARQUET)
+    parser.add_argument('--memory-budget', default='', help="e.g. 512m, see el_memory.MemoryGovernor")
+    parser.add_argument('--paths', default=','.join(PATHS), help=f'comma separated, of {PATHS}')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--verbose', action='store_true', help='keep the INFO logs')
+    args = parser.parse_args()
+
+    paths = [path for path in PATHS if path in args.paths.split(',')]
+    if 'load' in paths and 'static' not in paths:
+        paths.insert(0, 'static')  # the load path loads the output of the static path
+
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    options = {
+        'work_dir': work_dir,
+        'rows': args.rows,
+        'days': args.days,
+        'days_per_page': args.days_per_page,
+        'batch_size': args.batch_size,
+        'sink': args.sink,
+        'memory_budget': args.memory_budget,
+        'verbose': args.verbose,
+    }
+
+    results = []
+    try:
+        context = multiprocessing.get_context('spawn')
+        for path in paths:
+            with context.Pool(processes=1) as pool:
+                results.append(pool.apply(run_path, (path, options)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{args.rows:,} rows, sink {args.sink}, batches of {args.batch_size:,}")
+    print(f"{'path':>8} {'seconds':>9} {'rows/s':>12} {'peak MB':>9}")
+    for result in results:
+        print(f"{result['path']:>8} {result['seconds']:9.2f} {result['rows_per_sec']:12,} "
+              f"{result['peak_rss_mb'] or 0:9.1f}")
+    for result in results:
+        print(f"\n{result['path']} stages:")
+        for stats in result['stages']:
+            print(f"  {stats['stage']:>9} {stats['calls']:6} calls {stats['wall_seconds']:9.2f} s wall "
+                  f"{stats['cpu_seconds']:9.2f} s cpu {stats['rows_per_sec'] or 0:12,} rows/s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'options': {key: value for key, value in options.items() if key != 'work_dir'},
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Local DuckDB database standing in for the Postgres warehouse in benchmarks.
+"""
+import threading
+import duckdb
+from duckdb import DuckDBPyConnection
+from repositorium.el_functions import el_memory
+from repositorium.el_functions.el_loader import ParquetPostgresLoader, sql_literal
+
+
+class DuckDBTargetLoader(ParquetPostgresLoader):
+    """ParquetPostgresLoader that loads into an attached DuckDB database file.
+
+    The statements meant for Postgres are run by DuckDB on the attached
+    database. Postgres-only steps (UNLOGGED staging tables, index renames)
+    have no DuckDB equivalent, so only the direct load is supported.
+
+    The file is attached once, by a connection shared by all loads; every
+    load gets a cursor of it (a connection to the same DuckDB instance). A
+    DuckDB file must not be opened by several instances at once, so loads
+    with max_workers > 1 write through the one instance.
+    """
+
+    def __init__(self, database: str, max_workers: int = 1, **kwargs):
+        super().__init__(attach_string=f"ATTACH {sql_literal(database)} AS bench_db;",
+                         db_alias='bench_db',
+                         pg_schema='main',
+                         max_workers=max_workers,
+                         staged=False,
+                         **kwargs)
+        self._database = None
+        self._attach_lock = threading.Lock()
+
+    def _connect(self) -> DuckDBPyConnection:
+        with self._attach_lock:
+            if self._database is None:
+                self._database = duckdb.connect(':memory:')
+                el_memory.governor.configure_duckdb(self._database)
+                self._database.execute(self.attach_string)
+        return self._database.cursor()
+
+    def close(self) -> None:
+        super().close()
+        with self._attach_lock:
+            if self._database is not None:
+                self._database.close()
+                self._database = None
+
+    def qualified_name(self, table_name: str) -> str:
+        return f'{self.db_alias}."{self.pg_schema}"."{table_name}"'
+
+    def postgres_execute(self, conn: DuckDBPyConnection, sql: str) -> None:
+        conn.execute(sql)
+
+    def dependent_views(self, conn: DuckDBPyConnection, table_name: str) -> list:
+        return []  # DuckDB binds views to table names when they are queried
@@ -0,0 +1,134 @@
+"""
+DB-API stand-in for a pymssql connection to Enova, serving synthetic accounts rows.
+
+The cursor reports the cursor.description of ACCOUNTS_47_QUERY and streams
+rows from benchmarks.accounts_data, so the extraction code can be run and
+timed without a SQL Server. A query with (start_date, end_date) parameters
+returns only the rows of that date range, as ACCOUNTS_47_DATE_QUERY does.
+"""
+import time
+from datetime import date, datetime, timedelta
+from benchmarks.accounts_data import (
+    ACCOUNTS_47_DESCRIPTION,
+    generate_account_rows,
+    rows_between)
+
+
+class FakeCursor:
+    """Cursor returning a slice of the synthetic ledger of its connection."""
+
+    def __init__(self, connection: 'FakeMssqlConnection'):
+        self.connection = connection
+        self.description = None
+        self._batches = None
+        self._buffer = []
+
+    def execute(self, query: str, params: tuple = None) -> None:
+        conn = self.connection
+        conn.queries += 1
+        if conn.query_latency:
+            time.sleep(conn.query_latency)  # time the server needs for the first row
+
+        first_row, last_row = 0, conn.rows
+        if params:
+            start_date, end_date = (conn.day_of(value) for value in params)
+            first_row, last_row = rows_between(conn.rows, conn.days, start_date, end_date)
+
+        self.description = ACCOUNTS_47_DESCRIPTION
+        self._batches = generate_account_rows(rows=conn.rows,
+                                              company_name=conn.company_name,
+                                              start_date=conn.start_date,
+                                              days=conn.days,
+                                              batch_size=conn.generate_batch_size,
+                                              seed=conn.seed,
+                                              first_row=first_row,
+                                              last_row=last_row)
+        self._buffer = []
+
+    def fetchmany(self, size: int) -> list:
+        rows = []
+        while len(rows) < size:
+            if not self._buffer:
+                self._buffer = next(self._batches, None) or []
+                if not self._buffer:
+                    break
+            take = size - len(rows)
+            rows.extend(self._buffer[:take])
+            self._buffer = self._buffer[take:]
+        return rows
+
+    def fetchall(self) -> list:
+        rows = self._buffer
+        for batch in self._batches:
+            rows.extend(batch)
+        self._buffer = []
+        return rows
+
+    def close(self) -> None:
+        self._batches = None
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FakeMssqlConnection:
+    """Connection to a synthetic accounts ledger of a fixed number of rows.
+
+    Args:
+        rows (int): Total number of rows of the ledger.
+        company_name (str): Value of the 'firma' column.
+        start_date (str): First day of the ledger.
+        days (int): Number of days the rows are spread over.
+        seed (int): Seed of the generator, equal seeds give equal data.
+        query_latency (float): Seconds every execute() waits, to imitate the server.
+    """
+
+    def __init__(self,
+                 rows: int,
+                 company_name: str = 'SAVVY sp. z o.o.',
+                 start_date: str = '2023-01-01',
+                 days: int = 730,
+                 seed: int = 47,
+                 query_latency: float = 0,
+                 generate_batch_size: int = 10_000):
+        self.rows = rows
+        self.company_name = company_name
+        self.start_date = start_date
+        self.days = days
+        self.seed = seed
+        self.query_latency = query_latency
+        self.generate_batch_size = generate_batch_size
+        self.queries = 0
+
+    def day_of(self, value) -> int:
+        """Day number in the ledger of a date, datetime or 'YYYY-MM-DD' string."""
+        if isinstance(value, str):
+            value = datetime.strptime(value[:10], '%Y-%m-%d').date()
+        if isinstance(value, datetime):
+            value = value.date()
+        first_day = datetime.strptime(self.start_date, '%Y-%m-%d').date()
+        return (value - first_day).days
+
+    @property
+    def end_date(self) -> date:
+        """Last day of the ledger."""
+        return datetime.strptime(self.start_date, '%Y-%m-%d').date() + timedelta(days=self.days - 1)
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -8,7 +8,85 @@ COMPANY_DATABASE_LIST = [
     ["BDPoland sp. z o.o.", 'accounts_47_bdpoland', 'e_7010494473']
 ]
 
-ACCOUNTS_47_QUERY = ''' 
+# Indexes built on the accounts tables after each full load
+ACCOUNTS_47_INDEXES = [
+    ['Data'],
+    ['SymbolKonta'],
+]
+
+# One dataset of all companies, partitioned by firma and year/month of Data
+# (output_mode = dataset), loaded into a single table of the same name
+ACCOUNTS_47_DATASET = {
+    'name': 'accounts_47',
+    'partition_by': ['firma'],
+    'date_column': 'Data',
+}
+
+ACCOUNTS_47_DATASET_INDEXES = [
+    ['firma', 'Data'],
+    ['SymbolKonta'],
+]
+
+# Parquet write options of the accounts files (see el_sinks.create_sink()).
+# Sorted by date and account, the row groups get tight min/max statistics.
+# Row counts and debit/credit sums per company and month are collected while
+# writing and compared with the loaded table (see el_reconcile).
+ACCOUNTS_47_WRITE_OPTIONS = {
+    'compression': 'zstd',
+    'compression_level': 3,
+    'row_group_size': 122_880,
+    'use_dictionary': [
+        'SymbolKonta',
+        'NazwaKonta',
+        'NazwaDokEwidencji',
+        'Nazwa',
+        'RozliczonaKwotaOperacjiSymbol',
+        'mpk',
+        'firma',
+    ],
+    'sort_by': ['Data', 'SymbolKonta'],
+    'reconcile': {
+        'group_by': ['firma'],
+        'date_column': 'Data',
+        'sum_columns': ['Wn_KwotaOperacji', 'Ma_KwotaOperacji'],
+    },
+}
+
+# Joins of the ledger entries query, shared by the full and the fact-only queries
+_ACCOUNTS_47_FROM = '''FROM 
+    [link_ZapisyKsięgowe] lzk
+INNER JOIN [hub_Konta] hk ON lzk.[Konto] = hk.[ID]
+INNER JOIN [sathub_Konta_szczegóły] sks ON hk.[ID] = sks.[ID]
+INNER JOIN [hub_DefDokEwidencji] hde ON lzk.[DefinicjaEwidencji] = hde.[ID]
+INNER JOIN [sathub_DefDokEwidencji_szczegóły] sdde ON hde.[ID] = sdde.[ID]
+INNER JOIN [satlink_ZapisyKsięgowe_daty] szd ON lzk.[ID] = szd.[ID]
+INNER JOIN [satlink_ZapisyKsięgowe_kwoty] szk ON lzk.[ID] = szk.[ID]
+LEFT OUTER JOIN [link_Dekrety] ld ON lzk.[Dekret] = ld.[ID]
+LEFT OUTER JOIN [satlink_Dekrety_daty] sdd ON ld.[ID] = sdd.[ID]
+LEFT OUTER JOIN [satlink_Dekrety_Wn/Ma] sdwm ON ld.[ID] = sdwm.[ID]
+INNER JOIN [hub_OkresObrachunkowy] hoo ON lzk.[Okres] = hoo.[ID]
+INNER JOIN [sathub_OkresObrachunkowy_szczegóły] soos ON hoo.[ID] = soos.[ID]
+LEFT OUTER JOIN [link_DokEwidencja] lde ON ld.[Ewidencja] = lde.[ID]
+INNER JOIN [satlink_DokEwidencji_daty] sddo ON lde.[ID] = sddo.[ID]
+INNER JOIN [satlink_DokEwidencji_szczegóły] sdso ON lde.[ID] = sdso.[ID]
+LEFT OUTER JOIN [hub_Banki] hb ON (lde.[Podmiot] = hb.[ID] AND lde.[PodmiotType] = 'Banki')
+LEFT OUTER JOIN [hub_Kontrahent] hknt ON (lde.[Podmiot] = hknt.[ID] AND lde.[PodmiotType] = 'Kontrahenci')
+LEFT OUTER JOIN [hub_Pracownik] hp ON (lde.[Podmiot] = hp.[ID] AND lde.[PodmiotType] = 'Pracownicy')
+LEFT OUTER JOIN [hub_UrzędyCelne] huc ON (lde.[Podmiot] = huc.[ID] AND lde.[PodmiotType] = 'UrzedyCelne')
+LEFT OUTER JOIN [hub_UrzędySkarbowe] hus ON (lde.[Podmiot] = hus.[ID] AND lde.[PodmiotType] = 'UrzedySkarbowe')
+LEFT OUTER JOIN [hub_ZUS] hzus ON (lde.[Podmiot] = hzus.[ID] AND lde.[PodmiotType] = 'ZUSY')
+LEFT OUTER JOIN [hub_OddziałyFirmy] hof ON hk.[IDOddzialu] = hof.[ID]
+LEFT OUTER JOIN [sathub_OddziałyFirmy_szczegóły] sof ON hof.[ID] = sof.[ID]
+'''
+
+_ACCOUNTS_47_FEATURES = '''CTE_features_zk AS (
+SELECT f.Parent, TRY_CAST(REPLACE(f.[DataKey], ' ', '') AS INT) AS DataKey
+FROM [Features] f
+WHERE f.ParentType = 'ZapisyKsiegowe'
+),
+'''
+
+_ACCOUNTS_47_SELECT = ''' 
 --sql
 WITH CTE_BI_m_Zapisy_na_kontach AS(
 SELECT
@@ -44,37 +122,8 @@ SELECT
     sof.[ID] AS [IDOddzialu], 
     sof.[NazwaSkrocona] AS [NazwaSkroconaOddzialu], 
     sof.[Nazwa] AS [NazwaOddziału]
-FROM 
-    [link_ZapisyKsięgowe] lzk
-INNER JOIN [hub_Konta] hk ON lzk.[Konto] = hk.[ID]
-INNER JOIN [sathub_Konta_szczegóły] sks ON hk.[ID] = sks.[ID]
-INNER JOIN [hub_DefDokEwidencji] hde ON lzk.[DefinicjaEwidencji] = hde.[ID]
-INNER JOIN [sathub_DefDokEwidencji_szczegóły] sdde ON hde.[ID] = sdde.[ID]
-INNER JOIN [satlink_ZapisyKsięgowe_daty] szd ON lzk.[ID] = szd.[ID]
-INNER JOIN [satlink_ZapisyKsięgowe_kwoty] szk ON lzk.[ID] = szk.[ID]
-LEFT OUTER JOIN [link_Dekrety] ld ON lzk.[Dekret] = ld.[ID]
-LEFT OUTER JOIN [satlink_Dekrety_daty] sdd ON ld.[ID] = sdd.[ID]
-LEFT OUTER JOIN [satlink_Dekrety_Wn/Ma] sdwm ON ld.[ID] = sdwm.[ID]
-INNER JOIN [hub_OkresObrachunkowy] hoo ON lzk.[Okres] = hoo.[ID]
-INNER JOIN [sathub_OkresObrachunkowy_szczegóły] soos ON hoo.[ID] = soos.[ID]
-LEFT OUTER JOIN [link_DokEwidencja] lde ON ld.[Ewidencja] = lde.[ID]
-INNER JOIN [satlink_DokEwidencji_daty] sddo ON lde.[ID] = sddo.[ID]
-INNER JOIN [satlink_DokEwidencji_szczegóły] sdso ON lde.[ID] = sdso.[ID]
-LEFT OUTER JOIN [hub_Banki] hb ON (lde.[Podmiot] = hb.[ID] AND lde.[PodmiotType] = 'Banki')
-LEFT OUTER JOIN [hub_Kontrahent] hknt ON (lde.[Podmiot] = hknt.[ID] AND lde.[PodmiotType] = 'Kontrahenci')
-LEFT OUTER JOIN [hub_Pracownik] hp ON (lde.[Podmiot] = hp.[ID] AND lde.[PodmiotType] = 'Pracownicy')
-LEFT OUTER JOIN [hub_UrzędyCelne] huc ON (lde.[Podmiot] = huc.[ID] AND lde.[PodmiotType] = 'UrzedyCelne')
-LEFT OUTER JOIN [hub_UrzędySkarbowe] hus ON (lde.[Podmiot] = hus.[ID] AND lde.[PodmiotType] = 'UrzedySkarbowe')
-LEFT OUTER JOIN [hub_ZUS] hzus ON (lde.[Podmiot] = hzus.[ID] AND lde.[PodmiotType] = 'ZUSY')
-LEFT OUTER JOIN [hub_OddziałyFirmy] hof ON hk.[IDOddzialu] = hof.[ID]
-LEFT OUTER JOIN [sathub_OddziałyFirmy_szczegóły] sof ON hof.[ID] = sof.[ID]
-),
-CTE_features_zk AS (
-SELECT f.Parent, TRY_CAST(REPLACE(f.[DataKey], ' ', '') AS INT) AS DataKey
-FROM [Features] f
-WHERE f.ParentType = 'ZapisyKsiegowe'
-),
-CTE_mpk_and_id AS (
+''' + _ACCOUNTS_47_FROM + '''),
+''' + _ACCOUNTS_47_FEATURES + '''CTE_mpk_and_id AS (
 SELECT 
 fzk.Parent,
 fzk.DataKey,
@@ -86,6 +135,7 @@ LEFT JOIN [CentraKosztow] ck
 ),
 CTE_okres AS(
 SELECT
+	z.IDZapisu,
 	zk.[Data],
 	z.SymbolKonta,
 	z.NazwaKonta, 
@@ -118,6 +168,122 @@ SELECT
 	o.mpk,
     '{company_name}' AS firma
 FROM CTE_okres o
+'''
+
+ACCOUNTS_47_QUERY = _ACCOUNTS_47_SELECT + ''';
+'''
+
+# Same query limited to a date range (start_date, end_date inclusive) for
+# date paged and incremental extraction
+ACCOUNTS_47_DATE_QUERY = _ACCOUNTS_47_SELECT + '''WHERE o.[Data] >= %s AND o.[Data] < DATEADD(day, 1, %s)
 ;
 '''
 
+# Rows outside a date range (start_date, end_date inclusive) or without a date,
+# the remainder of a sliced extraction by date
+ACCOUNTS_47_OUTSIDE_QUERY = _ACCOUNTS_47_SELECT + '''WHERE o.[Data] IS NULL OR o.[Data] < %s OR o.[Data] >= DATEADD(day, 1, %s)
+;
+'''
+
+# Same query limited to one of n disjoint slices by the ledger entry id,
+# with the parameters (n, slice number), for a sliced extraction
+ACCOUNTS_47_SLICE_QUERY = _ACCOUNTS_47_SELECT + '''WHERE o.[IDZapisu] % %s = %s
+;
+'''
+
+# Dimension offload: the ledger entries with the keys of their dimensions instead of
+# the names, joined back to the dimension tables locally (ACCOUNTS_47_LOCAL_JOIN)
+_ACCOUNTS_47_FACT_SELECT = ''' 
+--sql
+WITH CTE_zapisy AS(
+SELECT
+    lzk.[ID] AS [IDZapisu], 
+    lzk.[Konto] AS [IDKonta], 
+    lzk.[DefinicjaEwidencji] AS [IDDefinicjiEwidencji], 
+    lde.[Podmiot] AS [IDPodmiotu], 
+    IIF(lzk.[Strona] = 1, szk.[KwotaOperacjiValue], 0) AS [Wn_KwotaOperacji], 
+    IIF(lzk.[Strona] = 2, szk.[KwotaOperacjiValue], 0) AS [Ma_KwotaOperacji], 
+    szk.[RozliczonaKwotaOperacjiSymbol] AS [RozliczonaKwotaOperacjiSymbol]
+''' + _ACCOUNTS_47_FROM + '''WHERE (sks.[Symbol] LIKE '7%' OR sks.[Symbol] LIKE '4%')
+),
+''' + _ACCOUNTS_47_FEATURES + '''CTE_okres AS(
+SELECT
+	z.IDZapisu,
+	zk.[Data],
+	z.IDKonta,
+	z.IDPodmiotu,
+	zk.NumerDokumentu, 
+	z.IDDefinicjiEwidencji,
+	z.Wn_KwotaOperacji,
+	z.Ma_KwotaOperacji,
+	z.RozliczonaKwotaOperacjiSymbol,
+	fzk.DataKey AS IDMpk
+FROM [CTE_zapisy] z
+LEFT JOIN [ZapisyKsiegowe] zk
+	ON zk.ID = z.IDZapisu
+LEFT JOIN CTE_features_zk fzk
+	ON fzk.Parent = z.IDZapisu
+)
+SELECT 
+	o.[Data],
+	o.IDKonta,
+	o.IDPodmiotu,
+	o.NumerDokumentu, 
+	o.IDDefinicjiEwidencji,
+	o.Wn_KwotaOperacji,
+	o.Ma_KwotaOperacji,
+	o.RozliczonaKwotaOperacjiSymbol,
+	o.IDMpk
+FROM CTE_okres o
+'''
+
+ACCOUNTS_47_FACT_QUERY = _ACCOUNTS_47_FACT_SELECT + ''';
+'''
+
+ACCOUNTS_47_FACT_DATE_QUERY = _ACCOUNTS_47_FACT_SELECT + '''WHERE o.[Data] >= %s AND o.[Data] < DATEADD(day, 1, %s)
+;
+'''
+
+# Dimension tables by the name of their view in ACCOUNTS_47_LOCAL_JOIN. They are
+# wrapped in a derived table to compute their version, so no trailing semicolons.
+ACCOUNTS_47_DIMENSIONS = {
+    'konta': '''SELECT sks.[ID] AS [IDKonta], sks.[Symbol] AS [SymbolKonta], sks.[Nazwa] AS [NazwaKonta]
+FROM [sathub_Konta_szczegóły] sks
+WHERE (sks.[Symbol] LIKE '7%' OR sks.[Symbol] LIKE '4%')''',
+    'kontrahenci': '''SELECT k.[ID] AS [IDPodmiotu], k.[Nazwa] AS [Nazwa]
+FROM [Kontrahenci] k''',
+    'definicje_ewidencji': '''SELECT sdde.[ID] AS [IDDefinicjiEwidencji], sdde.[Nazwa] AS [NazwaDokEwidencji]
+FROM [sathub_DefDokEwidencji_szczegóły] sdde''',
+    'centra_kosztow': '''SELECT ck.[ID] AS [IDMpk], ck.[Nazwa] AS [mpk]
+FROM [CentraKosztow] ck''',
+}
+
+# DuckDB query rebuilding the rows of ACCOUNTS_47_QUERY from the view facts
+# (ACCOUNTS_47_FACT_QUERY) and the views of ACCOUNTS_47_DIMENSIONS
+ACCOUNTS_47_LOCAL_JOIN = '''
+SELECT
+    f."Data",
+    k."SymbolKonta",
+    k."NazwaKonta",
+    p."Nazwa",
+    f."NumerDokumentu",
+    d."NazwaDokEwidencji",
+    f."Wn_KwotaOperacji",
+    f."Ma_KwotaOperacji",
+    f."RozliczonaKwotaOperacjiSymbol",
+    c."mpk",
+    '{company_name}' AS firma
+FROM facts f
+LEFT JOIN konta k ON k."IDKonta" = f."IDKonta"
+LEFT JOIN kontrahenci p ON p."IDPodmiotu" = f."IDPodmiotu"
+LEFT JOIN definicje_ewidencji d ON d."IDDefinicjiEwidencji" = f."IDDefinicjiEwidencji"
+LEFT JOIN centra_kosztow c ON c."IDMpk" = f."IDMpk"
+'''
+
+# Offloaded extraction of the accounts, see DatabaseTablesExtractor
+ACCOUNTS_47_OFFLOAD = {
+    'fact_query': ACCOUNTS_47_FACT_QUERY,
+    'fact_date_query': ACCOUNTS_47_FACT_DATE_QUERY,
+    'dimensions': ACCOUNTS_47_DIMENSIONS,
+    'join_query': ACCOUNTS_47_LOCAL_JOIN,
+}
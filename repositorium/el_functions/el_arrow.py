@@ -0,0 +1,167 @@
+import itertools
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import List
+from repositorium.logger import logger, throttled
+from repositorium.el_functions.sql_mapping import MSSQL_TO_ARROW_MAP
+
+# Arrow errors raised when a Python value does not fit the declared type
+CONVERSION_ERRORS = (pa.ArrowException, TypeError, ValueError, OverflowError)
+
+# Type of the string columns built as dictionary arrays
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+# A sampled string column is dictionary encoded when at most this share of its values is distinct
+DICTIONARY_MAX_DISTINCT_RATIO = 0.5
+# Smaller samples say too little about the cardinality to decide
+DICTIONARY_MIN_SAMPLE_ROWS = 1_000
+# Values interned per column; past this every batch gets a dictionary of its own
+DICTIONARY_MAX_SIZE = 1_000_000
+
+
+def build_arrow_schema(
+        headers: list,
+        data_types: list,
+        arrow_dtypes: dict[int, pa.DataType] = MSSQL_TO_ARROW_MAP) -> pa.Schema:
+    """
+    Builds an explicit Arrow schema from the cursor description.
+
+    Args:
+        headers (list): Column names from cursor.description.
+        data_types (list): Corresponding SQL Server type codes.
+        arrow_dtypes (dict[int, pa.DataType]): Mapping of SQL Server types to Arrow types.
+
+    Returns:
+        pa.Schema: Schema with one nullable field per column.
+    """
+    return pa.schema(
+        [pa.field(col, arrow_dtypes.get(dtype, pa.string()))  # Default to string
+         for col, dtype in zip(headers, data_types)]
+        )
+
+
+def sample_dictionary_columns(rows: list, schema: pa.Schema) -> list:
+    """
+    Picks the string columns worth dictionary encoding from a sample of rows.
+
+    Args:
+        rows (list): Sample of data rows, e.g. the first batch.
+        schema (pa.Schema): Schema of the rows.
+
+    Returns:
+        list: Names of the string columns with few distinct values, none if
+            the sample is smaller than DICTIONARY_MIN_SAMPLE_ROWS.
+    """
+    if len(rows) < DICTIONARY_MIN_SAMPLE_ROWS:
+        return []
+
+    columns = []
+    for i, field in enumerate(schema):
+        if not pa.types.is_string(field.type):
+            continue
+        values = [row[i] for row in rows if row[i] is not None]
+        if values and len(set(values)) <= DICTIONARY_MAX_DISTINCT_RATIO * len(values):
+            columns.append(field.name)
+    return columns
+
+
+def with_dictionary_columns(schema: pa.Schema, columns: list) -> pa.Schema:
+    """Returns the schema with the given string columns changed to DICTIONARY_TYPE."""
+    for i, field in enumerate(schema):
+        if field.name in columns and pa.types.is_string(field.type):
+            schema = schema.set(i, field.with_type(DICTIONARY_TYPE))
+    return schema
+
+
+class DictionaryEncoder:
+    """Builds the dictionary arrays of one string column, interning its values over all batches.
+
+    Every distinct value is converted to Arrow once; a batch adds only int32
+    indices and the values not seen before. The batches share one growing
+    dictionary, so equal values keep their code across batches and the
+    Parquet writer can write the dictionary pages without hashing the
+    strings again. After max_size distinct values the column is encoded
+    per batch instead.
+    """
+
+    def __init__(self, max_size: int = DICTIONARY_MAX_SIZE):
+        self.max_size = max_size
+        self.codes = {}  # value -> index in the dictionary
+        self._dictionary = pa.array([], type=pa.string())
+
+    def encode(self, values: list) -> pa.Array:
+        """Converts the values of one column of a batch to a dictionary array."""
+        if len(self.codes) >= self.max_size:
+            return pc.dictionary_encode(column_to_arrow(values, pa.string()))
+
+        codes = self.codes
+        known = len(codes)
+        indices = [None if value is None else codes.setdefault(value, len(codes)) for value in values]
+        try:
+            if len(codes) != known:
+                # Only the values new in this batch are converted, the dictionary
+                # so far is reused as is (concat_arrays copies its buffers).
+                new_values = pa.array(list(itertools.islice(codes, known, None)), type=pa.string())
+                self._dictionary = pa.concat_arrays([self._dictionary, new_values])
+        except CONVERSION_ERRORS as e:
+            logger.warning(f"Column cannot be interned, encoding the batch on its own: {e}",
+                           extra=throttled('dictionary_fallback'))
+            self.codes, self._dictionary = {}, pa.array([], type=pa.string())
+            return column_to_arrow(values, DICTIONARY_TYPE)
+        return pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), self._dictionary)
+
+
+def column_to_arrow(values: list, arrow_type: pa.DataType) -> pa.Array:
+    """
+    Converts the values of one column to an Arrow array of the given type.
+
+    Passing the type lets Arrow skip type inference, which is the expensive
+    part for Decimal and datetime objects. Decimals go straight to
+    decimal128 with the target scale, timestamps and dates to their fixed
+    width types and strings to utf8. If a value does not fit the declared
+    type, the column falls back to inference so the batch is not lost.
+
+    Decimals are not scaled to int64 first: the driver returns Decimal
+    objects, and scaling them in Python costs more than Arrow's own
+    decimal128 conversion (see benchmarks/bench_arrow_convert.py).
+
+    Args:
+        values (list): Column values.
+        arrow_type (pa.DataType): Target Arrow type.
+
+    Returns:
+        pa.Array: Converted column.
+    """
+    try:
+        return pa.array(values, type=arrow_type)
+    except CONVERSION_ERRORS as e:
+        logger.warning(f"Column does not fit {arrow_type}, inferring type instead: {e}",
+                       extra=throttled(('type_fallback', str(arrow_type))))
+        return pa.array(values)
+
+
+def rows_to_record_batch(rows: list, schema: pa.Schema, encoders: dict = None) -> pa.RecordBatch:
+    """
+    Converts rows from the cursor to a RecordBatch with an explicit schema.
+
+    Rows are transposed to columns in a single pass and every column is
+    built with its declared type.
+
+    Args:
+        rows (list): Data rows (tuples) as returned by the cursor.
+        schema (pa.Schema): Schema built with build_arrow_schema().
+        encoders (dict): DictionaryEncoder by column name, for the dictionary
+            columns whose values are interned over all batches.
+
+    Returns:
+        pa.RecordBatch: Converted batch.
+    """
+    if not rows:
+        return pa.RecordBatch.from_pylist([], schema=schema)
+
+    columns: List[tuple] = list(zip(*rows))
+    encoders = encoders or {}
+    arrays = [
+        encoders[field.name].encode(values) if field.name in encoders else column_to_arrow(values, field.type)
+        for values, field in zip(columns, schema)
+        ]
+    return pa.RecordBatch.from_arrays(arrays, names=schema.names)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from typing import Tuple
+from repositorium.logger import logger
+from repositorium.el_functions.el_state import JsonStateStore
+
+MANIFEST_FILE = 'manifest.json'
+
+
+class PageManifest:
+    """Progress of a date-paged extraction, kept on disk so a failed run can be resumed.
+
+    Every completed page is a Parquet part in <checkpoint_dir>/<table_name>/,
+    recorded in manifest.json with its window, row count and the size of the
+    next page. A part is recorded only after its file is complete, so after
+    a crash the first page missing from the manifest is extracted again.
+
+    The manifest belongs to one query text and first day. A run with another
+    query or start date (e.g. after the watermark moved) discards it and
+    starts over; a run with a later end date resumes it and goes further.
+
+    Rows can be posted with a date up to lookback_days in the past. A row
+    posted after a page was extracted is dated on or after extracted_on -
+    lookback_days; if it is dated on or after today - lookback_days, the
+    lookback of the next run (from the watermark of this one) reads it
+    again. Only a page with days between those two dates may miss rows for
+    good, so resume() extracts it again, together with all pages after it.
+    A run resumed on the day its pages were extracted keeps them all.
+
+    Args:
+        checkpoint_dir (str): Directory of the checkpoints of all tables.
+        table_name (str): Name of the target table.
+        sql_query (str): Query of the pages.
+        start_date (str): First day of the extraction (YYYY-MM-DD).
+    """
+
+    def __init__(self, checkpoint_dir: str, table_name: str, sql_query: str, start_date: str):
+        self.dir = os.path.join(checkpoint_dir, table_name)
+        self.table_name = table_name
+        self.start_date = start_date
+        self.key = hashlib.sha256(f"{start_date}\n{sql_query}".encode()).hexdigest()[:32]
+        self.store = JsonStateStore(os.path.join(self.dir, MANIFEST_FILE))
+        if self.store.get('key') != self.key:
+            self.reset()
+
+    @property
+    def pages(self) -> list:
+        """Completed pages: dicts with 'start_date', 'end_date', 'rows', 'bytes', 'part' and 'extracted_on'."""
+        return self.store.get('pages', [])
+
+    def reset(self) -> None:
+        """Discards the parts and the progress and starts a new manifest."""
+        if os.path.isdir(self.dir):
+            logger.info(f"Discarding the checkpoint of {self.table_name}, it was made for another extraction")
+            shutil.rmtree(self.dir)
+        os.makedirs(self.dir, exist_ok=True)
+        self.store = JsonStateStore(os.path.join(self.dir, MANIFEST_FILE))
+        self.store.set('key', self.key)
+        self.store.set('pages', [])
+
+    def expire_pages(self, lookback_days: int) -> None:
+        """Drops the first completed page that may have missed back-dated rows for good, and all pages after it."""
+        pages = self.pages
+        today = date.today()
+        reread_from = (today - timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+        for i, page in enumerate(pages):
+            extracted_on = page.get('extracted_on')
+            if extracted_on is None:  # recorded before pages had the day they were extracted
+                break
+            extracted_on = datetime.strptime(extracted_on, '%Y-%m-%d').date()
+            if extracted_on == today:  # the next run re-reads everything back-dated since
+                continue
+            settled_until = (extracted_on - timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+            if page['end_date'] >= settled_until and page['start_date'] < reread_from:
+                break
+        else:
+            return
+
+        for page in pages[i:]:
+            part_path = os.path.join(self.dir, f"{page['part']}.parquet")
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+        self.store.set('pages', pages[:i])
+        logger.info(f"Extracting {len(pages) - i} completed pages of {self.table_name} again from "
+                    f"{pages[i]['start_date']}, rows may have been back-dated into them since they were extracted")
+
+    def resume(self, lookback_days: int = None) -> Tuple[date, int]:
+        """
+        Where the extraction goes on.
+
+        Args:
+            lookback_days (int): Days in the past rows can still be dated when
+                they are posted; completed pages that may have missed such
+                rows are extracted again (see expire_pages()). None keeps all pages.
+
+        Returns:
+            tuple: (start_date, days_per_page) of the first incomplete page;
+                days_per_page is None when no page is complete yet.
+        """
+        if lookback_days is not None:
+            self.expire_pages(lookback_days)
+        pages = self.pages
+        if not pages:
+            return datetime.strptime(self.start_date, '%Y-%m-%d').date(), None
+        last = pages[-1]
+        logger.info(f"Resuming {self.table_name} after {len(pages)} completed pages, "
+                    f"from the day after {last['end_date']}")
+        return (datetime.strptime(last['end_date'], '%Y-%m-%d').date() + timedelta(days=1),
+                last['next_days_per_page'])
+
+    def part_name(self) -> str:
+        """Table name of the part of the next page."""
+        return f"part-{len(self.pages):05d}"
+
+    def add_page(self,
+                 start_date: date,
+                 end_date: date,
+                 part: str,
+                 rows: int,
+                 nbytes: int,
+                 next_days_per_page: int) -> None:
+        """Records a completed page whose part is written."""
+        self.store.set('pages', self.pages + [{
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'part': part,
+            'rows': rows,
+            'bytes': nbytes,
+            'next_days_per_page': next_days_per_page,
+            'extracted_on': date.today().strftime('%Y-%m-%d'),
+        }])
+
+    def part_paths(self) -> list:
+        """Parquet files of the completed pages, in date order."""
+        return [os.path.join(self.dir, f"{page['part']}.parquet") for page in self.pages]
+
+    def clear(self) -> None:
+        """Removes the checkpoint after the parts have been merged."""
+        shutil.rmtree(self.dir, ignore_errors=True)
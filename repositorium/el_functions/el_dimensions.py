@@ -0,0 +1,88 @@
+import os
+from pymssql import Connection
+from repositorium.logger import logger
+from repositorium.el_functions import el_func, el_sinks, el_throttle
+from repositorium.el_functions.el_state import JsonStateStore
+
+# Version of a dimension: changes when a row is added, removed or changed
+VERSION_QUERY = "SELECT COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM ({query}) AS d;"
+
+
+class DimensionCache:
+    """Small lookup tables of the source databases, kept as Parquet files between runs.
+
+    Every dimension is a query stored as <cache_dir>/<source>/<name>.parquet.
+    Before it is used, its version (row count and CHECKSUM_AGG of the rows,
+    one small aggregate query) is compared with the version of the cached
+    file, and the dimension is extracted again only if it changed. The
+    checksum can miss a change in rare cases; delete the cache directory to
+    extract all dimensions again.
+
+    Args:
+        cache_dir (str): Directory of the cached dimensions.
+        temp_dir (str): Directory for temporary files.
+        fetch_batch_size (int): Number of rows fetched at once.
+        throttle (ThrottlePolicy): Pause after each query, see el_func.fetch_data_batches().
+        retry (RetryPolicy): Retries of transient errors, see el_func.fetch_data_batches().
+    """
+
+    def __init__(self,
+                 cache_dir: str,
+                 temp_dir: str,
+                 fetch_batch_size: int = el_func.FETCH_BATCH_SIZE,
+                 throttle: el_throttle.ThrottlePolicy = None,
+                 retry: el_throttle.RetryPolicy = None):
+        self.cache_dir = cache_dir
+        self.temp_dir = temp_dir
+        self.fetch_batch_size = fetch_batch_size
+        self.throttle = throttle
+        self.retry = retry
+        self.versions = JsonStateStore(os.path.join(cache_dir, 'versions.json'))
+
+    def path(self, source: str, name: str) -> str:
+        return os.path.join(self.cache_dir, source, f"{name}.parquet")
+
+    def version(self, conn_sql: Connection, query: str) -> str:
+        """Current version of a dimension on the server."""
+        cursor = conn_sql.cursor()
+        try:
+            cursor.execute(VERSION_QUERY.format(query=query))
+            rows, checksum = cursor.fetchone()
+        finally:
+            cursor.close()
+        return f"{rows}:{checksum}"
+
+    def fetch(self, conn_sql: Connection, source: str, name: str, query: str) -> str:
+        """
+        Returns the Parquet file of a dimension, extracting it only if it changed.
+
+        Args:
+            conn_sql (Connection): Connection to the source database.
+            source (str): Name of the source database, dimensions are cached per source.
+            name (str): Name of the dimension.
+            query (str): Query of the dimension, without a trailing semicolon.
+
+        Returns:
+            str: Path of the Parquet file.
+        """
+        key = f"{source}/{name}"
+        path = self.path(source, name)
+        version = self.version(conn_sql, query)
+        if os.path.isfile(path) and self.versions.get(key) == version:
+            logger.info(f"Dimension {key} has not changed, using {path}")
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        el_func.fetch_static_data_to_parquet(
+            conn_sql=conn_sql,
+            sql_query=query,
+            table_name=name,
+            data_dir=os.path.dirname(path),
+            temp_dir=self.temp_dir,
+            batch_size=self.fetch_batch_size,
+            sink_type=el_sinks.SINK_PARQUET,
+            throttle=self.throttle,
+            retry=self.retry)
+        self.versions.set(key, version)
+        logger.info(f"Dimension {key} extracted, version {version}")
+        return path
@@ -1,17 +1,16 @@
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
-import duckdb
 from duckdb import DuckDBPyConnection
 import pyarrow as pa
-import pyarrow.parquet as pq
 from pymssql import Connection
-from typing import List, Tuple
-from repositorium.logger import logger
-from repositorium.el_functions.sql_mapping import MSSQL_TO_DUCKDB_MAP
+from typing import Iterator, Tuple
+from repositorium.logger import logger, throttled
+from repositorium.el_functions import el_arrow, el_checkpoint, el_memory, el_metrics, el_paging, el_schema, el_sinks, el_throttle
 
 MAX_RETRIES = 3
 RETRY_DELAY = 30
+FETCH_BATCH_SIZE = 50_000
 
 def clear_temp_directory(directory_path: str) -> None:
     """
@@ -25,16 +24,18 @@ def clear_temp_directory(directory_path: str) -> None:
         logger.info(f"The directory '{directory_path}' does not exist.")
         return
 
+    deleted = 0
     for filename in os.listdir(directory_path):
         file_path = os.path.join(directory_path, filename)
         
         if os.path.isfile(file_path) and filename != '.gitignore':
             os.remove(file_path)
-            logger.info(f"Deleted file: {file_path}")
+            deleted += 1
+            logger.debug(f"Deleted file: {file_path}", extra=throttled('deleted_file'))
         else:
-            logger.info(f"Skipped: {file_path} (not a file)")
+            logger.debug(f"Skipped: {file_path} (not a file)", extra=throttled('skipped_file'))
             
-    logger.info("All files in the directory have been deleted.")
+    logger.info(f"All files in the directory have been deleted ({deleted} files).")
 
 
 def fetch_data_to_parquet(
@@ -43,87 +44,251 @@ def fetch_data_to_parquet(
         sql_query: str,
         table_name: str,
         data_dir: str,
-        temp_dir: str
-        ) -> None:
+        temp_dir: str,
+        batch_size: int = FETCH_BATCH_SIZE,
+        sink_type: str = 'parquet',
+        throttle: el_throttle.ThrottlePolicy = None,
+        retry: el_throttle.RetryPolicy = None,
+        dataset: dict = None,
+        write_options: dict = None,
+        schema_cache: el_schema.SchemaCache = None,
+        loader=None,
+        checkpoint_dir: str = None
+        ) -> int:
     """
-    Extracts data in chunks from SQL Server, loads it into DuckDB, and exports to Parquet.
+    Extracts data in chunks from SQL Server and writes it to Parquet through a sink.
 
     Args:
         conn_sql (Connection): Connection to SQL Server.
         date_range (dict): Dictionary with 'start_date', 'end_date', 'days_per_page'.
+            Optional 'target_rows_per_page', 'target_bytes_per_page' and
+            'max_bytes_per_page' turn on adaptive page sizes (see
+            el_paging.AdaptiveDatePager), bounded by 'min_days_per_page' and
+            'max_days_per_page'. With 'column' (the date column of the query)
+            the 'postgres' sink replaces only the rows of the date range.
+            'lookback_days' is how far back rows can be dated, see
+            fetch_pages_checkpointed().
         sql_query (str): SQL query with placeholders for date range.
         table_name (str): Name of the target table.
-    """
-    start_date = datetime.strptime(date_range['start_date'], '%Y-%m-%d').date()
-    end_date = datetime.strptime(date_range['end_date'], '%Y-%m-%d').date()
-    days_per_page = date_range['days_per_page']
-
-    current_page_start_date = start_date
-
-    temp_db = os.path.join(temp_dir, f"{table_name}.duckdb")
+        batch_size (int): Number of rows fetched and converted at once.
+        sink_type (str): 'parquet' writes the file directly, 'duckdb' stages
+            the data in a temporary DuckDB database first, 'postgres' streams
+            it into the warehouse through the loader.
+        throttle (ThrottlePolicy): Pause after each query, see fetch_data_batches().
+        retry (RetryPolicy): Retries of transient errors, see fetch_data_batches().
+            With adaptive pages, a timed out page is split instead of retried.
+        dataset (dict): Writes into a partitioned dataset, see el_sinks.create_sink().
+            Only the partitions of the date range are replaced.
+        write_options (dict): Parquet write options, see el_sinks.create_sink().
+        schema_cache (SchemaCache): Exact column types of the query, described
+            by the server once per query text. By default the types are mapped
+            from the cursor type codes.
+        loader (ParquetPostgresLoader): Loader of the 'postgres' sink.
+        checkpoint_dir (str): Keeps every completed page in this directory, so
+            a failed extraction resumes from its first incomplete page, see
+            fetch_pages_checkpointed(). Not used with the 'postgres' sink.
 
-    if os.path.exists(temp_db):
-        os.remove(temp_db)  # Remove temp database if it exists
-        logger.info(f"Deleted pre-existing temp database: {temp_db}")
+    Returns:
+        int: Number of rows written.
+    """
+    if dataset is not None:
+        dataset = {**dataset, 'window': (date_range['start_date'], date_range['end_date'])}
+
+    if checkpoint_dir is not None and sink_type != el_sinks.SINK_POSTGRES:
+        return fetch_pages_checkpointed(conn_sql=conn_sql,
+                                        date_range=date_range,
+                                        sql_query=sql_query,
+                                        table_name=table_name,
+                                        data_dir=data_dir,
+                                        temp_dir=temp_dir,
+                                        checkpoint_dir=checkpoint_dir,
+                                        batch_size=batch_size,
+                                        throttle=throttle,
+                                        retry=retry,
+                                        dataset=dataset,
+                                        write_options=write_options,
+                                        schema_cache=schema_cache)
+
+    pager = date_pager(date_range)
+    retry = retry or el_throttle.RetryPolicy(max_retries=MAX_RETRIES, base_delay=RETRY_DELAY)
+    if pager.adaptive:
+        # A page that times out is split instead of retried with the same window
+        retry = retry.without_timeouts()
+    delta_window = {
+        'column': date_range['column'],
+        'start_date': date_range['start_date'],
+        'end_date': date_range['end_date']
+    } if date_range.get('column') else None
 
     try:
-        # Connect to DuckDB
-        with duckdb.connect(database=temp_db) as duck_conn:
-            # Drop table if exists and recreate
-            duck_conn.execute(f"DROP TABLE IF EXISTS {table_name}")
-            table_created_flag = False
-
-            while current_page_start_date <= end_date:
-                current_page_end_date = min(
-                    current_page_start_date + timedelta(days=days_per_page - 1), end_date
-                    )
-
-                headers, data_types, page_data = fetch_data_chunk(
+        with el_sinks.create_sink(sink_type=sink_type,
+                                  table_name=table_name,
+                                  data_dir=data_dir,
+                                  temp_dir=temp_dir,
+                                  dataset=dataset,
+                                  write_options=write_options,
+                                  loader=loader,
+                                  delta_window=delta_window) as sink:
+
+            columns = schema_cache and schema_cache.columns(
+                conn_sql, sql_query, (date_range['start_date'], date_range['end_date']))
+
+            while not pager.done:
+                current_page_start_date, current_page_end_date = pager.next_page()
+                rows_before, bytes_before = sink.rows_written, sink.bytes_written
+
+                batches = fetch_data_batches(
                     conn_sql=conn_sql,
                     sql_query=sql_query,
+                    batch_size=batch_size,
+                    throttle=throttle,
+                    retry=retry,
                     start_date=current_page_start_date,
                     end_date=current_page_end_date
                 )
-                
-
-                arrow_table = data_chunk_to_pyarrow(headers=headers, data=page_data)
-
-                if not table_created_flag:
-
-                    create_table_from_cursor_mapping(
-                        duck_conn=duck_conn,
-                        table_name=table_name,
-                        headers=headers,
-                        data_types=data_types,
-                        sql_dtypes=MSSQL_TO_DUCKDB_MAP
-                    )
-                    table_created_flag = True
-                    
-                insert_arrow_to_duckdb(
-                    duck_conn=duck_conn,
-                    table_name=table_name,
-                    arrow_table=arrow_table
-                    )
-                    
+
+                try:
+                    stream_batches_to_sink(sink=sink, batches=batches, columns=columns)
+                except Exception as e:
+                    # Only a page that has not written any rows yet can be split
+                    if (pager.adaptive and el_throttle.is_timeout_error(e)
+                            and sink.rows_written == rows_before and pager.can_split()):
+                        recover_connection(conn_sql)
+                        pager.split()
+                        continue
+                    raise
+
                 # set the next chunk date
-                current_page_start_date = current_page_end_date + timedelta(days=1)
-    
-            # Export final table to Parquet
-            export_to_parquet(
-                duck_conn=duck_conn,
-                table_name=table_name,
-                output_path=data_dir)
+                pager.record(rows=sink.rows_written - rows_before,
+                             nbytes=sink.bytes_written - bytes_before)
+
+        if columns and not sink.described:
+            schema_cache.invalidate(sql_query)
+
+        logger.info(f"Successfully exported {table_name} to {data_dir}.")
+        return sink.rows_written
 
-            logger.info(f"Successfully exported {table_name} to {data_dir}.")
-        
     except Exception as e:
         logger.error(f"Error processing {table_name}: {e}", exc_info=True)
         raise
-        
-    finally:
-        if os.path.isfile(temp_db):
-            os.remove(temp_db)
-            logger.info(f"Deleted file: {temp_db}")
+
+
+def date_pager(date_range: dict, start_date=None, days_per_page: int = None) -> el_paging.AdaptiveDatePager:
+    """Pager of a date_range (see fetch_data_to_parquet()), optionally starting later with another page size."""
+    return el_paging.AdaptiveDatePager(
+        start_date=start_date or datetime.strptime(date_range['start_date'], '%Y-%m-%d').date(),
+        end_date=datetime.strptime(date_range['end_date'], '%Y-%m-%d').date(),
+        days_per_page=days_per_page or date_range['days_per_page'],
+        target_rows_per_page=date_range.get('target_rows_per_page'),
+        target_bytes_per_page=date_range.get('target_bytes_per_page'),
+        max_bytes_per_page=date_range.get('max_bytes_per_page'),
+        min_days_per_page=date_range.get('min_days_per_page', 1),
+        max_days_per_page=date_range.get('max_days_per_page', 366)
+        )
+
+
+def fetch_pages_checkpointed(
+        conn_sql: Connection,
+        date_range: dict,
+        sql_query: str,
+        table_name: str,
+        data_dir: str,
+        temp_dir: str,
+        checkpoint_dir: str,
+        batch_size: int = FETCH_BATCH_SIZE,
+        throttle: el_throttle.ThrottlePolicy = None,
+        retry: el_throttle.RetryPolicy = None,
+        dataset: dict = None,
+        write_options: dict = None,
+        schema_cache: el_schema.SchemaCache = None
+        ) -> int:
+    """
+    Extracts date pages into Parquet parts with a progress manifest, then merges them.
+
+    Every page is written to its own part in <checkpoint_dir>/<table_name>/
+    and recorded in the manifest (el_checkpoint.PageManifest) once complete.
+    A failed page only loses its own rows: the next run with the same query
+    and start date resumes from the first incomplete page, also after a
+    restart of the container. When all pages are done the parts are merged
+    into the output of the table (el_sinks.merge_parquet_parts()), which
+    replaces the sink type, and the checkpoint is removed.
+
+    A page that times out with adaptive pages is split, as in
+    fetch_data_to_parquet(); its part is discarded first.
+
+    With 'lookback_days' in the date_range, completed pages that may have
+    missed rows back-dated since they were extracted are extracted again on
+    resume (see el_checkpoint.PageManifest.expire_pages()).
+
+    Args:
+        See fetch_data_to_parquet(); dataset already carries its window.
+
+    Returns:
+        int: Number of rows written.
+    """
+    manifest = el_checkpoint.PageManifest(checkpoint_dir=checkpoint_dir,
+                                          table_name=table_name,
+                                          sql_query=sql_query,
+                                          start_date=date_range['start_date'])
+    resume_date, days_per_page = manifest.resume(lookback_days=date_range.get('lookback_days'))
+    pager = date_pager(date_range, start_date=resume_date, days_per_page=days_per_page)
+
+    retry = retry or el_throttle.RetryPolicy(max_retries=MAX_RETRIES, base_delay=RETRY_DELAY)
+    if pager.adaptive:
+        retry = retry.without_timeouts()
+
+    columns = schema_cache and schema_cache.columns(
+        conn_sql, sql_query, (date_range['start_date'], date_range['end_date']))
+    described = True
+
+    while not pager.done:
+        page_start_date, page_end_date = pager.next_page()
+        part = manifest.part_name()
+        try:
+            with el_sinks.ParquetWriterSink(table_name=part,
+                                            data_dir=manifest.dir,
+                                            temp_dir=temp_dir,
+                                            write_options=write_options) as sink:
+                batches = fetch_data_batches(
+                    conn_sql=conn_sql,
+                    sql_query=sql_query,
+                    batch_size=batch_size,
+                    throttle=throttle,
+                    retry=retry,
+                    start_date=page_start_date,
+                    end_date=page_end_date
+                )
+                stream_batches_to_sink(sink=sink, batches=batches, columns=columns)
+        except Exception as e:
+            if pager.adaptive and el_throttle.is_timeout_error(e) and pager.can_split():
+                recover_connection(conn_sql)
+                pager.split()
+                continue
+            logger.error(f"Page {page_start_date} - {page_end_date} of {table_name} failed, "
+                         f"{len(manifest.pages)} completed pages are kept in {manifest.dir}: {e}")
+            raise
+
+        described = described and sink.described
+        pager.record(rows=sink.rows_written, nbytes=sink.bytes_written)
+        manifest.add_page(start_date=page_start_date,
+                          end_date=page_end_date,
+                          part=part,
+                          rows=sink.rows_written,
+                          nbytes=sink.bytes_written,
+                          next_days_per_page=pager.days)
+
+    if columns and not described:
+        schema_cache.invalidate(sql_query)
+
+    rows = el_sinks.merge_parquet_parts(part_paths=manifest.part_paths(),
+                                        table_name=table_name,
+                                        data_dir=data_dir,
+                                        temp_dir=temp_dir,
+                                        dataset=dataset,
+                                        write_options=write_options)
+    logger.info(f"Successfully exported {table_name} to {data_dir} from {len(manifest.pages)} pages.")
+    manifest.clear()
+    return rows
 
 
 def fetch_static_data_to_parquet(
@@ -131,120 +296,206 @@ def fetch_static_data_to_parquet(
         sql_query: str,
         table_name: str,
         data_dir: str,
-        temp_dir
-        ) -> None:
+        temp_dir,
+        batch_size: int = FETCH_BATCH_SIZE,
+        sink_type: str = 'parquet',
+        throttle: el_throttle.ThrottlePolicy = None,
+        retry: el_throttle.RetryPolicy = None,
+        dataset: dict = None,
+        write_options: dict = None,
+        params: tuple = None,
+        schema_cache: el_schema.SchemaCache = None,
+        loader=None
+        ) -> int:
     """
-    Extracts data from SQL Server, loads it into DuckDB, and exports to Parquet.
+    Extracts data from SQL Server and writes it to Parquet through a sink.
     
     Args:
         conn_sql (Connection): Connection to SQL Server.
         sql_query (str): SQL query with placeholders for date range.
         table_name (str): Name of the target table.
-    """
-    temp_db = os.path.join(temp_dir, f"{table_name}.duckdb")
+        batch_size (int): Number of rows fetched and converted at once.
+        sink_type (str): 'parquet' writes the file directly, 'duckdb' stages
+            the data in a temporary DuckDB database first, 'postgres' streams
+            it into the warehouse through the loader.
+        throttle (ThrottlePolicy): Pause after each query, see fetch_data_batches().
+        retry (RetryPolicy): Retries of transient errors, see fetch_data_batches().
+        dataset (dict): Writes into a partitioned dataset, see el_sinks.create_sink().
+            All earlier files of the table in the dataset are replaced.
+        write_options (dict): Parquet write options, see el_sinks.create_sink().
+        params (tuple): Parameters of the query, e.g. of a slice (see
+            DatabaseTablesExtractor.create_parquet_sliced()).
+        schema_cache (SchemaCache): Exact column types, see fetch_data_to_parquet().
+        loader (ParquetPostgresLoader): Loader of the 'postgres' sink.
 
-    if os.path.exists(temp_db):
-        os.remove(temp_db)  # Remove temp database if it exists
-        logger.info(f"Deleted pre-existing temp database: {temp_db}")
+    Returns:
+        int: Number of rows written.
+    """
+    with el_sinks.create_sink(sink_type=sink_type,
+                              table_name=table_name,
+                              data_dir=data_dir,
+                              temp_dir=temp_dir,
+                              dataset=dataset,
+                              write_options=write_options,
+                              loader=loader) as sink:
 
-    # Connect to DuckDB
-    with duckdb.connect(database=temp_db) as duck_conn:
-        # Drop table if exists and recreate
-        duck_conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+        columns = schema_cache and schema_cache.columns(conn_sql, sql_query, params)
 
-        headers, data_types, page_data = fetch_data_chunk(
+        batches = fetch_data_batches(
             conn_sql=conn_sql,
-            sql_query=sql_query
+            sql_query=sql_query,
+            batch_size=batch_size,
+            throttle=throttle,
+            retry=retry,
+            params=params
             )
 
-        create_table_from_cursor_mapping(
-            duck_conn=duck_conn,
-            table_name=table_name,
-            headers=headers,
-            data_types=data_types,
-            sql_dtypes=MSSQL_TO_DUCKDB_MAP
-        )
-                
-        arrow_table = data_chunk_to_pyarrow(
-            headers=headers,
-            data=page_data
-            )
-                
-        insert_arrow_to_duckdb(
-            duck_conn=duck_conn,
-            table_name=table_name,
-            arrow_table=arrow_table
-            )
-        
-        # Export final table to Parquet
-        export_to_parquet(
-            duck_conn=duck_conn,
-            table_name=table_name,
-            output_path=data_dir)
-     
-        logger.info(f"Successfully exported {table_name} to {data_dir}.")
+        stream_batches_to_sink(sink=sink, batches=batches, columns=columns)
+
+    if columns and not sink.described:
+        schema_cache.invalidate(sql_query)
 
-        if os.path.isfile(temp_db):
-            os.remove(temp_db)
-            logger.info(f"Deleted file: {temp_db}")
+    logger.info(f"Successfully exported {table_name} to {data_dir}.")
+    return sink.rows_written
 
 
+def recover_connection(conn_sql: Connection) -> None:
+    """
+    Reopens a dead connection before a retry.
 
-def fetch_data_chunk(conn_sql: Connection,
-                     sql_query:str,
-                     time_pause: int = 5,
-                     max_retries: int = MAX_RETRIES,
-                     retry_delay: int = RETRY_DELAY,
-                     start_date: str = None,
-                     end_date: str = None,
-                     ) -> Tuple[list, list]:
+    Only connection objects that can reconnect (MssqlConnection) are
+    recovered; for a plain pymssql connection this does nothing.
+    """
+    if not hasattr(conn_sql, 'reconnect') or conn_sql.is_alive():
+        return
+    logger.warning("The SQL Server connection is dead, reconnecting")
+    conn_sql.reconnect()
+
+
+def fetch_data_batches(conn_sql: Connection,
+                       sql_query: str,
+                       batch_size: int = FETCH_BATCH_SIZE,
+                       throttle: el_throttle.ThrottlePolicy = None,
+                       retry: el_throttle.RetryPolicy = None,
+                       start_date: str = None,
+                       end_date: str = None,
+                       params: tuple = None,
+                       ) -> Iterator[Tuple[list, list, list]]:
     """
-    Fetches a chunk of data from SQL Server, including column names and data types.
+    Streams the result of a query from SQL Server in batches of rows.
+
+    The first item is always yielded, even for an empty result, so the caller
+    gets the column description before any data. Retries only cover the
+    execution of the query; once rows have been handed out, an error is raised
+    to the caller, because the batches may already have been written. Only
+    transient errors are retried, and a dead connection is reopened first.
+
+    Under a memory budget (el_memory.governor) the batches after the first
+    are made smaller if batch_size rows would not fit, and every fetch waits
+    while the process is above the high watermark of the budget.
 
     Args:
         conn_sql: Active SQL Server connection.
         sql_query (str): The SQL query with placeholders for the date range.
+        batch_size (int): Maximum number of rows per batch (cursor.fetchmany).
+        throttle (ThrottlePolicy): Pause after the query, adaptive by default.
+        retry (RetryPolicy): Retries of transient errors, by default
+            MAX_RETRIES attempts with a backoff starting at RETRY_DELAY. With
+            retry_timeouts off, a timeout is raised to the caller (which splits
+            the page) without being logged as an error.
         start_date (str): Start date for filtering or None for static table.
         end_date (str): End date for filtering or None for static table.
+        params (tuple): Other query parameters, used instead of the date range.
 
-    Returns:
-        tuple: (headers, data_types, page_data)
+    Yields:
+        tuple: (headers, data_types, rows)
             - headers (list): Column names from the query result.
             - data_types (list): Corresponding SQL Server data types.
-            - page_data (list of tuples): Retrieved data rows.
+            - rows (list of tuples): Next batch of at most batch_size rows.
     """
-    for attempt in range(1, max_retries + 1):
-        try:
-            with conn_sql.cursor() as cursor:
-                if start_date is None and end_date is None:
-                    cursor.execute(sql_query)
-                    logger.info(f'Fetching data from compleate')
-                else:    
-                    cursor.execute(sql_query, (start_date, end_date))
-                    logger.info(f'Fetching data from {start_date} to {end_date}')
-
-                # Extract headers and SQL data types
-                headers = [col[0] for col in cursor.description]  
-                data_types = [col[1] for col in cursor.description]
+    throttle = throttle or el_throttle.ThrottlePolicy()
+    retry = retry or el_throttle.RetryPolicy(max_retries=MAX_RETRIES, base_delay=RETRY_DELAY)
 
-                logger.info(f'headers: \n {headers} \n \n data_types: \n {data_types }')
-                page_data = cursor.fetchall()
-
-                logger.info(f'\n \n Start pause {time_pause} sek. \n')
-                time.sleep(time_pause)
-
-            return headers, data_types, page_data
+    attempt = 1
+    while True:
+        cursor = None
+        query_start = time.perf_counter()
+        try:
+            cursor = conn_sql.cursor()
+            if params is not None:
+                cursor.execute(sql_query, params)
+                logger.info(f'Fetching data with parameters {params}', extra=throttled(('fetch_query', id(conn_sql))))
+            elif start_date is None and end_date is None:
+                cursor.execute(sql_query)
+                logger.info('Fetching data for the complete table', extra=throttled(('fetch_query', id(conn_sql))))
+            else:    
+                cursor.execute(sql_query, (start_date, end_date))
+                logger.info(f'Fetching data from {start_date} to {end_date}',
+                            extra=throttled(('fetch_query', id(conn_sql))))
+
+            # Extract headers and SQL data types
+            headers = [col[0] for col in cursor.description]  
+            data_types = [col[1] for col in cursor.description]
+
+            # The same columns come back for every page of a query, they are logged once a while
+            logger.debug(f'Columns: {list(zip(headers, data_types))}',
+                         extra=throttled(('columns', tuple(headers))))
+            rows = cursor.fetchmany(batch_size)
+            break
 
         except Exception as e:
-            logger.error(f"Error fetching data chunk: {e}")
-            if attempt == max_retries:
-                logger.error("All retry attempts failed.", exc_info=True)
+            if cursor is not None:
+                cursor.close()
+            if not retry.should_retry(e, attempt):
+                if not retry.retry_timeouts and el_throttle.is_timeout_error(e):
+                    # The caller splits the page and tries again, it logs if it cannot
+                    logger.debug(f"Query timed out, left to the caller: {e}")
+                elif el_throttle.is_transient_error(e):
+                    logger.error(f"Error fetching data chunk: {e}")
+                    logger.error("All retry attempts failed.", exc_info=True)
+                else:
+                    logger.error(f"Error fetching data chunk: {e}")
+                    logger.error("Error is not transient, not retrying.", exc_info=True)
                 raise  # re-raise the last exception
-            else:
-                logger.warning(f"Retrying after {retry_delay}s (attempt {attempt}/{max_retries})...")
-                time.sleep(retry_delay)
-                retry_delay = retry_delay * 2
-            
+
+            delay = retry.delay(attempt)
+            logger.warning(f"Error fetching data chunk: {e}")
+            logger.warning(f"Retrying after {delay:.0f}s (attempt {attempt}/{retry.max_retries})...")
+            time.sleep(delay)
+            recover_connection(conn_sql)
+            attempt += 1
+
+    # Time spent waiting for the server, without the time the caller spends on the batches
+    response_seconds = time.perf_counter() - query_start
+    rows_count = len(rows)
+    el_metrics.run_report.record(el_metrics.STAGE_QUERY, wall_seconds=response_seconds, rows=rows_count)
+    fetch_size = el_memory.governor.fetch_batch_rows(el_memory.python_row_bytes(rows), batch_size)
+    if fetch_size < batch_size:
+        logger.info(f'Fetching batches of {fetch_size} rows to stay within the memory budget',
+                    extra=throttled(('fetch_size', id(conn_sql))))
+    try:
+        with el_memory.governor.fetching():
+            yield headers, data_types, rows
+
+            requested = batch_size
+            while len(rows) == requested:
+                el_memory.governor.wait_for_memory()
+                requested = fetch_size
+                with el_metrics.stage(el_metrics.STAGE_FETCH) as timer:
+                    fetch_start = time.perf_counter()
+                    rows = cursor.fetchmany(requested)
+                    response_seconds += time.perf_counter() - fetch_start
+                    timer.add(rows=len(rows))
+                if not rows:
+                    break
+                rows_count += len(rows)
+                yield headers, data_types, rows
+    finally:
+        cursor.close()
+
+    logger.info(f'Fetched {rows_count} rows in batches of {fetch_size}',
+                extra=throttled(('fetched', id(conn_sql)), rows=rows_count))
+    throttle.wait(response_seconds)
 
 
 def data_chunk_to_pyarrow(headers: list, data: list
@@ -262,6 +513,52 @@ def data_chunk_to_pyarrow(headers: list, data: list
     return arrow_table
 
 
+def stream_batches_to_sink(
+        sink: 'el_sinks.BatchSink',
+        batches: Iterator[Tuple[list, list, list]],
+        columns: list = None) -> int:
+    """
+    Converts batches from fetch_data_batches() to Arrow and writes them to a sink.
+
+    Only one batch of rows is held in memory at once, so peak memory depends
+    on the batch size and not on the size of the table. The sink is opened
+    with the cursor description of the first batch if it is not open yet.
+
+    Args:
+        sink (el_sinks.BatchSink): Destination of the record batches.
+        batches (Iterator): Batches yielded by fetch_data_batches().
+        columns (list): Columns described by el_schema.describe_result_set().
+            When they match the cursor description they give the exact types.
+
+    Returns:
+        int: Number of rows written.
+    """
+    rows_written = 0
+    for headers, data_types, rows in batches:
+        if sink.schema is None:
+            schema = None
+            if columns:
+                schema = el_schema.described_arrow_schema(columns, headers, data_types)
+                if schema is None:
+                    logger.warning(f"Described columns do not match the result of '{sink.table_name}', "
+                                   f"using the cursor types")
+            sink.open(headers=headers, data_types=data_types, schema=schema, sample=rows)
+
+        if not rows:
+            continue
+
+        with el_metrics.stage(el_metrics.STAGE_CONVERT) as timer:
+            record_batch = el_arrow.rows_to_record_batch(rows=rows, schema=sink.schema, encoders=sink.encoders)
+            timer.add(rows=record_batch.num_rows, nbytes=record_batch.nbytes)
+        with el_metrics.stage(el_metrics.STAGE_WRITE) as timer:
+            sink.write_batch(record_batch)
+            timer.add(rows=record_batch.num_rows, nbytes=record_batch.nbytes)
+        rows_written += record_batch.num_rows
+
+    logger.info(f"Streamed {rows_written} rows into '{sink.table_name}'.")
+    return rows_written
+
+
 def create_table_from_cursor_mapping(
         duck_conn: DuckDBPyConnection,
         table_name: str,
@@ -294,23 +591,46 @@ def create_table_from_cursor_mapping(
         );
     """
     
-    # Print the final SQL statement for debugging
-    logger.info(f"\n Executing CREATE TABLE statement:\n{create_table_query}\n")
+    # Log the statement once a while, it is the same for every chunk of a table
+    logger.debug(f"Executing CREATE TABLE statement: {' '.join(create_table_query.split())}",
+                 extra=throttled(('create_table', table_name)))
 
     # Execute the query in DuckDB
     duck_conn.execute(create_table_query)
 
 
+def create_table_from_arrow_schema(
+        duck_conn: DuckDBPyConnection,
+        table_name: str,
+        schema: pa.Schema) -> None:
+    """
+    Creates a DuckDB table with the columns of an Arrow schema, e.g. one from el_schema.
+
+    DuckDB maps the Arrow types itself, so decimals keep their precision and
+    scale and integers their width. Dictionary strings become VARCHAR, DuckDB
+    compresses them in storage itself.
+
+    Args:
+        duck_conn (DuckDBPyConnection): DuckDB connection object.
+        table_name (str): Name of the table.
+        schema (pa.Schema): Columns of the table.
+    """
+    duck_conn.register("arrow_schema_table", schema.empty_table())
+    duck_conn.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM arrow_schema_table')
+    duck_conn.unregister("arrow_schema_table")
+    logger.info(f"Created table '{table_name}' with columns {[(f.name, str(f.type)) for f in schema]}")
+
+
 def insert_arrow_to_duckdb(duck_conn: DuckDBPyConnection,
                          table_name: str,
-                         arrow_table: pa.Table) -> None:
+                         arrow_table: pa.Table | pa.RecordBatch) -> None:
     """
     Efficiently loads a PyArrow Table directly into a DuckDB table.
 
     Args:
         duck_conn (duckdb.DuckDBPyConnection): Active DuckDB connection.
         table_name (str): The name of the target DuckDB table.
-        arrow_table (pa.Table): PyArrow Table containing the data to load.
+        arrow_table (pa.Table | pa.RecordBatch): PyArrow data to load.
     """
     # Register the PyArrow Table as a DuckDB table
     duck_conn.register("arrow_temp_table", arrow_table)
@@ -318,26 +638,82 @@ def insert_arrow_to_duckdb(duck_conn: DuckDBPyConnection,
     # Copy data from the Arrow Table to DuckDB
     duck_conn.execute(f"INSERT INTO {table_name} SELECT * FROM arrow_temp_table")
 
+    # Release the reference so the batch can be freed before the next one
+    duck_conn.unregister("arrow_temp_table")
+
     logger.info(f"Successfully loaded data into '{table_name}' from PyArrow Table.")
 
 
 def export_to_parquet(
         duck_conn: DuckDBPyConnection,
         table_name: str,
-        output_path: str) -> None:
+        output_path: str,
+        kv_metadata: dict = None,
+        partition_by: list = None,
+        date_column: str = None,
+        file_prefix: str = None,
+        write_options: dict = None) -> int:
     """
     Exports a DuckDB table to a Parquet file.
 
+    With partition_by the table is written as a Hive-partitioned dataset into
+    output_path instead, partitioned by those columns and, with date_column,
+    by the year and month of that column. Existing files of other tables in
+    the dataset are kept.
+
     Args:
         duck_conn (DuckDBPyConnection): DuckDB connection object.
         table_name (str): Name of the table to be exported.
         output_path (str): Path where the Parquet file will be stored.
+        kv_metadata (dict): Optional key-value metadata written to the Parquet footer.
+        partition_by (list): Partition columns of a partitioned dataset.
+        date_column (str): Date column partitioned by year and month.
+        file_prefix (str): Name of the dataset files, by default the table name.
+        write_options (dict): Compression, row group size and sort order, see
+            el_sinks.create_sink(). DuckDB chooses the dictionary encoding itself,
+            'use_dictionary' is ignored.
+
+    Returns:
+        int: Number of rows exported.
     """
-    duck_conn.execute(
+    write_options = write_options or {}
+    options = ['FORMAT PARQUET']
+    if write_options.get('compression'):
+        options.append(f"COMPRESSION '{write_options['compression']}'")
+    if write_options.get('compression_level') is not None:
+        options.append(f"COMPRESSION_LEVEL {int(write_options['compression_level'])}")
+    if write_options.get('row_group_size'):
+        options.append(f"ROW_GROUP_SIZE {int(write_options['row_group_size'])}")
+    if kv_metadata:
+        kv_pairs = ', '.join(f"{key}: '{value.replace(chr(39), chr(39) * 2)}'" for key, value in kv_metadata.items())
+        options.append(f"KV_METADATA {{{kv_pairs}}}")
+
+    columns = '*'
+    if partition_by and date_column:
+        columns += (f', year("{date_column}") AS {el_sinks.DATASET_YEAR}'
+                    f', month("{date_column}") AS {el_sinks.DATASET_MONTH}')
+    order_by = ''
+    if write_options.get('sort_by'):
+        order_by = ' ORDER BY ' + ', '.join(f'"{column}"' for column in write_options['sort_by'])
+    source = f"(SELECT {columns} FROM {table_name}{order_by})"
+
+    if not partition_by:
+        target = f"{output_path}/{table_name}.parquet"
+    else:
+        columns = [f'"{column}"' for column in partition_by]
+        if date_column:
+            columns += [el_sinks.DATASET_YEAR, el_sinks.DATASET_MONTH]
+        target = output_path
+        options += [f"PARTITION_BY ({', '.join(columns)})",
+                    "OVERWRITE_OR_IGNORE",
+                    f"FILENAME_PATTERN '{file_prefix or table_name}-{{i}}'"]
+
+    rows = duck_conn.execute(
         f"""--sql
-        COPY {table_name} 
-        TO '{output_path}/{table_name}.parquet' 
-        (FORMAT PARQUET);
+        COPY {source} 
+        TO '{target}' 
+        ({', '.join(options)});
         """
-        )
+        ).fetchone()[0]
     logger.info(f"Table {table_name} exported to {output_path}")
+    return rows
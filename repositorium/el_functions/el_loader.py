@@ -0,0 +1,801 @@
+import glob
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import duckdb
+from duckdb import DuckDBPyConnection
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List, Tuple
+from repositorium.logger import logger
+from repositorium.el_functions.el_sinks import BatchSink, ParquetWriterSink, FINGERPRINT_KEY, DATASET_YEAR, DATASET_MONTH
+from repositorium.el_functions.el_state import JsonStateStore
+from repositorium.el_functions import el_memory, el_metrics, el_reconcile
+
+
+def arrow_type_to_postgres(arrow_type: pa.DataType) -> str:
+    """
+    Maps an Arrow type from the Parquet schema to a Postgres column type.
+
+    The types match what DuckDB creates in an attached Postgres database
+    for the same Parquet columns.
+
+    Args:
+        arrow_type (pa.DataType): Arrow type of the column.
+
+    Returns:
+        str: Postgres column type.
+    """
+    if pa.types.is_dictionary(arrow_type):
+        return arrow_type_to_postgres(arrow_type.value_type)
+    if pa.types.is_decimal(arrow_type):
+        return f"NUMERIC({arrow_type.precision},{arrow_type.scale})"
+    if pa.types.is_timestamp(arrow_type):
+        return "TIMESTAMPTZ" if arrow_type.tz else "TIMESTAMP"
+    if pa.types.is_date(arrow_type):
+        return "DATE"
+    if pa.types.is_time(arrow_type):
+        return "TIME"
+    if pa.types.is_boolean(arrow_type):
+        return "BOOLEAN"
+    if pa.types.is_int8(arrow_type) or pa.types.is_int16(arrow_type) or pa.types.is_uint8(arrow_type):
+        return "SMALLINT"
+    if pa.types.is_int32(arrow_type) or pa.types.is_uint16(arrow_type):
+        return "INTEGER"
+    if pa.types.is_int64(arrow_type) or pa.types.is_uint32(arrow_type):
+        return "BIGINT"
+    if pa.types.is_uint64(arrow_type):
+        return "NUMERIC(20,0)"
+    if pa.types.is_float32(arrow_type):
+        return "REAL"
+    if pa.types.is_floating(arrow_type):
+        return "DOUBLE PRECISION"
+    if pa.types.is_binary(arrow_type) or pa.types.is_large_binary(arrow_type):
+        return "BYTEA"
+    return "VARCHAR"  # Default to VARCHAR
+
+
+def postgres_columns_from_schema(schema: pa.Schema) -> str:
+    """Builds the column list of a CREATE TABLE statement from an Arrow schema."""
+    return ', '.join(
+        f'"{field.name}" {arrow_type_to_postgres(field.type)}' for field in schema
+        )
+
+
+def sql_literal(value: str) -> str:
+    """Quotes a string as a SQL literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+# Views on a table, directly or through other views, with what it takes to create them again.
+# A view depends on the tables it reads through its rewrite rule (pg_rewrite).
+DEPENDENT_VIEWS_QUERY = """
+    WITH RECURSIVE dependents(oid, depth) AS (
+        SELECT rw.ev_class, 1
+        FROM pg_depend d
+        JOIN pg_rewrite rw ON rw.oid = d.objid
+        WHERE d.classid = 'pg_rewrite'::regclass
+          AND d.refclassid = 'pg_class'::regclass
+          AND d.refobjid = to_regclass({table})
+          AND rw.ev_class <> d.refobjid
+        UNION
+        SELECT rw.ev_class, dependents.depth + 1
+        FROM dependents
+        JOIN pg_depend d ON d.refobjid = dependents.oid AND d.refclassid = 'pg_class'::regclass
+        JOIN pg_rewrite rw ON rw.oid = d.objid
+        WHERE d.classid = 'pg_rewrite'::regclass
+          AND rw.ev_class <> d.refobjid
+    )
+    SELECT format('%I.%I', n.nspname, c.relname) AS name,
+           c.relkind::text AS kind,
+           pg_get_viewdef(c.oid) AS definition,
+           coalesce(array_to_string(c.reloptions, ', '), '') AS options,
+           coalesce((SELECT string_agg(format('GRANT %s ON %I.%I TO %s;', a.privilege_type, n.nspname, c.relname,
+                                              CASE WHEN a.grantee = 0 THEN 'PUBLIC'
+                                                   ELSE quote_ident(pg_get_userbyid(a.grantee)) END), ' ')
+                     FROM aclexplode(c.relacl) a), '') AS grants,
+           coalesce(format('COMMENT ON VIEW %I.%I IS %L;', n.nspname, c.relname,
+                           obj_description(c.oid, 'pg_class')), '') AS comment
+    FROM dependents
+    JOIN pg_class c ON c.oid = dependents.oid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    GROUP BY c.oid, n.nspname, c.relname, c.relkind, c.reloptions, c.relacl
+    ORDER BY max(dependents.depth), 1
+"""
+
+
+class ParquetPostgresLoader:
+    """Loads Parquet files into Postgres through DuckDB's attached Postgres database.
+
+    The target table is created from the Parquet footer, so the data is read
+    only once, by the COPY. Several files can be loaded at the same time,
+    each load using its own DuckDB connection with Postgres attached. The
+    connections are kept open between loads until close(), so a long-running
+    worker attaches Postgres once; a connection idle for more than
+    health_check_interval seconds is checked before it is reused.
+
+    In staged mode a full load goes into an UNLOGGED <table>__staging table.
+    The configured indexes are built after the copy, the table is analyzed,
+    and then it replaces the live table by rename in one transaction. The live
+    table stays readable for the whole load and is left untouched if the load
+    fails. Unlogged tables are emptied by Postgres after a crash; set_logged
+    turns the staging table into a regular one before the swap.
+
+    Nothing is dropped with CASCADE. Views on a replaced table are dropped
+    and created again, with their grants and comments, in the transaction
+    that replaces it. Other dependents (materialized views, foreign keys)
+    make the load fail and leave the live table as it was.
+
+    With a fingerprint store, a file whose fingerprint (written to the footer
+    by the extraction sink) matches the last successful load of its table is
+    skipped, unless force is set.
+
+    With reconcile, a file or stream that carries reconciliation statistics
+    (see el_reconcile) is compared with one aggregate query on the loaded rows
+    before they replace the live data: the staging table, or the window inside
+    its transaction. A mismatch fails the load and keeps the live table.
+
+    stream_sink() gives a sink that loads the record batches of an extraction
+    straight into Postgres, with the same staging and swap, without a
+    Parquet file in between (see PostgresStreamSink); archive_files makes it
+    write the Parquet file as well.
+    """
+
+    def __init__(self,
+                 attach_string: str,
+                 db_alias: str = 'st_db',
+                 pg_schema: str = 'public',
+                 max_workers: int = 1,
+                 staged: bool = True,
+                 indexes: dict = None,
+                 set_logged: bool = False,
+                 fingerprints: JsonStateStore = None,
+                 force: bool = False,
+                 health_check_interval: float = 60,
+                 archive_files: bool = False,
+                 reconcile: bool = False):
+        self.attach_string = attach_string
+        self.db_alias = db_alias
+        self.pg_schema = pg_schema
+        self.max_workers = max_workers
+        self.staged = staged
+        self.indexes = indexes or {}  # table name -> list of column lists
+        self.set_logged = set_logged
+        self.fingerprints = fingerprints
+        self.force = force
+        self.health_check_interval = health_check_interval
+        self.archive_files = archive_files  # stream sinks also write the Parquet file
+        self.reconcile = reconcile  # compare the loaded rows with the extracted statistics
+        self._idle = []  # (connection, time it was returned)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> DuckDBPyConnection:
+        conn = duckdb.connect(':memory:')
+        el_memory.governor.configure_duckdb(conn)
+        conn.execute(self.attach_string)
+        logger.info(f'The db {self.db_alias} has been attached')
+        return conn
+
+    def is_alive(self, conn: DuckDBPyConnection) -> bool:
+        """Checks the attached database with a trivial statement."""
+        try:
+            self.postgres_execute(conn, "SELECT 1")
+            return True
+        except Exception as e:
+            logger.warning(f"Connection to {self.db_alias} is not usable: {e}")
+            return False
+
+    def acquire(self) -> DuckDBPyConnection:
+        """
+        Takes a DuckDB connection with Postgres attached, to be given back with release().
+
+        An idle connection is reused, after a health check if it has been idle
+        for longer than health_check_interval; otherwise a new one is attached.
+        """
+        conn = None
+        with self._lock:
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+        if conn is not None and time.monotonic() - idle_since > self.health_check_interval:
+            if not self.is_alive(conn):
+                conn.close()
+                conn = None
+        if conn is None:
+            conn = self._connect()
+        return conn
+
+    def release(self, conn: DuckDBPyConnection, check: bool = False) -> None:
+        """Gives a connection back for reuse; with check, only if it still works."""
+        if check and not self.is_alive(conn):
+            conn.close()
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Lends a DuckDB connection with Postgres attached for the duration of the block."""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            # The statement may have broken the connection, check it before reuse
+            self.release(conn, check=True)
+            raise
+        self.release(conn)
+
+    def close(self) -> None:
+        """Closes all connections opened by the loader."""
+        with self._lock:
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def postgres_execute(self, conn: DuckDBPyConnection, sql: str) -> None:
+        """
+        Runs statements directly on Postgres and refreshes DuckDB's catalog cache.
+
+        The postgres extension sends the statements in one query, after a
+        BEGIN TRANSACTION of its own, on the connection of the attached
+        database. They are committed together or, if one fails, rolled back
+        together, and the connection stays usable.
+        """
+        conn.execute(f"CALL postgres_execute({sql_literal(self.db_alias)}, {sql_literal(sql)})")
+        conn.execute("CALL pg_clear_cache()")
+
+    @staticmethod
+    def table_name_of(file_path: str) -> str:
+        """Default target table of a file: its name without extension."""
+        return os.path.splitext(os.path.basename(file_path))[0]
+
+    def qualified_name(self, table_name: str) -> str:
+        """Name of the table on the Postgres side."""
+        return f'"{self.pg_schema}"."{table_name}"'
+
+    def dependent_views(self, conn: DuckDBPyConnection, table_name: str) -> list:
+        """
+        Views that depend on a table, directly or through other views, in the order they can be created.
+
+        Returns:
+            list: One dict per view with 'name' (qualified), 'kind' ('v' for a
+                view, 'm' for a materialized view), 'definition', 'options',
+                'grants' and 'comment'.
+
+        Raises:
+            RuntimeError: A dependent cannot be created again by the loader
+                (a materialized view).
+        """
+        query = DEPENDENT_VIEWS_QUERY.format(table=sql_literal(self.qualified_name(table_name)))
+        relation = conn.execute(f"SELECT * FROM postgres_query({sql_literal(self.db_alias)}, {sql_literal(query)})")
+        names = [column[0] for column in relation.description]
+        views = [dict(zip(names, row)) for row in relation.fetchall()]
+        others = [view['name'] for view in views if view['kind'] != 'v']
+        if others:
+            raise RuntimeError(f"{table_name} cannot be replaced, these objects depend on it: {others}")
+        return views
+
+    @staticmethod
+    def drop_views_statements(views: list) -> list:
+        """Statements dropping the dependent views, dependents first."""
+        return [f"DROP VIEW {view['name']};" for view in reversed(views)]
+
+    @staticmethod
+    def create_views_statements(views: list) -> list:
+        """Statements creating the dependent views again, with their options, grants and comments."""
+        statements = []
+        for view in views:
+            options = f" WITH ({view['options']})" if view['options'] else ''
+            definition = view['definition'].strip().rstrip(';')
+            statements.append(f"CREATE VIEW {view['name']}{options} AS {definition};")
+            if view['grants']:
+                statements.append(view['grants'])
+            if view['comment']:
+                statements.append(view['comment'])
+        return statements
+
+    def create_table(self, conn: DuckDBPyConnection, table_name: str, schema: pa.Schema) -> None:
+        """
+        Drops and creates the Postgres table for the given Arrow schema.
+
+        The views on the table are created again on the new, empty table.
+        """
+        views = self.dependent_views(conn, table_name)
+        self.postgres_execute(conn, '\n'.join(
+            self.drop_views_statements(views)
+            + [f"DROP TABLE IF EXISTS {self.qualified_name(table_name)};",
+               f"CREATE TABLE {self.qualified_name(table_name)} ({postgres_columns_from_schema(schema)});"]
+            + self.create_views_statements(views)
+            ))
+
+    @staticmethod
+    def staging_name(table_name: str) -> str:
+        return f"{table_name}__staging"
+
+    def create_staging_table(self, conn: DuckDBPyConnection, table_name: str, schema: pa.Schema) -> str:
+        """Creates an empty UNLOGGED staging table for table_name and returns its name."""
+        staging = self.staging_name(table_name)
+        self.postgres_execute(conn, f"""
+            DROP TABLE IF EXISTS {self.qualified_name(staging)};
+            CREATE UNLOGGED TABLE {self.qualified_name(staging)} ({postgres_columns_from_schema(schema)});
+        """)
+        return staging
+
+    def swap_staging_table(self, conn: DuckDBPyConnection, table_name: str) -> None:
+        """
+        Indexes and analyzes the staging table of table_name and swaps it with the live table.
+
+        The swap renames both tables and drops the old one in one
+        postgres_execute() call, so in one transaction. The views on the live
+        table are dropped before and created again on the new table after the
+        rename, in the same transaction. If anything else depends on the live
+        table, the drop fails and the transaction is rolled back.
+        """
+        staging = self.staging_name(table_name)
+        old = f"{table_name}__old"
+        statements = []
+
+        for i, columns in enumerate(self.indexes.get(table_name, [])):
+            column_list = ', '.join(f'"{column}"' for column in columns)
+            statements.append(
+                f'CREATE INDEX "{staging}_idx{i}" ON {self.qualified_name(staging)} ({column_list});'
+                )
+        if self.set_logged:
+            statements.append(f"ALTER TABLE {self.qualified_name(staging)} SET LOGGED;")
+        statements.append(f"ANALYZE {self.qualified_name(staging)};")
+        self.postgres_execute(conn, '\n'.join(statements))
+
+        views = self.dependent_views(conn, table_name)
+        swap = [
+            f"DROP TABLE IF EXISTS {self.qualified_name(old)};",
+            *self.drop_views_statements(views),
+            f'ALTER TABLE IF EXISTS {self.qualified_name(table_name)} RENAME TO "{old}";',
+            f'ALTER TABLE {self.qualified_name(staging)} RENAME TO "{table_name}";',
+            f"DROP TABLE IF EXISTS {self.qualified_name(old)};",
+            *self.create_views_statements(views),
+        ]
+        for i, _ in enumerate(self.indexes.get(table_name, [])):
+            swap.append(f'ALTER INDEX "{self.pg_schema}"."{staging}_idx{i}" RENAME TO "{table_name}_idx{i}";')
+        self.postgres_execute(conn, '\n'.join(swap))
+        logger.info(f"Swapped {staging} into {table_name}"
+                    + (f", recreated views {[view['name'] for view in views]}" if views else ''))
+
+    def replace_window(self,
+                       conn: DuckDBPyConnection,
+                       table_name: str,
+                       file_path: str,
+                       column: str,
+                       start_date: str,
+                       end_date: str,
+                       stats: dict = None) -> None:
+        """
+        Replaces the rows of a date window in an existing table with the rows of a file.
+
+        The delete and the insert run in one transaction, so readers see
+        either the old or the new window.
+
+        Args:
+            conn (DuckDBPyConnection): Connection with Postgres attached.
+            table_name (str): Existing target table.
+            file_path (str): Parquet file with the rows of the window.
+            column (str): Date column the window is defined on.
+            start_date (str): First day of the window (inclusive).
+            end_date (str): Last day of the window (inclusive).
+            stats (dict): Reconciliation statistics of the file, checked
+                against the new window before the commit.
+        """
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(f"""
+                DELETE FROM {self.db_alias}.{table_name}
+                WHERE "{column}" >= CAST(? AS DATE)
+                  AND "{column}" < CAST(? AS DATE) + INTERVAL 1 DAY;
+            """, [start_date, end_date])
+            conn.execute(f"""
+                INSERT INTO {self.db_alias}.{table_name} BY NAME
+                SELECT * FROM read_parquet(?);
+            """, [file_path])
+            if stats is not None:
+                el_reconcile.verify_table(conn, f"{self.db_alias}.{table_name}", stats,
+                                          {'column': column, 'start_date': start_date, 'end_date': end_date})
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def replace_window_from(self,
+                            conn: DuckDBPyConnection,
+                            table_name: str,
+                            source_table: str,
+                            column: str,
+                            start_date: str,
+                            end_date: str) -> None:
+        """
+        Replaces the rows of a date window in an existing table with the rows of another table, then drops it.
+
+        Same as replace_window(), for rows already in Postgres (a staging table).
+        """
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(f"""
+                DELETE FROM {self.db_alias}.{table_name}
+                WHERE "{column}" >= CAST(? AS DATE)
+                  AND "{column}" < CAST(? AS DATE) + INTERVAL 1 DAY;
+            """, [start_date, end_date])
+            conn.execute(f"""
+                INSERT INTO {self.db_alias}.{table_name} BY NAME
+                SELECT * FROM {self.db_alias}.{source_table};
+            """)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.postgres_execute(conn, f"DROP TABLE {self.qualified_name(source_table)};")
+
+    def stream_sink(self,
+                    table_name: str,
+                    data_dir: str,
+                    temp_dir: str,
+                    write_options: dict = None,
+                    delta_window: dict = None) -> 'PostgresStreamSink':
+        """Sink loading the batches of an extraction straight into table_name, see PostgresStreamSink."""
+        return PostgresStreamSink(table_name=table_name,
+                                  data_dir=data_dir,
+                                  temp_dir=temp_dir,
+                                  write_options=write_options,
+                                  loader=self,
+                                  delta_window=delta_window)
+
+    @staticmethod
+    def load_key(metadata: pq.FileMetaData, delta_window: dict = None) -> dict:
+        """Fingerprint of a file together with the window it replaces, None if the file has no fingerprint."""
+        fingerprint = (metadata.metadata or {}).get(FINGERPRINT_KEY.encode())
+        if fingerprint is None:
+            return None
+        return {'fingerprint': fingerprint.decode(), 'delta_window': delta_window}
+
+    def verify(self, conn: DuckDBPyConnection, table_name: str, stats: dict) -> bool:
+        """Compares a loaded table with reconciliation statistics, if reconcile is on; True if it was checked."""
+        if not self.reconcile or stats is None:
+            return False
+        el_reconcile.verify_table(conn, f"{self.db_alias}.{table_name}", stats)
+        return True
+
+    def is_unchanged(self, table_name: str, load_key: dict) -> bool:
+        """True if the table was last loaded from data with the same fingerprint."""
+        if self.force or self.fingerprints is None or load_key is None:
+            return False
+        return self.fingerprints.get(table_name) == load_key
+
+    def load_file(self, file_path: str, table_name: str = None, delta_window: dict = None) -> dict:
+        """
+        Loads one Parquet file into a Postgres table of the same name.
+
+        Args:
+            file_path (str): Path to the Parquet file.
+            table_name (str): Target table, by default the file name without extension.
+            delta_window (dict): For incremental loads, the window the file covers
+                ('column', 'start_date', 'end_date'). The rows of that window are
+                replaced and the rest of the table is kept. Without it the table
+                is recreated, through a staging table in staged mode.
+
+        Returns:
+            dict: Load statistics (table, skipped, rows, bytes, seconds, rows_per_sec,
+                mb_per_sec, delta_window, reconciled).
+
+        Raises:
+            el_reconcile.ReconciliationError: The loaded rows do not match the
+                statistics in the footer; the live table is left as it was,
+                except in direct (not staged) mode.
+        """
+        table_name = table_name or self.table_name_of(file_path)
+        with self.connection() as conn:
+            start, cpu_start = time.perf_counter(), time.thread_time()
+
+            # The schema and row count come from the footer, no data is scanned
+            metadata = pq.read_metadata(file_path)
+
+            load_key = self.load_key(metadata, delta_window)
+            if self.is_unchanged(table_name, load_key):
+                logger.info(f"Skipped {table_name}: the data has not changed since the last load")
+                return {'table': table_name, 'rows': metadata.num_rows, 'skipped': True,
+                        'delta_window': delta_window}
+
+            stats = el_reconcile.stats_from_metadata(metadata) if self.reconcile else None
+            if delta_window is not None:
+                self.replace_window(conn, table_name, file_path, **delta_window, stats=stats)
+            elif self.staged:
+                staging = self.create_staging_table(conn, table_name, metadata.schema.to_arrow_schema())
+                conn.execute(f"""
+                    COPY {self.db_alias}.{staging} FROM {sql_literal(file_path)} (FORMAT PARQUET);
+                """)
+                try:
+                    self.verify(conn, staging, stats)
+                except el_reconcile.ReconciliationError:
+                    self.postgres_execute(conn, f"DROP TABLE {self.qualified_name(staging)};")
+                    raise
+                self.swap_staging_table(conn, table_name)
+            else:
+                self.create_table(conn, table_name, metadata.schema.to_arrow_schema())
+
+                conn.execute(f"""
+                    COPY {self.db_alias}.{table_name} FROM {sql_literal(file_path)} (FORMAT PARQUET);
+                """)
+                self.verify(conn, table_name, stats)
+
+            if self.fingerprints is not None and load_key is not None:
+                self.fingerprints.set(table_name, load_key)
+
+            seconds = time.perf_counter() - start
+            stats = {
+                'table': table_name,
+                'skipped': False,
+                'rows': metadata.num_rows,
+                'bytes': os.path.getsize(file_path),
+                'seconds': round(seconds, 3),
+                'delta_window': delta_window,
+                'reconciled': stats is not None,
+            }
+            stats['rows_per_sec'] = round(stats['rows'] / seconds) if seconds else None
+            stats['mb_per_sec'] = round(stats['bytes'] / 2**20 / seconds, 2) if seconds else None
+
+            el_metrics.run_report.record(el_metrics.STAGE_LOAD, wall_seconds=seconds,
+                                         cpu_seconds=time.thread_time() - cpu_start,
+                                         rows=stats['rows'], nbytes=stats['bytes'], table=table_name)
+            logger.info(f"Loaded {stats['rows']} rows ({stats['bytes'] / 2**20:.1f} MB) into {table_name} "
+                        f"in {stats['seconds']}s: {stats['rows_per_sec']} rows/s, {stats['mb_per_sec']} MB/s")
+            return stats
+
+    def load_dataset(self,
+                     dataset_path: str,
+                     partition_by: list,
+                     table_name: str = None,
+                     refresh: dict = None) -> dict:
+        """
+        Loads a Hive-partitioned Parquet dataset into one Postgres table.
+
+        The dataset is the one written by the extraction sinks in dataset mode
+        (see el_sinks.create_sink()). The partition_by columns, stored in the
+        directory names, become columns of the table; the year and month
+        partitions only serve to prune files.
+
+        Args:
+            dataset_path (str): Directory of the dataset.
+            partition_by (list): Partition columns of the dataset, e.g. ['firma'].
+            table_name (str): Target table, by default the name of the dataset directory.
+            refresh (dict): Refreshes only part of an existing table. Maps values
+                of the first partition column (e.g. a company) to the delta_window
+                to replace (see load_file()), or to None to replace all rows of
+                that value. All values are replaced in one transaction. Without
+                it the table is recreated, through a staging table in staged mode.
+
+        Returns:
+            dict: Load statistics, as load_file() returns them.
+        """
+        table_name = table_name or os.path.basename(os.path.normpath(dataset_path))
+        with self.connection() as conn:
+            start, cpu_start = time.perf_counter(), time.thread_time()
+
+            file_paths = glob.glob(os.path.join(dataset_path, '**', '*.parquet'), recursive=True)
+            if not file_paths:
+                raise FileNotFoundError(f"No Parquet files in dataset {dataset_path}")
+
+            # Partition values come from the directory names, as strings
+            schema = pq.read_schema(file_paths[0])
+            for column in partition_by:
+                schema = schema.append(pa.field(column, pa.string()))
+
+            source = f"""
+                SELECT * EXCLUDE ({DATASET_YEAR}, {DATASET_MONTH})
+                FROM read_parquet({sql_literal(os.path.join(dataset_path, '**', '*.parquet'))},
+                                  hive_partitioning = true, hive_types_autocast = false)
+            """
+
+            if refresh is not None:
+                rows = self.refresh_partitions(conn, table_name, source, partition_by[0], refresh)
+            else:
+                if self.staged:
+                    target = self.create_staging_table(conn, table_name, schema)
+                else:
+                    self.create_table(conn, table_name, schema)
+                    target = table_name
+                rows = conn.execute(f"INSERT INTO {self.db_alias}.{target} BY NAME {source};").fetchone()[0]
+                if self.staged:
+                    self.swap_staging_table(conn, table_name)
+
+            seconds = time.perf_counter() - start
+            stats = {
+                'table': table_name,
+                'skipped': False,
+                'rows': rows,
+                'bytes': sum(os.path.getsize(file_path) for file_path in file_paths),
+                'seconds': round(seconds, 3),
+                'delta_window': refresh,
+            }
+            stats['rows_per_sec'] = round(stats['rows'] / seconds) if seconds else None
+            stats['mb_per_sec'] = round(stats['bytes'] / 2**20 / seconds, 2) if seconds else None
+
+            el_metrics.run_report.record(el_metrics.STAGE_LOAD, wall_seconds=seconds,
+                                         cpu_seconds=time.thread_time() - cpu_start,
+                                         rows=stats['rows'], nbytes=stats['bytes'], table=table_name)
+            logger.info(f"Loaded {stats['rows']} rows of dataset {dataset_path} into {table_name} "
+                        f"in {stats['seconds']}s: {stats['rows_per_sec']} rows/s")
+            return stats
+
+    def refresh_partitions(self,
+                           conn: DuckDBPyConnection,
+                           table_name: str,
+                           source: str,
+                           partition_column: str,
+                           refresh: dict) -> int:
+        """
+        Replaces the rows of some partition values in an existing table, in one transaction.
+
+        Args:
+            conn (DuckDBPyConnection): Connection with Postgres attached.
+            table_name (str): Existing target table.
+            source (str): Query reading the dataset.
+            partition_column (str): Column the refresh keys are values of.
+            refresh (dict): Partition value -> delta_window or None, see load_dataset().
+
+        Returns:
+            int: Number of rows inserted.
+        """
+        rows = 0
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            for value, window in refresh.items():
+                condition, params = f'"{partition_column}" = ?', [value]
+                if window is not None:
+                    condition += f"""
+                        AND "{window['column']}" >= CAST(? AS DATE)
+                        AND "{window['column']}" < CAST(? AS DATE) + INTERVAL 1 DAY"""
+                    params += [window['start_date'], window['end_date']]
+
+                conn.execute(f"DELETE FROM {self.db_alias}.{table_name} WHERE {condition};", params)
+                rows += conn.execute(f"""
+                    INSERT INTO {self.db_alias}.{table_name} BY NAME
+                    SELECT * FROM ({source}) WHERE {condition};
+                """, params).fetchone()[0]
+                logger.info(f"Refreshed {partition_column} = {value} in {table_name}, window {window}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def load_files(self,
+                   file_paths: List[str],
+                   delta_windows: dict = None) -> Tuple[List[dict], List[str]]:
+        """
+        Loads Parquet files concurrently, at most max_workers at a time.
+
+        A failed file is logged and does not stop the others.
+
+        Args:
+            file_paths (list): Paths to the Parquet files.
+            delta_windows (dict): Optional delta_window per table name, see load_file().
+
+        Returns:
+            tuple: (stats, failed)
+                - stats (list): Load statistics of the loaded files.
+                - failed (list): Paths of the files that failed.
+        """
+        stats, failed = [], []
+        delta_windows = delta_windows or {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='load') as pool:
+            futures = {
+                pool.submit(self.load_file,
+                            file_path,
+                            delta_window=delta_windows.get(self.table_name_of(file_path))): file_path
+                for file_path in file_paths
+            }
+            for future in as_completed(futures):
+                file_path = futures[future]
+                try:
+                    stats.append(future.result())
+                except Exception as e:
+                    failed.append(file_path)
+                    logger.error(f'Error occurred while loading {file_path}: {e}', exc_info=True)
+
+        return stats, failed
+
+
+class PostgresStreamSink(BatchSink):
+    """Loads record batches into Postgres as they are extracted, without a Parquet file.
+
+    Every batch is inserted from Arrow through DuckDB's attached Postgres
+    database, which sends it with binary COPY. A full load goes into the
+    staging table and is swapped in on close, as ParquetPostgresLoader.load_file()
+    does, even when the loader is not staged: the extraction can still fail
+    after the first batches, so the live table is not touched before close.
+    With a delta_window the rows go into the staging table and replace the
+    rows of that window in one transaction on close. A failed extraction
+    drops the staging table and leaves the live table untouched. With the
+    loader's reconcile, the rows in the staging table are compared with the
+    reconciliation statistics of the batches before they go live.
+
+    The fingerprint of the batches is stored like the one of a loaded file,
+    so an unchanged table is not swapped in again. With the loader's
+    archive_files the Parquet file is written as well, but not read back.
+    """
+
+    def __init__(self,
+                 table_name: str,
+                 data_dir: str,
+                 temp_dir: str,
+                 write_options: dict = None,
+                 loader: ParquetPostgresLoader = None,
+                 delta_window: dict = None):
+        super().__init__(table_name, data_dir, temp_dir, write_options)
+        self.loader = loader
+        self.delta_window = delta_window
+        self.archive = ParquetWriterSink(table_name, data_dir, temp_dir, write_options) if loader.archive_files else None
+        self.conn = None
+        self.target = None
+
+    def open(self, headers: list, data_types: list, schema: pa.Schema = None, sample: list = None) -> None:
+        super().open(headers, data_types, schema, sample)
+        if self.delta_window is not None and not self.delta_window.get('column'):
+            raise ValueError(f"Streaming a date window of {self.table_name} needs the date column of the window")
+        if self.archive is not None:
+            self.archive.open(headers, data_types, schema, sample)
+
+        self.conn = self.loader.acquire()
+        self.target = self.loader.create_staging_table(self.conn, self.table_name, self.schema)
+
+    def _write_batch(self, batch: pa.RecordBatch) -> None:
+        if self.archive is not None:
+            self.archive.write_batch(batch)
+        self.conn.register("arrow_stream_batch", batch)
+        try:
+            self.conn.execute(f"INSERT INTO {self.loader.db_alias}.{self.target} SELECT * FROM arrow_stream_batch")
+        finally:
+            self.conn.unregister("arrow_stream_batch")
+
+    def close(self) -> None:
+        if self.conn is None:
+            logger.warning(f"No data was written for table {self.table_name}")
+            return
+        try:
+            load_key = {'fingerprint': self.fingerprint.value, 'delta_window': self.delta_window}
+            if self.loader.is_unchanged(self.table_name, load_key):
+                self.loader.postgres_execute(self.conn, f"DROP TABLE {self.loader.qualified_name(self.target)};")
+                logger.info(f"Skipped {self.table_name}: the data has not changed since the last load")
+            else:
+                self.loader.verify(self.conn, self.target,
+                                   self.reconciliation.to_dict() if self.reconciliation is not None else None)
+                if self.delta_window is not None:
+                    self.loader.replace_window_from(self.conn, self.table_name, self.target, **self.delta_window)
+                else:
+                    self.loader.swap_staging_table(self.conn, self.table_name)
+            if self.loader.fingerprints is not None:
+                self.loader.fingerprints.set(self.table_name, load_key)
+            if self.archive is not None:
+                self.archive.close()
+        except Exception:
+            self.abort()
+            raise
+        self.loader.release(self.conn)
+        self.conn = None
+        logger.info(f"Table {self.table_name} streamed into Postgres ({self.rows_written} rows)")
+
+    def abort(self) -> None:
+        if self.archive is not None:
+            self.archive.abort()
+        if self.conn is None:
+            return
+        try:
+            self.loader.postgres_execute(self.conn, f"DROP TABLE IF EXISTS {self.loader.qualified_name(self.target)};")
+        except Exception as e:
+            logger.warning(f"Could not drop {self.target}: {e}")
+        self.loader.release(self.conn, check=True)
+        self.conn = None
@@ -0,0 +1,237 @@
+import gc
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import pyarrow as pa
+from duckdb import DuckDBPyConnection
+from repositorium.logger import logger
+from repositorium.el_functions import el_metrics
+
+# Shares of the budget: DuckDB buffers, Python rows of the fetch batches and Arrow
+# buffers (row groups waiting to be written); the rest is left to the interpreter
+DUCKDB_SHARE = 0.4
+FETCH_SHARE = 0.15
+ARROW_SHARE = 0.2
+
+# Backpressure starts above HIGH_WATERMARK of the budget and ends below RESUME_WATERMARK
+HIGH_WATERMARK = 0.85
+RESUME_WATERMARK = 0.75
+
+MIN_BATCH_ROWS = 1_000  # smallest fetch batch or row group the budget can shrink to
+SAMPLE_ROWS = 100  # rows measured to estimate the size of a row
+
+
+def rss_bytes() -> int:
+    """Current resident set size of the process, None where it cannot be read."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return el_metrics.peak_rss_bytes()  # the peak is the best there is elsewhere
+
+
+def python_row_bytes(rows: list) -> int:
+    """Estimated size of one fetched row (a tuple of Python objects), from a sample of the rows."""
+    sample = rows[:SAMPLE_ROWS]
+    if not sample:
+        return 0
+    total = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample)
+    return total // len(sample)
+
+
+def parse_bytes(value: str) -> int:
+    """Parses a size such as '12g', '512MB' or '1073741824' into bytes."""
+    value = value.strip().lower().rstrip('b')
+    units = {'k': 2**10, 'm': 2**20, 'g': 2**30, 't': 2**40}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class MemoryGovernor:
+    """One memory budget for the whole worker, split between its consumers.
+
+    The budget is split by shares among the concurrent extractions and DuckDB
+    connections:
+        - fetch: rows held as Python tuples; fetch batches are shrunk so one
+          batch of every extraction fits (fetch_batch_rows()).
+        - Arrow: buffered row groups of the Parquet writers (row_group_rows()).
+        - DuckDB: memory_limit and threads of every connection, which spills
+          to a directory of its own in temp_dir (configure_duckdb()).
+
+    The fetch loop calls wait_for_memory() before every fetch. Above
+    high_watermark of the budget it frees what it can and waits until the
+    other threads bring the RSS under resume_watermark, for at most
+    max_wait_seconds, so an extraction slows down instead of being OOM killed.
+
+    Without a budget (the default) the governor does nothing.
+
+    Args:
+        budget_bytes (int): Memory the worker may use, e.g. somewhat below the
+            container limit. None or 0 disables the governor.
+        temp_dir (str): Directory DuckDB spills to.
+        extract_workers (int): Extractions (fetch loops) running at once.
+        duckdb_connections (int): DuckDB connections open at once.
+        high_watermark (float): Share of the budget that starts backpressure.
+        resume_watermark (float): Share of the budget that ends it.
+        poll_seconds (float): Interval of the RSS checks while waiting.
+        max_wait_seconds (float): Longest wait before the fetch goes on anyway.
+    """
+
+    def __init__(self,
+                 budget_bytes: int = None,
+                 temp_dir: str = None,
+                 extract_workers: int = 1,
+                 duckdb_connections: int = 1,
+                 high_watermark: float = HIGH_WATERMARK,
+                 resume_watermark: float = RESUME_WATERMARK,
+                 poll_seconds: float = 0.5,
+                 max_wait_seconds: float = 300):
+        self.configure(budget_bytes, temp_dir, extract_workers, duckdb_connections,
+                       high_watermark, resume_watermark, poll_seconds, max_wait_seconds)
+        self.active = 0  # fetch loops running
+        self.waiting = 0  # fetch loops waiting for memory
+        self._lock = threading.Lock()
+
+    def configure(self,
+                  budget_bytes: int = None,
+                  temp_dir: str = None,
+                  extract_workers: int = 1,
+                  duckdb_connections: int = 1,
+                  high_watermark: float = HIGH_WATERMARK,
+                  resume_watermark: float = RESUME_WATERMARK,
+                  poll_seconds: float = 0.5,
+                  max_wait_seconds: float = 300) -> None:
+        """Sets the budget and the number of its consumers, see the class arguments."""
+        self.budget_bytes = budget_bytes or None
+        self.temp_dir = temp_dir
+        self.extract_workers = max(1, extract_workers)
+        self.duckdb_connections = max(1, duckdb_connections)
+        self.high_watermark = high_watermark
+        self.resume_watermark = resume_watermark
+        self.poll_seconds = poll_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.waits = 0  # times a fetch waited for memory
+        self.warned = False
+        if self.budget_bytes:
+            logger.info(f"Memory budget {self.budget_bytes / 2**20:.0f} MB: "
+                        f"DuckDB {self.duckdb_memory_limit / 2**20:.0f} MB and {self.duckdb_threads} threads "
+                        f"per connection, fetch {self.fetch_bytes / 2**20:.0f} MB and Arrow "
+                        f"{self.arrow_bytes / 2**20:.0f} MB per extraction")
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes is not None
+
+    @property
+    def fetch_bytes(self) -> int:
+        """Python rows one extraction may hold."""
+        return int(self.budget_bytes * FETCH_SHARE / self.extract_workers)
+
+    @property
+    def arrow_bytes(self) -> int:
+        """Buffered Arrow data one extraction may hold."""
+        return int(self.budget_bytes * ARROW_SHARE / self.extract_workers)
+
+    @property
+    def duckdb_memory_limit(self) -> int:
+        """memory_limit of one DuckDB connection."""
+        return int(self.budget_bytes * DUCKDB_SHARE / self.duckdb_connections)
+
+    @property
+    def duckdb_threads(self) -> int:
+        return max(1, (os.cpu_count() or 1) // self.duckdb_connections)
+
+    def fetch_batch_rows(self, row_bytes: int, batch_size: int) -> int:
+        """Rows per fetch batch: batch_size, or fewer if a batch of rows of row_bytes would not fit."""
+        if not self.enabled or not row_bytes:
+            return batch_size
+        return max(MIN_BATCH_ROWS, min(batch_size, self.fetch_bytes // row_bytes))
+
+    def row_group_rows(self, row_bytes: int, row_group_size: int) -> int:
+        """Rows per buffered row group: row_group_size, or fewer if it would not fit."""
+        if not self.enabled or not row_bytes or not row_group_size:
+            return row_group_size
+        return max(MIN_BATCH_ROWS, min(row_group_size, self.arrow_bytes // row_bytes))
+
+    def configure_duckdb(self, duck_conn: DuckDBPyConnection, temp_dir: str = None) -> None:
+        """
+        Applies the budget to a new DuckDB connection.
+
+        The connection spills to a directory of its own in temp_dir (removed by
+        DuckDB when the connection closes), so connections do not share spill files.
+        """
+        temp_dir = temp_dir or self.temp_dir
+        if temp_dir:
+            spill_dir = os.path.abspath(os.path.join(temp_dir, f"duckdb_spill_{uuid.uuid4().hex[:12]}"))
+            duck_conn.execute(f"SET temp_directory = '{spill_dir}'")
+        if not self.enabled:
+            return
+        duck_conn.execute(f"SET memory_limit = '{self.duckdb_memory_limit // 2**20}MB'")
+        duck_conn.execute(f"SET threads = {self.duckdb_threads}")
+
+    @contextmanager
+    def fetching(self):
+        """Marks a running fetch loop, one that wait_for_memory() can wait for."""
+        with self._lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def wait_for_memory(self) -> None:
+        """
+        Blocks while the RSS is above the high watermark of the budget (backpressure).
+
+        The wait ends below the resume watermark, after max_wait_seconds, or at
+        once when every other fetch loop is waiting too, as nothing would free
+        memory then.
+        """
+        if not self.enabled:
+            return
+        rss = rss_bytes()
+        if rss is None or rss < self.budget_bytes * self.high_watermark:
+            return
+
+        start = time.perf_counter()
+        with el_metrics.stage(el_metrics.STAGE_BACKPRESSURE):
+            gc.collect()
+            pa.default_memory_pool().release_unused()
+            with self._lock:
+                self.waiting += 1
+                others = self.active - self.waiting
+            try:
+                if others > 0:
+                    self.waits += 1
+                    logger.warning(f"Memory at {rss / 2**20:.0f} MB of a budget of "
+                                   f"{self.budget_bytes / 2**20:.0f} MB, pausing the fetch")
+                elif not self.warned:
+                    self.warned = True
+                    logger.warning(f"Memory at {rss / 2**20:.0f} MB of a budget of "
+                                   f"{self.budget_bytes / 2**20:.0f} MB with no other extraction to wait for, "
+                                   f"lower the budget shares or the concurrency")
+                while others > 0:
+                    time.sleep(self.poll_seconds)
+                    rss = rss_bytes()
+                    if rss < self.budget_bytes * self.resume_watermark:
+                        logger.info(f"Fetch resumed after {time.perf_counter() - start:.1f}s "
+                                    f"at {rss / 2**20:.0f} MB")
+                        break
+                    if time.perf_counter() - start > self.max_wait_seconds:
+                        logger.warning(f"Memory still at {rss / 2**20:.0f} MB after "
+                                       f"{self.max_wait_seconds:.0f}s, going on")
+                        break
+                    with self._lock:
+                        others = self.active - self.waiting
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+
+
+# Governor of the process, configured by the worker
+governor = MemoryGovernor()
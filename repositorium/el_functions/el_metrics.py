@@ -0,0 +1,289 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator
+from repositorium.logger import logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Stages of the extraction and load, in pipeline order
+STAGE_EXTRACT = 'extract'      # whole extraction of a table
+STAGE_QUERY = 'query'          # execute and first batch: server response
+STAGE_FETCH = 'fetch'          # further cursor.fetchmany() calls
+STAGE_CONVERT = 'convert'      # rows to Arrow record batches
+STAGE_WRITE = 'write'          # sink writes (Parquet pages or DuckDB insert)
+STAGE_FINALIZE = 'finalize'    # sink close (Parquet footer or DuckDB export)
+STAGE_THROTTLE = 'throttle'    # pauses between queries
+STAGE_LOAD = 'load'            # Postgres COPY of a table
+STAGE_BACKPRESSURE = 'backpressure'  # fetch waits for memory, see el_memory
+
+# Company and table the current thread works on, set by the worker and the extractor
+current_company = contextvars.ContextVar('current_company', default=None)
+current_table = contextvars.ContextVar('current_table', default=None)
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak resident set size of the process to its current size.
+
+    Works on Linux, where writing 5 to /proc/self/clear_refs resets VmHWM.
+
+    Returns:
+        bool: True if the peak was reset, False if peak_rss_bytes() stays the
+            peak since the process started.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    """
+    Peak resident set size since the last reset_peak_rss(), None where it cannot be measured.
+
+    Falls back to the peak since the process started (ru_maxrss) where
+    /proc/self/status cannot be read.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024  # kilobytes
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # kilobytes on Linux
+
+
+def set_context(company: str = None, table: str = None) -> None:
+    """Sets the company and/or table the stages of the current thread are recorded for."""
+    if company is not None:
+        current_company.set(company)
+    if table is not None:
+        current_table.set(table)
+
+
+class StageStats:
+    """Accumulated measurements of one stage of one company and table."""
+
+    def __init__(self, company: str, table: str, stage: str):
+        self.company = company
+        self.table = table
+        self.stage = stage
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.peak_rss_bytes = None
+
+    def to_dict(self) -> dict:
+        return {
+            'company': self.company,
+            'table': self.table,
+            'stage': self.stage,
+            'calls': self.calls,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'rows_per_sec': round(self.rows / self.wall_seconds) if self.wall_seconds and self.rows else None,
+            'peak_rss_mb': round(self.peak_rss_bytes / 2**20, 1) if self.peak_rss_bytes else None,
+        }
+
+
+class StageTimer:
+    """Handle of a running stage, used to add the rows and bytes it processed."""
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+    def add(self, rows: int = 0, nbytes: int = 0) -> None:
+        self.rows += rows
+        self.bytes += nbytes
+
+
+class RunReport:
+    """Per-stage timings and throughput of one worker run.
+
+    Stages are measured with stage() and accumulated per company, table and
+    stage: wall time, CPU time of the measuring thread, rows, bytes and the
+    peak RSS of the process at the end of the stage. CPU time spent in
+    DuckDB's or pyarrow's own threads is not included. Safe to share
+    between threads.
+
+    reset() also resets the peak RSS where the OS allows it, so in daemon
+    mode the peaks are those of the run. Elsewhere they are the peaks of the
+    whole process, which the report tells with peak_rss_scope 'process'.
+    """
+
+    def __init__(self, job: str = None):
+        self.job = job
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.peak_rss_scope = 'run'  # the first run starts with the process
+
+    def reset(self, job: str = None) -> None:
+        """Starts a new run."""
+        with self._lock:
+            self.job = job or self.job
+            self.started_at = datetime.now()
+            self._start = time.perf_counter()
+            self._stages = {}
+            self.peak_rss_scope = 'run' if reset_peak_rss() else 'process'
+
+    def record(self,
+               stage: str,
+               wall_seconds: float,
+               cpu_seconds: float = 0.0,
+               rows: int = 0,
+               nbytes: int = 0,
+               company: str = None,
+               table: str = None) -> None:
+        """Adds one measurement of a stage; company and table default to the thread's context."""
+        company = company if company is not None else current_company.get()
+        table = table if table is not None else current_table.get()
+        peak = peak_rss_bytes()
+
+        with self._lock:
+            key = (company, table, stage)
+            stats = self._stages.get(key)
+            if stats is None:
+                stats = self._stages[key] = StageStats(company, table, stage)
+            stats.calls += 1
+            stats.wall_seconds += wall_seconds
+            stats.cpu_seconds += cpu_seconds
+            stats.rows += rows
+            stats.bytes += nbytes
+            if peak is not None:
+                stats.peak_rss_bytes = max(stats.peak_rss_bytes or 0, peak)
+
+    @contextmanager
+    def stage(self, stage: str, company: str = None, table: str = None) -> Iterator[StageTimer]:
+        """
+        Measures the block as one call of a stage.
+
+        Example:
+            with run_report.stage(STAGE_WRITE) as timer:
+                sink.write_batch(batch)
+                timer.add(rows=batch.num_rows, nbytes=batch.nbytes)
+        """
+        timer = StageTimer()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield timer
+        finally:
+            self.record(stage,
+                        wall_seconds=time.perf_counter() - wall_start,
+                        cpu_seconds=time.thread_time() - cpu_start,
+                        rows=timer.rows,
+                        nbytes=timer.bytes,
+                        company=company,
+                        table=table)
+
+    def to_dict(self, status: int = None) -> dict:
+        with self._lock:
+            stages = [stats.to_dict() for stats in self._stages.values()]
+        peak = peak_rss_bytes()
+        return {
+            'job': self.job,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'wall_seconds': round(time.perf_counter() - self._start, 3),
+            'peak_rss_mb': round(peak / 2**20, 1) if peak else None,
+            'peak_rss_scope': self.peak_rss_scope,
+            'status': status,
+            'stages': stages,
+        }
+
+    def write_json(self, report_dir: str, status: int = None) -> str:
+        """
+        Writes the report to <report_dir>/run_<job>_<started_at>.json.
+
+        Returns:
+            str: Path of the report.
+        """
+        report = self.to_dict(status)
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, f"run_{self.job}_{self.started_at:%Y%m%d_%H%M%S}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        logger.info(f"Run report written to {path}")
+        return path
+
+    def write_prometheus(self, path: str, status: int = None) -> None:
+        """
+        Writes the report in the Prometheus text format, for the textfile collector of node_exporter.
+
+        The file is written under a temporary name and renamed, so the
+        collector never reads a partial file.
+        """
+        report = self.to_dict(status)
+        job = {'job': self.job or ''}
+        lines = []
+
+        def metric(name: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f"{name}{{{prometheus_labels(labels)}}} {value}")
+
+        metric('etl_run_wall_seconds', 'Wall time of the last run.', [(job, report['wall_seconds'])])
+        if report['peak_rss_scope'] == 'run':
+            metric('etl_run_peak_rss_bytes', 'Peak resident memory of the last run.',
+                   [(job, peak_rss_bytes())])
+        else:
+            metric('etl_process_peak_rss_bytes', 'Peak resident memory of the worker process since it started.',
+                   [(job, peak_rss_bytes())])
+        metric('etl_run_status', 'Exit code of the last run.', [(job, status)])
+        metric('etl_run_finished_timestamp_seconds', 'End of the last run.', [(job, round(time.time()))])
+
+        stage_labels = [
+            ({**job, 'company': stats['company'] or '', 'table': stats['table'] or '', 'stage': stats['stage']},
+             stats)
+            for stats in report['stages']
+        ]
+        for field, help_text in (('wall_seconds', 'Wall time of the stage in the last run.'),
+                                 ('cpu_seconds', 'CPU time of the stage in the last run.'),
+                                 ('rows', 'Rows processed by the stage in the last run.'),
+                                 ('bytes', 'Bytes processed by the stage in the last run.')):
+            metric(f"etl_stage_{field}", help_text,
+                   [(labels, stats[field]) for labels, stats in stage_labels])
+
+        partial_path = f"{path}.part"
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(partial_path, path)
+        logger.info(f"Prometheus metrics written to {path}")
+
+
+def prometheus_labels(labels: dict) -> str:
+    """Formats Prometheus labels, escaping backslashes, quotes and new lines."""
+    def escape(value: str) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in labels.items())
+
+
+# Report of the current run, shared by all modules
+run_report = RunReport()
+
+
+def stage(name: str, company: str = None, table: str = None):
+    """Measures a stage in the report of the current run, see RunReport.stage()."""
+    return run_report.stage(name, company=company, table=table)
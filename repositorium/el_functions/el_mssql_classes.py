@@ -1,17 +1,31 @@
 
-import logging
-from datetime import datetime
+import contextvars
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable
 import pymssql
 from pymssql import Connection
-from repositorium.el_functions import el_func
+from repositorium.logger import logger
+from repositorium.el_functions import el_dimensions, el_func, el_metrics, el_paging, el_schema, el_sinks, el_throttle
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+# How create_parquet_sliced() splits a query
+SLICE_MODULO = 'modulo'  # parameters (slices, slice number), e.g. WHERE id % %s = %s
+SLICE_DATE = 'date'      # parameters (start_date, end_date) of contiguous date ranges
 
 
 class MssqlConnection:
-    """Class for managing connection to MS SQL Server."""
+    """Class for managing connection to MS SQL Server.
+
+    The context manager returns the MssqlConnection itself. It behaves like the
+    underlying pymssql connection (attribute access is delegated to it) and can
+    also check its health and reconnect, which the fetch retries use to recover
+    from a dropped connection.
+    """
     
     def __init__(self,
                  server: str,
@@ -26,8 +40,8 @@ class MssqlConnection:
         self.time_out_limit = db_timeout_limit
         self.conn_sql = None  # Connection will be established on the first request
 
-    def __enter__(self):
-        """Establishes a connection to the database when entering the context manager."""
+    def connect(self) -> Connection:
+        """Opens the connection to the database."""
         try:
             self.conn_sql = pymssql.connect(
                 server=self.server,
@@ -41,30 +55,189 @@ class MssqlConnection:
         except Exception as e:
             logger.error(f"Failed to establish database connection: {e}")
             raise
-        
+
+    def close(self) -> None:
+        """Closes the connection, ignoring errors of an already dead connection."""
+        if self.conn_sql:
+            try:
+                self.conn_sql.close()
+                logger.info("Database connection closed.")
+            except Exception as e:
+                logger.warning(f"Error while closing database connection: {e}")
+            self.conn_sql = None
+
+    def is_alive(self) -> bool:
+        """Checks the connection with a trivial query."""
+        if self.conn_sql is None:
+            return False
+        try:
+            with self.conn_sql.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def reconnect(self) -> Connection:
+        """Closes the connection and opens a new one."""
+        logger.info(f"Reconnecting to database {self.database}")
+        self.close()
+        return self.connect()
+
+    def cursor(self):
+        return self.conn_sql.cursor()
+
+    def __getattr__(self, name):
+        # Delegate everything else to the pymssql connection
+        if name == 'conn_sql':
+            raise AttributeError(name)
+        return getattr(self.conn_sql, name)
+
+    def __enter__(self):
+        """Establishes a connection to the database when entering the context manager."""
+        self.connect()
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Ensures that the connection is closed upon exit."""
-        if self.conn_sql:
-            self.conn_sql.close()
-            logger.info("Database connection closed.")
+        self.close()
+
+
+class MssqlConnectionPool:
+    """Open MssqlConnection objects kept per database, for a long-running worker.
+
+    connection(database) lends an idle connection to that database or opens a
+    new one. A connection idle for longer than health_check_interval seconds
+    is checked with is_alive() and reopened if the check fails, so a healthy
+    connection is reused without a new login. At most max_idle connections per
+    database are kept open.
+    """
+
+    def __init__(self,
+                 server: str,
+                 username: str,
+                 password: str,
+                 db_timeout_limit: int=300,
+                 max_idle: int=2,
+                 health_check_interval: float=60):
+        self.server = server
+        self.username = username
+        self.password = password
+        self.db_timeout_limit = db_timeout_limit
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self._idle = {}  # database -> list of (MssqlConnection, time it was returned)
+        self._lock = threading.Lock()
+
+    def _acquire(self, database: str) -> MssqlConnection:
+        conn = None
+        with self._lock:
+            idle = self._idle.get(database)
+            if idle:
+                conn, idle_since = idle.pop()
+
+        if conn is None:
+            conn = MssqlConnection(server=self.server,
+                                   username=self.username,
+                                   password=self.password,
+                                   database=database,
+                                   db_timeout_limit=self.db_timeout_limit)
+            conn.connect()
+        elif time.monotonic() - idle_since > self.health_check_interval and not conn.is_alive():
+            logger.info(f"Idle connection to {database} is dead, reconnecting")
+            conn.reconnect()
+        return conn
+
+    def _release(self, database: str, conn: MssqlConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(database, [])
+            if len(idle) < self.max_idle:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self, database: str):
+        """Lends an open connection to database for the duration of the block."""
+        conn = self._acquire(database)
+        try:
+            yield conn
+        except Exception:
+            # Keep the connection only if the error did not break it
+            if conn.is_alive():
+                self._release(database, conn)
+            else:
+                conn.close()
+            raise
+        self._release(database, conn)
+
+    def close(self) -> None:
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
 
 
 class DatabaseTablesExtractor:
-    """Class for processing static tables and saving them in Parquet format."""
+    """Class for processing static tables and saving them in Parquet format.
+
+    With slices > 1 and a connection_factory (returning a context manager
+    that yields a new connection) one table can be extracted over several
+    connections at once, see create_parquet_sliced().
+
+    With offload and a dimension_cache, create_parquet() and
+    create_parquet_date_depended() extract only the fact rows and rebuild
+    the table by a local join, see create_parquet_offloaded().
+
+    With the 'postgres' sink type and a loader, create_parquet() and
+    create_parquet_date_depended() load the table straight into the
+    warehouse instead of writing a Parquet file.
+
+    With a checkpoint_dir, create_parquet_date_depended() keeps every
+    completed page, so a failed extraction resumes where it stopped (see
+    el_func.fetch_pages_checkpointed()).
+    """
     
     def __init__(self,
                  data_dir: str,
                  temp_dir: str,
-                 date_range: dict=None
+                 date_range: dict=None,
+                 fetch_batch_size: int=el_func.FETCH_BATCH_SIZE,
+                 sink_type: str=el_sinks.SINK_PARQUET,
+                 throttle: el_throttle.ThrottlePolicy=None,
+                 retry: el_throttle.RetryPolicy=None,
+                 dataset: dict=None,
+                 write_options: dict=None,
+                 slices: int=1,
+                 connection_factory: Callable=None,
+                 schema_cache: el_schema.SchemaCache=None,
+                 offload: dict=None,
+                 dimension_cache: el_dimensions.DimensionCache=None,
+                 loader=None,
+                 checkpoint_dir: str=None
                  ):
         self.data_dir = data_dir
         self.temp_dir = temp_dir
         self.date_range = date_range
+        self.fetch_batch_size = fetch_batch_size
+        self.sink_type = sink_type
+        self.throttle = throttle
+        self.retry = retry
+        self.dataset = dataset  # partitioned dataset layout, see el_sinks.create_sink()
+        self.write_options = write_options  # Parquet codec, row groups, sort order
+        self.slices = slices  # queries a sliced extraction runs at once
+        self.connection_factory = connection_factory
+        self.schema_cache = schema_cache  # exact column types described by the server
+        self.offload = offload  # fact queries, dimensions and local join, see create_parquet_offloaded()
+        self.dimension_cache = dimension_cache
+        self.loader = loader  # ParquetPostgresLoader of the 'postgres' sink
+        self.checkpoint_dir = checkpoint_dir  # completed date pages of failed extractions
         self.conn_sql = None
 
     def set_connection(self, conn_sql: pymssql.Connection):
-        """Sets the database connection."""
+        """Sets the database connection (a MssqlConnection can also reconnect on errors)."""
         self.conn_sql = conn_sql
 
     def create_parquet(self, table_query: str, table_name: str) -> None:
@@ -73,14 +246,29 @@ class DatabaseTablesExtractor:
             logger.error(ValueError("Database connection is not established. Use set_connection()."))
             raise
 
+        if self.offload is not None:
+            self.create_parquet_offloaded(table_name=table_name)
+            return
+
         logger.info(f"Creating Parquet file for table: {table_name}")
-        el_func.fetch_static_data_to_parquet(
-            conn_sql=self.conn_sql,
-            sql_query=table_query,
-            table_name=table_name,
-            data_dir=self.data_dir,
-            temp_dir=self.temp_dir
-        )
+        el_metrics.set_context(table=table_name)
+        with el_metrics.stage(el_metrics.STAGE_EXTRACT) as timer:
+            rows = el_func.fetch_static_data_to_parquet(
+                conn_sql=self.conn_sql,
+                sql_query=table_query,
+                table_name=table_name,
+                data_dir=self.data_dir,
+                temp_dir=self.temp_dir,
+                batch_size=self.fetch_batch_size,
+                sink_type=self.sink_type,
+                throttle=self.throttle,
+                retry=self.retry,
+                dataset=self.dataset,
+                write_options=self.write_options,
+                schema_cache=self.schema_cache,
+                loader=self.loader
+            )
+            timer.add(rows=rows)
         logger.info(f"Parquet file created successfully for table: {table_name}")
 
     def create_parquet_date_depended(self, table_query: str, table_name: str) -> None:
@@ -89,14 +277,222 @@ class DatabaseTablesExtractor:
             logger.error(ValueError("Database connection is not established. Use set_connection()."))
             raise
 
+        if self.offload is not None:
+            self.create_parquet_offloaded(table_name=table_name, date_range=self.date_range)
+            return
+
         logger.info(f"Creating Parquet file for table: {table_name}")
-        el_func.fetch_data_to_parquet(
-            conn_sql=self.conn_sql,
-            date_range=self.date_range,
-            sql_query=table_query,
-            table_name=table_name,
-            data_dir=self.data_dir,
-            temp_dir=self.temp_dir
-        )
+        el_metrics.set_context(table=table_name)
+        with el_metrics.stage(el_metrics.STAGE_EXTRACT) as timer:
+            rows = el_func.fetch_data_to_parquet(
+                conn_sql=self.conn_sql,
+                date_range=self.date_range,
+                sql_query=table_query,
+                table_name=table_name,
+                data_dir=self.data_dir,
+                temp_dir=self.temp_dir,
+                batch_size=self.fetch_batch_size,
+                sink_type=self.sink_type,
+                throttle=self.throttle,
+                retry=self.retry,
+                dataset=self.dataset,
+                write_options=self.write_options,
+                schema_cache=self.schema_cache,
+                loader=self.loader,
+                checkpoint_dir=self.checkpoint_dir
+            )
+            timer.add(rows=rows)
+        logger.info(f"Parquet file created successfully for table: {table_name}")
+
+    def create_parquet_offloaded(self, table_name: str, date_range: dict=None) -> None:
+        """Creates a Parquet file from narrow fact rows joined to cached dimension tables.
+
+        self.offload describes the table: 'fact_query' (or 'fact_date_query'
+        with a date_range) returns the rows with the keys of the dimensions
+        instead of their names, 'dimensions' are the queries of the lookup
+        tables by view name, 'join_query' is the DuckDB query rebuilding the
+        rows of the table from the view 'facts' and the dimension views, and
+        'source' is the name of the source database. The dimensions are
+        taken from the dimension_cache unless they changed, the fact rows are
+        written to temp/<table>__facts and joined locally (see
+        el_sinks.join_dimensions()), so the server sends every name once
+        instead of once per row.
+        """
+        logger.info(f"Creating Parquet file for table {table_name} from facts and dimensions")
+        el_metrics.set_context(table=table_name)
+        facts_dir = os.path.join(self.temp_dir, f"{table_name}__facts")
+        shutil.rmtree(facts_dir, ignore_errors=True)
+        os.makedirs(facts_dir)
+        facts_name = f"{table_name}__facts"
+        options = {'conn_sql': self.conn_sql,
+                   'table_name': facts_name,
+                   'data_dir': facts_dir,
+                   'temp_dir': self.temp_dir,
+                   'batch_size': self.fetch_batch_size,
+                   'sink_type': self.sink_type,
+                   'throttle': self.throttle,
+                   'retry': self.retry,
+                   'schema_cache': self.schema_cache}
+        dataset = self.dataset
+        try:
+            with el_metrics.stage(el_metrics.STAGE_EXTRACT) as timer:
+                dimension_paths = {
+                    name: self.dimension_cache.fetch(self.conn_sql, self.offload['source'], name, query)
+                    for name, query in self.offload['dimensions'].items()
+                }
+                if date_range is None:
+                    rows = el_func.fetch_static_data_to_parquet(sql_query=self.offload['fact_query'], **options)
+                else:
+                    rows = el_func.fetch_data_to_parquet(date_range=date_range,
+                                                         sql_query=self.offload['fact_date_query'],
+                                                         **options)
+                    if dataset is not None:
+                        dataset = {**dataset, 'window': (date_range['start_date'], date_range['end_date'])}
+                timer.add(rows=rows)
+
+            el_sinks.join_dimensions(
+                fact_path=os.path.join(facts_dir, f"{facts_name}.parquet"),
+                dimension_paths=dimension_paths,
+                join_query=self.offload['join_query'],
+                table_name=table_name,
+                data_dir=self.data_dir,
+                temp_dir=self.temp_dir,
+                dataset=dataset,
+                write_options=self.write_options)
+        finally:
+            shutil.rmtree(facts_dir, ignore_errors=True)
         logger.info(f"Parquet file created successfully for table: {table_name}")
 
+    def create_parquet_sliced(self,
+                              table_query: str,
+                              table_name: str,
+                              slice_by: str=SLICE_MODULO,
+                              date_range: dict=None,
+                              outside_query: str=None) -> None:
+        """Creates a Parquet file from a query split into self.slices disjoint slices.
+
+        The slices run at once, each over its own connection from
+        connection_factory, and write their own part to temp/<table>__parts.
+        The parts are then merged into the output of the table (see
+        el_sinks.merge_parquet_parts()). If a slice fails, the other slices
+        are finished, nothing is merged and the first error is raised.
+
+        With slice_by 'modulo' table_query takes the parameters (slices,
+        slice number), e.g. ACCOUNTS_47_SLICE_QUERY. With 'date' it takes a
+        date range like create_parquet_date_depended() and date_range is split
+        into contiguous ranges, each paged by its own connection. One more
+        slice runs outside_query with (start_date, end_date) of date_range
+        for the rows dated before or after it or without a date, e.g.
+        ACCOUNTS_47_OUTSIDE_QUERY, so the output still has all rows.
+
+        The slices fetch the full rows: dimensions are not offloaded (see
+        create_parquet_offloaded()) in a sliced extraction.
+        """
+        if self.connection_factory is None:
+            raise ValueError("Sliced extraction needs a connection_factory.")
+        if slice_by not in (SLICE_MODULO, SLICE_DATE):
+            raise ValueError(f"Unknown slice_by '{slice_by}', expected '{SLICE_MODULO}' or '{SLICE_DATE}'")
+        if slice_by == SLICE_DATE and outside_query is None:
+            raise ValueError("Slicing by date needs an outside_query for the rows outside the date range.")
+        if self.offload is not None:
+            logger.warning(f"Dimensions are not offloaded in the sliced extraction of {table_name}")
+
+        if slice_by == SLICE_DATE:
+            ranges = el_paging.split_date_range(
+                start_date=datetime.strptime(date_range['start_date'], '%Y-%m-%d').date(),
+                end_date=datetime.strptime(date_range['end_date'], '%Y-%m-%d').date(),
+                parts=self.slices)
+            slice_options = [{'date_range': {**date_range,
+                                             'start_date': start.strftime('%Y-%m-%d'),
+                                             'end_date': end.strftime('%Y-%m-%d')}} for start, end in ranges]
+            slice_options.append({'sql_query': outside_query,
+                                  'params': (date_range['start_date'], date_range['end_date'])})
+        else:
+            slice_options = [{'params': (self.slices, i)} for i in range(self.slices)]
+
+        parts_dir = os.path.join(self.temp_dir, f"{table_name}__parts")
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        os.makedirs(parts_dir)
+        part_names = [f"{table_name}__part{i}" for i in range(len(slice_options))]
+
+        def extract_slice(i: int) -> int:
+            options = {'sql_query': table_query,
+                       'table_name': part_names[i],
+                       'data_dir': parts_dir,
+                       'temp_dir': self.temp_dir,
+                       'batch_size': self.fetch_batch_size,
+                       'sink_type': self.sink_type,
+                       'throttle': self.throttle,
+                       'retry': self.retry,
+                       'schema_cache': self.schema_cache,
+                       **slice_options[i]}
+            with self.connection_factory() as conn:
+                if 'date_range' in options:
+                    return el_func.fetch_data_to_parquet(conn_sql=conn, **options)
+                return el_func.fetch_static_data_to_parquet(conn_sql=conn, **options)
+
+        logger.info(f"Creating Parquet file for table {table_name} in {len(slice_options)} slices by {slice_by}")
+        el_metrics.set_context(table=table_name)
+        try:
+            with el_metrics.stage(el_metrics.STAGE_EXTRACT) as timer:
+                with ThreadPoolExecutor(max_workers=len(slice_options), thread_name_prefix='slice') as pool:
+                    # Each slice gets a copy of the context, so its metrics keep the company and table
+                    futures = [pool.submit(contextvars.copy_context().run, extract_slice, i)
+                               for i in range(len(slice_options))]
+                errors = [future.exception() for future in futures if future.exception() is not None]
+                if errors:
+                    raise errors[0]
+                timer.add(rows=sum(future.result() for future in futures))
+
+            el_sinks.merge_parquet_parts(
+                part_paths=[os.path.join(parts_dir, f"{name}.parquet") for name in part_names],
+                table_name=table_name,
+                data_dir=self.data_dir,
+                temp_dir=self.temp_dir,
+                dataset=self.dataset,
+                write_options=self.write_options)
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+        logger.info(f"Parquet file created successfully for table: {table_name}")
+
+    def create_parquet_incremental(self,
+                                   table_query: str,
+                                   date_table_query: str,
+                                   table_name: str,
+                                   watermark: str=None,
+                                   lookback_days: int=0,
+                                   days_per_page: int=31,
+                                   page_options: dict=None) -> dict:
+        """Creates a Parquet file with the rows dated from the watermark onwards.
+
+        Without a watermark the whole table is extracted with table_query.
+        Otherwise date_table_query is paged from watermark - lookback_days up to
+        today. The lookback re-reads recent days, which may still get back-dated
+        postings. When writing into a partitioned dataset the start is moved back
+        to the first day of its month, as whole month partitions are replaced.
+
+        page_options (dict) is merged into the date_range, e.g. with
+        'target_rows_per_page' for adaptive page sizes.
+
+        Returns:
+            dict: The extracted date_range, so the loader can replace exactly
+                that window, or None for a full extraction.
+        """
+        if watermark is None:
+            logger.info(f"No watermark for table {table_name}, running a full extraction")
+            self.create_parquet(table_query=table_query, table_name=table_name)
+            return None
+
+        start_date = datetime.strptime(watermark, '%Y-%m-%d').date() - timedelta(days=lookback_days)
+        if self.dataset is not None:
+            start_date = start_date.replace(day=1)
+        self.date_range = {
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': datetime.now().strftime('%Y-%m-%d'),
+            'days_per_page': days_per_page,
+            'lookback_days': lookback_days,
+            **(page_options or {})
+        }
+        logger.info(f"Incremental extraction of table {table_name}: {self.date_range}")
+        self.create_parquet_date_depended(table_query=date_table_query, table_name=table_name)
+        return self.date_range
@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+from typing import Tuple
+from repositorium.logger import logger, throttled
+
+# Limits of how fast the window may change from one page to the next
+MAX_GROWTH = 4.0
+MIN_SHRINK = 0.25
+
+
+def split_date_range(start_date: date, end_date: date, parts: int) -> list:
+    """
+    Splits start_date..end_date (inclusive) into at most parts contiguous ranges of about equal days.
+
+    Returns:
+        list: (start_date, end_date) of every range, inclusive.
+    """
+    days = (end_date - start_date).days + 1
+    parts = max(1, min(parts, days))
+    bounds = [start_date + timedelta(days=days * i // parts) for i in range(parts + 1)]
+    return [(bounds[i], bounds[i + 1] - timedelta(days=1)) for i in range(parts)]
+
+
+class AdaptiveDatePager:
+    """Splits a date range into pages sized to a target number of rows or bytes.
+
+    The first page is days_per_page long. After every page the next window
+    is sized from the rows per day (and bytes per row) just observed, so busy
+    periods such as month and year end get short pages and quiet periods get
+    long ones. Without a target the pages keep the fixed days_per_page size.
+
+    A page that cannot be fetched (for example a query timeout) can be split
+    with split(), which halves the window and retries it.
+    """
+
+    def __init__(self,
+                 start_date: date,
+                 end_date: date,
+                 days_per_page: int,
+                 target_rows_per_page: int = None,
+                 target_bytes_per_page: int = None,
+                 max_bytes_per_page: int = None,
+                 min_days_per_page: int = 1,
+                 max_days_per_page: int = 366):
+        self.end_date = end_date
+        self.days = days_per_page
+        self.target_rows = target_rows_per_page
+        self.target_bytes = target_bytes_per_page
+        self.max_bytes = max_bytes_per_page
+        self.min_days = min_days_per_page
+        self.max_days = max_days_per_page
+        self.page_start = start_date
+        self.page_end = None
+        self.pages = 0
+
+    @property
+    def adaptive(self) -> bool:
+        return bool(self.target_rows or self.target_bytes or self.max_bytes)
+
+    @property
+    def done(self) -> bool:
+        return self.page_start > self.end_date
+
+    def next_page(self) -> Tuple[date, date]:
+        """Returns (start, end) of the next page, both inclusive."""
+        self.page_end = min(self.page_start + timedelta(days=self.days - 1), self.end_date)
+        return self.page_start, self.page_end
+
+    def can_split(self) -> bool:
+        return (self.page_end - self.page_start).days + 1 > self.min_days
+
+    def split(self) -> None:
+        """Halves the current window; the next call to next_page() returns the first half."""
+        page_days = (self.page_end - self.page_start).days + 1
+        self.days = max(self.min_days, page_days // 2)
+        logger.warning(f"Splitting page {self.page_start} - {self.page_end} into pages of {self.days} days")
+
+    def record(self, rows: int, nbytes: int) -> None:
+        """Records the size of the finished page and sizes the next window."""
+        page_days = (self.page_end - self.page_start).days + 1
+        self.pages += 1
+        self.page_start = self.page_end + timedelta(days=1)
+
+        if not self.adaptive:
+            return
+
+        if self.max_bytes and nbytes > self.max_bytes:
+            logger.warning(f"Page of {page_days} days had {nbytes} bytes, over the budget of {self.max_bytes}")
+
+        target_rows = self._target_rows(rows, nbytes)
+        if rows == 0 or target_rows is None:
+            factor = MAX_GROWTH
+        else:
+            factor = min(MAX_GROWTH, max(MIN_SHRINK, target_rows / rows))
+
+        self.days = int(min(self.max_days, max(self.min_days, page_days * factor)))
+        logger.info(f"Page of {page_days} days had {rows} rows, next page has {self.days} days",
+                    extra=throttled(('page_size', id(self))))
+
+    def _target_rows(self, rows: int, nbytes: int) -> int:
+        """Row target of the next page from the row and byte targets, None if there is none."""
+        targets = [self.target_rows] if self.target_rows else []
+        if rows and nbytes:
+            bytes_per_row = nbytes / rows
+            targets += [limit / bytes_per_row for limit in (self.target_bytes, self.max_bytes) if limit]
+        return min(targets) if targets else None
@@ -0,0 +1,152 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+from repositorium.logger import logger
+
+# Marks the end of the queue for a load thread
+_DONE = object()
+
+
+class PipelineResult:
+    """Outcome of a pipelined run, filled in by the extract and load threads."""
+
+    def __init__(self):
+        self.extracted = {}       # item -> result of extract
+        self.loaded = {}          # item -> result of load
+        self.failed_extract = []  # items whose extraction failed
+        self.failed_load = []     # items whose load failed
+        self.skipped = []         # items not processed after a stop
+        self._lock = threading.Lock()
+
+    def add(self, name: str, item, value=None) -> None:
+        with self._lock:
+            target = getattr(self, name)
+            if isinstance(target, dict):
+                target[item] = value
+            else:
+                target.append(item)
+
+
+class ExtractLoadPipeline:
+    """Runs extraction and loading at the same time, connected by a bounded queue.
+
+    Extraction runs in a pool of extract_workers threads. Every extracted
+    item is put on a queue of at most queue_size items, from which
+    load_workers threads load it, so one company is loaded while the next is
+    still being extracted. When the loaders fall behind, the queue is full
+    and the extract threads wait before starting their next item, so no more
+    than queue_size extracted but unloaded outputs pile up.
+
+    A failed extraction or load of one item is logged and does not stop the
+    others. An unexpected error (or KeyboardInterrupt) stops the pipeline:
+    no new extraction or load is started, the threads finish their current
+    item and the error is raised.
+
+    Args:
+        extract (Callable): extract(item) -> value, run in an extract thread.
+        load (Callable): load(item, value) -> value, run in a load thread.
+        extract_workers (int): Items extracted at once.
+        load_workers (int): Items loaded at once.
+        queue_size (int): Extracted items waiting for a loader at most.
+    """
+
+    def __init__(self,
+                 extract: Callable,
+                 load: Callable,
+                 extract_workers: int = 1,
+                 load_workers: int = 1,
+                 queue_size: int = 1):
+        self.extract = extract
+        self.load = load
+        self.extract_workers = extract_workers
+        self.load_workers = load_workers
+        self.queue_size = queue_size
+        self._queue = None
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Stops the pipeline after the items in progress."""
+        self._stop.set()
+
+    def _extract_one(self, item, result: PipelineResult) -> None:
+        if self._stop.is_set():
+            result.add('skipped', item)
+            return
+        try:
+            value = self.extract(item)
+        except Exception as e:
+            result.add('failed_extract', item)
+            logger.error(f'Extraction failed for {item}: {e}', exc_info=True)
+            return
+        except BaseException:
+            self.stop()  # before the next item is picked up, not when run() gets the error
+            raise
+        result.add('extracted', item, value)
+
+        # Blocks while the queue is full: the loaders set the pace
+        while not self._stop.is_set():
+            try:
+                self._queue.put((item, value), timeout=1)
+                return
+            except queue.Full:
+                continue
+        result.add('skipped', item)
+
+    def _load_loop(self, result: PipelineResult) -> None:
+        while True:
+            entry = self._queue.get()
+            if entry is _DONE:
+                return
+            item, value = entry
+            if self._stop.is_set():
+                result.add('skipped', item)
+                continue
+            try:
+                result.add('loaded', item, self.load(item, value))
+            except Exception as e:
+                result.add('failed_load', item)
+                logger.error(f'Load failed for {item}: {e}', exc_info=True)
+
+    def run(self, items: Iterable) -> PipelineResult:
+        """
+        Extracts and loads all items.
+
+        Returns:
+            PipelineResult: Extracted, loaded, failed and skipped items.
+        """
+        result = PipelineResult()
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._stop.clear()
+
+        loaders = [threading.Thread(target=self._load_loop, args=(result,), name=f'load_{i}', daemon=True)
+                   for i in range(self.load_workers)]
+        for thread in loaders:
+            thread.start()
+
+        pool = ThreadPoolExecutor(max_workers=self.extract_workers, thread_name_prefix='extract')
+        futures = {}
+        try:
+            for item in items:
+                futures[pool.submit(self._extract_one, item, result)] = item
+            for future in futures:
+                future.result()
+        except BaseException:
+            logger.error('Pipeline stopped, finishing the items in progress')
+            self.stop()
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            for future, item in futures.items():
+                if future.cancelled():
+                    result.add('skipped', item)
+            # Loaders drain the queue (skipping after a stop) and exit on _DONE
+            for _ in loaders:
+                self._queue.put(_DONE)
+            for thread in loaders:
+                thread.join()
+
+        logger.info(f'Pipeline summary: {len(result.loaded)} loaded, '
+                    f'{len(result.failed_extract)} failed extraction {result.failed_extract}, '
+                    f'{len(result.failed_load)} failed load {result.failed_load}')
+        return result
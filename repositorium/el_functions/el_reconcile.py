@@ -0,0 +1,237 @@
+import json
+import math
+from decimal import Decimal
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from duckdb import DuckDBPyConnection
+from repositorium.logger import logger
+
+# Key of the reconciliation statistics in the key-value metadata of the Parquet footer
+RECONCILIATION_KEY = 'etl_reconciliation'
+
+# Relative difference tolerated between float sums, which depend on the order of addition
+FLOAT_TOLERANCE = 1e-9
+
+
+class ReconciliationError(Exception):
+    """The loaded table does not match the statistics of the extracted rows."""
+
+
+def _number(value):
+    """Sum as stored in the statistics: Decimal kept exact (as a string in JSON), None as 0."""
+    if value is None:
+        return 0
+    return value
+
+
+class ReconciliationStats:
+    """Reconciliation aggregates of the record batches written by a sink.
+
+    Computed as the batches pass through, so confirming a load does not need
+    another scan of the source: the row count, the null count of every
+    column and, per group (group_by columns and the year and month of
+    date_column), the row count and the sums of sum_columns. Columns of the
+    spec missing from the schema are left out, so the statistics describe
+    what was written.
+
+    Args:
+        schema (pa.Schema): Schema of the batches.
+        spec (dict): 'group_by' (list of columns), 'date_column' and
+            'sum_columns' (list of columns), all optional.
+    """
+
+    def __init__(self, schema: pa.Schema, spec: dict):
+        self.group_by = [column for column in spec.get('group_by') or [] if column in schema.names]
+        date_column = spec.get('date_column')
+        self.date_column = date_column if date_column in schema.names and (
+            pa.types.is_temporal(schema.field(date_column).type)) else None
+        self.sum_columns = [column for column in spec.get('sum_columns') or [] if column in schema.names]
+        self.rows = 0
+        self.nulls = {name: 0 for name in schema.names}
+        self.groups = {}  # json list of the group values -> {'rows': int, 'sums': {column: number}}
+
+    @property
+    def keys(self) -> list:
+        """Names of the group values: the group_by columns, then year and month."""
+        return self.group_by + (['year', 'month'] if self.date_column else [])
+
+    def update(self, batch: pa.RecordBatch) -> None:
+        self.rows += batch.num_rows
+        for name, column in zip(batch.schema.names, batch.columns):
+            self.nulls[name] += column.null_count
+        if not batch.num_rows:
+            return
+
+        columns = {}
+        for column in self.group_by:
+            values = batch.column(column)
+            if pa.types.is_dictionary(values.type):
+                values = values.cast(values.type.value_type)
+            columns[column] = values
+        if self.date_column:
+            columns['year'] = pc.year(batch.column(self.date_column))
+            columns['month'] = pc.month(batch.column(self.date_column))
+        for i, column in enumerate(self.sum_columns):
+            columns[f"sum_{i}"] = batch.column(column)
+        table = pa.table(columns)
+
+        if self.keys:
+            aggregated = table.group_by(self.keys).aggregate(
+                [(f"sum_{i}", 'sum') for i in range(len(self.sum_columns))] + [([], 'count_all')])
+            results = aggregated.to_pylist()
+        else:
+            results = [{**{f"sum_{i}_sum": pc.sum(table.column(f"sum_{i}")).as_py()
+                           for i in range(len(self.sum_columns))},
+                        'count_all': batch.num_rows}]
+
+        for result in results:
+            key = json.dumps([result[name] for name in self.keys], default=str, ensure_ascii=False)
+            group = self.groups.setdefault(key, {'rows': 0, 'sums': {column: 0 for column in self.sum_columns}})
+            group['rows'] += result['count_all']
+            for i, column in enumerate(self.sum_columns):
+                group['sums'][column] += _number(result[f"sum_{i}_sum"])
+
+    def to_dict(self) -> dict:
+        return {
+            'rows': self.rows,
+            'keys': self.keys,
+            'group_by': self.group_by,
+            'date_column': self.date_column,
+            'sum_columns': self.sum_columns,
+            'nulls': self.nulls,
+            'groups': self.groups,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), default=str, ensure_ascii=False)
+
+
+def stats_from_metadata(metadata: pq.FileMetaData) -> dict:
+    """Reconciliation statistics from the footer metadata of a Parquet file, None if it has none."""
+    value = (metadata.metadata or {}).get(RECONCILIATION_KEY.encode())
+    return json.loads(value) if value is not None else None
+
+
+def read_stats(path: str) -> dict:
+    """Reconciliation statistics from the footer of a Parquet file, None if it has none."""
+    return stats_from_metadata(pq.read_metadata(path))
+
+
+def combine_stats(stats_list: list) -> dict:
+    """Statistics of the rows of several outputs together, None if any of them has none."""
+    if not stats_list or any(stats is None for stats in stats_list):
+        return None
+    combined = json.loads(json.dumps(stats_list[0]))
+    for stats in stats_list[1:]:
+        if stats['keys'] != combined['keys'] or stats['sum_columns'] != combined['sum_columns']:
+            return None
+        combined['rows'] += stats['rows']
+        for column, nulls in stats['nulls'].items():
+            combined['nulls'][column] = combined['nulls'].get(column, 0) + nulls
+        for key, group in stats['groups'].items():
+            target = combined['groups'].setdefault(
+                key, {'rows': 0, 'sums': {column: '0' for column in combined['sum_columns']}})
+            target['rows'] += group['rows']
+            for column, value in group['sums'].items():
+                target['sums'][column] = str(_add(target['sums'][column], value))
+    return combined
+
+
+def _parse(value):
+    """Number of a sum from JSON: exact Decimal for strings (decimal columns), float or int otherwise."""
+    if isinstance(value, str):
+        return Decimal(value)
+    return value
+
+
+def _add(a, b):
+    a, b = _parse(a), _parse(b)
+    if isinstance(a, float) or isinstance(b, float):
+        return float(a) + float(b)
+    return a + b
+
+
+def _equal(expected, actual) -> bool:
+    expected, actual = _parse(expected), _number(actual)
+    if isinstance(expected, float) or isinstance(actual, float):
+        return math.isclose(float(expected), float(actual), rel_tol=FLOAT_TOLERANCE, abs_tol=FLOAT_TOLERANCE)
+    return Decimal(expected) == Decimal(actual)
+
+
+def verify_table(conn: DuckDBPyConnection,
+                 table: str,
+                 stats: dict,
+                 delta_window: dict = None) -> dict:
+    """
+    Compares a loaded table with the statistics of the extracted rows.
+
+    Runs one aggregate query (count, null counts and sums per group) on the
+    table, restricted to the date window of an incremental load.
+
+    Args:
+        conn (DuckDBPyConnection): Connection the table can be queried on.
+        table (str): Table reference for DuckDB, e.g. 'st_db.accounts_47_savvy'.
+        stats (dict): Statistics from ReconciliationStats.to_dict() or read_stats().
+        delta_window (dict): 'column', 'start_date' and 'end_date' of the loaded window.
+
+    Returns:
+        dict: Row count and number of groups checked.
+
+    Raises:
+        ReconciliationError: When a count or a sum differs.
+    """
+    keys = [f'"{column}"' for column in stats['group_by']]
+    if stats['date_column']:
+        keys += [f'year("{stats["date_column"]}")', f'month("{stats["date_column"]}")']
+    sums = [f'sum("{column}")' for column in stats['sum_columns']]
+    nulls = [f'count(*) - count("{column}")' for column in stats['nulls']]
+
+    where, params = '', []
+    if delta_window is not None:
+        where = (f'WHERE "{delta_window["column"]}" >= CAST(? AS DATE) '
+                 f'AND "{delta_window["column"]}" < CAST(? AS DATE) + INTERVAL 1 DAY')
+        params = [delta_window['start_date'], delta_window['end_date']]
+
+    # One scan: a row per group and a total row (all keys rolled up) with the null counts
+    total = f"grouping({', '.join(keys)}) <> 0" if keys else 'true'
+    group_by = f"GROUP BY GROUPING SETS (({', '.join(keys)}), ())" if keys else ''
+    rows = conn.execute(f"""
+        SELECT {', '.join(keys + [total, 'count(*)'] + sums + nulls)}
+        FROM {table} {where}
+        {group_by}
+    """, params).fetchall()
+
+    n = len(keys)
+    totals = next(row for row in rows if row[n])
+    group_rows = [row for row in rows if not row[n]] if keys else rows
+    differences = []
+    total_rows = totals[n + 1]
+    if total_rows != stats['rows']:
+        differences.append(f"rows: extracted {stats['rows']}, loaded {total_rows}")
+    for column, value in zip(stats['nulls'], totals[n + 2 + len(sums):]):
+        if value != stats['nulls'][column]:
+            differences.append(f"nulls of {column}: extracted {stats['nulls'][column]}, loaded {value}")
+
+    loaded = {}
+    for row in group_rows:
+        if not row[n + 1]:
+            continue  # the only row of an empty table without keys
+        key = json.dumps(list(row[:n]), default=str, ensure_ascii=False)
+        loaded[key] = {'rows': row[n + 1], 'sums': dict(zip(stats['sum_columns'], row[n + 2:n + 2 + len(sums)]))}
+    for key in stats['groups'].keys() | loaded.keys():
+        expected, actual = stats['groups'].get(key), loaded.get(key)
+        if expected is None or actual is None or expected['rows'] != actual['rows']:
+            differences.append(f"rows of {key}: extracted {expected and expected['rows']}, "
+                               f"loaded {actual and actual['rows']}")
+            continue
+        for column, value in expected['sums'].items():
+            if not _equal(value, actual['sums'][column]):
+                differences.append(f"sum of {column} in {key}: extracted {value}, loaded {actual['sums'][column]}")
+
+    if differences:
+        shown = '; '.join(differences[:10])
+        raise ReconciliationError(f"{table} does not match the extracted rows ({len(differences)} differences): "
+                                  f"{shown}")
+    logger.info(f"Reconciled {table}: {total_rows} rows in {len(stats['groups'])} groups")
+    return {'rows': total_rows, 'groups': len(stats['groups'])}
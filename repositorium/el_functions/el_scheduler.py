@@ -0,0 +1,76 @@
+import signal
+import threading
+import time
+from typing import Callable, List
+from repositorium.logger import logger
+
+
+class IntervalJob:
+    """A job run every interval_seconds by IntervalScheduler.
+
+    Args:
+        name (str): Name used in the logs.
+        interval_seconds (float): Time between the starts of two runs.
+        func (Callable): Function running the job, without arguments.
+        run_at_start (bool): Runs the job as soon as the scheduler starts.
+    """
+
+    def __init__(self, name: str, interval_seconds: float, func: Callable, run_at_start: bool = True):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.next_run = time.monotonic() if run_at_start else time.monotonic() + interval_seconds
+        self.runs = 0
+        self.failures = 0
+
+    def schedule_next(self, started: float) -> None:
+        # A run longer than the interval is followed by the next one at once, without catching up
+        self.next_run = max(started + self.interval_seconds, time.monotonic())
+
+
+class IntervalScheduler:
+    """Runs jobs on fixed intervals in the current thread until stopped.
+
+    Jobs run one at a time, so they can share connections without locking.
+    An exception in a job is logged and the job is run again at its next
+    interval. SIGTERM and SIGINT stop the scheduler after the running job.
+    """
+
+    def __init__(self, jobs: List[IntervalJob]):
+        self.jobs = jobs
+        self._stop = threading.Event()
+
+    def stop(self, *_) -> None:
+        """Stops the scheduler after the running job; usable as a signal handler."""
+        if not self._stop.is_set():
+            logger.info("Stopping the scheduler after the running job")
+        self._stop.set()
+
+    def run_pending(self) -> None:
+        """Runs the jobs that are due."""
+        for job in self.jobs:
+            if self._stop.is_set() or time.monotonic() < job.next_run:
+                continue
+            started = time.monotonic()
+            logger.info(f"Starting job {job.name} (run {job.runs + 1})")
+            try:
+                result = job.func()
+                logger.info(f"Job {job.name} finished in {time.monotonic() - started:.0f}s with {result}")
+            except Exception as e:
+                job.failures += 1
+                logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+            job.runs += 1
+            job.schedule_next(started)
+
+    def run_forever(self) -> None:
+        """Runs the jobs until stop() or a termination signal."""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        logger.info(f"Scheduler started with jobs {[(job.name, job.interval_seconds) for job in self.jobs]}")
+        while not self._stop.is_set():
+            self.run_pending()
+            next_run = min(job.next_run for job in self.jobs)
+            self._stop.wait(max(0.0, next_run - time.monotonic()))
+        logger.info("Scheduler stopped")
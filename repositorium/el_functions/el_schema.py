@@ -0,0 +1,149 @@
+import hashlib
+import pyarrow as pa
+from pymssql import Connection, _mssql
+from repositorium.logger import logger
+from repositorium.el_functions.el_state import JsonStateStore
+from repositorium.el_functions.sql_mapping import MSSQL_TO_ARROW_MAP
+
+# SQL Server type names → Arrow types, decimal and numeric take their own precision and scale.
+# Types not listed here keep the mapping of the cursor type code (MSSQL_TO_ARROW_MAP).
+MSSQL_TYPE_NAME_TO_ARROW = {
+    'bit': pa.bool_(),
+    'tinyint': pa.uint8(),
+    'smallint': pa.int16(),
+    'int': pa.int32(),
+    'bigint': pa.int64(),
+    'real': pa.float32(),
+    'float': pa.float64(),
+    'money': pa.decimal128(19, 4),
+    'smallmoney': pa.decimal128(10, 4),
+    'date': pa.date32(),
+    'time': pa.time64('us'),
+    'datetime': pa.timestamp('us'),
+    'datetime2': pa.timestamp('us'),
+    'smalldatetime': pa.timestamp('us'),
+    'char': pa.string(),
+    'varchar': pa.string(),
+    'nchar': pa.string(),
+    'nvarchar': pa.string(),
+    'text': pa.string(),
+    'ntext': pa.string(),
+    'sysname': pa.string(),
+    'binary': pa.binary(),
+    'varbinary': pa.binary(),
+    'image': pa.binary(),
+}
+
+
+def describe_result_set(conn_sql: Connection, sql_query: str, params: tuple = None) -> list:
+    """
+    Asks SQL Server for the exact columns of the first result set of a query.
+
+    Uses sp_describe_first_result_set, which compiles the query without
+    running it. Parameters are substituted the way pymssql does for the query
+    itself; their values do not change the result types.
+
+    Args:
+        conn_sql (Connection): Connection to SQL Server, with no pending results.
+        sql_query (str): The query, with %s placeholders if params are given.
+        params (tuple): Parameters of the query.
+
+    Returns:
+        list: One dict per column with 'name', 'type' (e.g. 'decimal(18,2)'),
+            'nullable', 'precision', 'scale' and 'max_length' (bytes, -1 for max).
+    """
+    if params is not None:
+        sql_query = _mssql.substitute_params(sql_query, params).decode()
+
+    cursor = conn_sql.cursor()
+    try:
+        cursor.execute("EXEC sp_describe_first_result_set @tsql = %s", (sql_query,))
+        names = [col[0] for col in cursor.description]
+        rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+    return [{'name': row['name'],
+             'type': row['system_type_name'],
+             'nullable': bool(row['is_nullable']),
+             'precision': row['precision'],
+             'scale': row['scale'],
+             'max_length': row['max_length']}
+            for row in rows if not row['is_hidden']]
+
+
+def column_arrow_type(column: dict) -> pa.DataType:
+    """Arrow type of a described column, None for a type without an exact mapping."""
+    type_name = column['type'].split('(')[0].strip().lower()
+    if type_name in ('decimal', 'numeric'):
+        return pa.decimal128(column['precision'], column['scale'])
+    return MSSQL_TYPE_NAME_TO_ARROW.get(type_name)
+
+
+def described_arrow_schema(columns: list, headers: list, data_types: list) -> pa.Schema:
+    """
+    Builds the Arrow schema of a query from its described columns.
+
+    Columns of an exactly mapped type get that type, the others keep the
+    mapping of their cursor type code. All fields are nullable: the cached
+    columns may be older than the table, and a column the server described
+    as not nullable can still return NULL, e.g. through an outer join.
+
+    Args:
+        columns (list): Columns returned by describe_result_set().
+        headers (list): Column names from cursor.description.
+        data_types (list): Corresponding SQL Server type codes.
+
+    Returns:
+        pa.Schema: The schema, or None if the described columns do not match
+            the cursor description.
+    """
+    if [column['name'] for column in columns] != list(headers):
+        return None
+
+    fields = []
+    for column, data_type in zip(columns, data_types):
+        arrow_type = column_arrow_type(column)
+        if arrow_type is None:
+            fields.append(pa.field(column['name'], MSSQL_TO_ARROW_MAP.get(data_type, pa.string())))
+        else:
+            fields.append(pa.field(column['name'], arrow_type))
+    return pa.schema(fields)
+
+
+class SchemaCache:
+    """Exact result set columns of queries, described once per query text and kept on disk.
+
+    Entries are keyed by a hash of the query text, so a changed query is
+    described again. A cached entry that no longer matches the cursor
+    description is ignored (the coarse type mapping is used) and described
+    again on the next extraction. A query that cannot be described, e.g.
+    without the permission to, is extracted with the coarse mapping.
+    """
+
+    def __init__(self, path: str):
+        self.store = JsonStateStore(path)
+
+    @staticmethod
+    def key(sql_query: str) -> str:
+        return hashlib.sha256(sql_query.encode()).hexdigest()[:32]
+
+    def columns(self, conn_sql: Connection, sql_query: str, params: tuple = None) -> list:
+        """Described columns of a query, from the cache or from the server; None if it cannot be described."""
+        key = self.key(sql_query)
+        columns = self.store.get(key)
+        if columns is not None:
+            return columns
+
+        try:
+            columns = describe_result_set(conn_sql, sql_query, params)
+        except Exception as e:
+            logger.warning(f"Could not describe the result set of the query, using the cursor types: {e}")
+            return None
+        self.store.set(key, columns)
+        logger.info(f"Described result set {key}: {[(column['name'], column['type']) for column in columns]}")
+        return columns
+
+    def invalidate(self, sql_query: str) -> None:
+        """Forgets the columns of a query, so it is described again."""
+        self.store.delete(self.key(sql_query))
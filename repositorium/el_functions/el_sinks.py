@@ -0,0 +1,728 @@
+import hashlib
+import json
+import os
+import uuid
+from urllib.parse import quote
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from repositorium.logger import logger, throttled
+from repositorium.el_functions import el_arrow, el_func, el_memory, el_metrics, el_reconcile
+from repositorium.el_functions.sql_mapping import MSSQL_TO_DUCKDB_MAP
+
+SINK_PARQUET = 'parquet'
+SINK_DUCKDB = 'duckdb'
+SINK_POSTGRES = 'postgres'  # el_loader.PostgresStreamSink, created by the loader
+
+# Key of the fingerprint in the key-value metadata of the Parquet footer
+FINGERPRINT_KEY = 'etl_fingerprint'
+
+# Partition columns derived from the date column of a partitioned dataset
+DATASET_YEAR = 'year'
+DATASET_MONTH = 'month'
+# Hive name of the partition of null values, as written by pyarrow and DuckDB
+HIVE_NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def dataset_dir(data_dir: str, dataset: dict) -> str:
+    """Directory of a partitioned dataset inside data_dir."""
+    return os.path.join(data_dir, dataset['name'])
+
+
+def dataset_partition_columns(dataset: dict) -> list:
+    """All partition columns of a dataset, in directory order."""
+    return list(dataset['partition_by']) + [DATASET_YEAR, DATASET_MONTH]
+
+
+def partition_path(names: list, values: list) -> str:
+    """Relative Hive path of a partition, e.g. firma=SAVVY%20sp.%20z%20o.o./year=2024/month=3."""
+    return os.path.join(*(
+        f"{name}={HIVE_NULL_PARTITION if value is None else quote(str(value), safe='')}"
+        for name, value in zip(names, values)
+        ))
+
+
+def split_batch_by_partition(batch: pa.RecordBatch, dataset: dict):
+    """
+    Splits a record batch into the partitions of a dataset.
+
+    Args:
+        batch (pa.RecordBatch): Batch to split.
+        dataset (dict): Dataset layout, see create_sink().
+
+    Yields:
+        tuple: (partition, rows)
+            - partition (str): Relative Hive path of the partition.
+            - rows (pa.RecordBatch): Rows of the batch in that partition.
+    """
+    dates = batch.column(dataset['date_column'])
+    keys = {name: batch.column(name) for name in dataset['partition_by']}
+    keys[DATASET_YEAR] = pc.year(dates)
+    keys[DATASET_MONTH] = pc.month(dates)
+    keys['__row'] = pa.array(range(batch.num_rows), type=pa.int64())
+
+    names = dataset_partition_columns(dataset)
+    groups = pa.table(keys).group_by(names).aggregate([('__row', 'list')])
+    for group in groups.to_pylist():
+        partition = partition_path(names, [group[name] for name in names])
+        yield partition, batch.take(pa.array(group['__row_list'], type=pa.int64()))
+
+
+def replace_dataset_files(dataset_path: str, table_name: str, run_id: str, window: tuple = None) -> None:
+    """
+    Deletes the files an earlier extraction of table_name wrote to a dataset.
+
+    Files belong to a table by the <table_name>-<run_id> prefix of their name.
+    A full extraction (no window) replaces all files of the table. An
+    extraction of a date window replaces the files in the partitions it wrote
+    and in the months the window covers.
+
+    Args:
+        dataset_path (str): Directory of the dataset.
+        table_name (str): Table whose files are replaced.
+        run_id (str): Id of the extraction that wrote the new files.
+        window (tuple): (start_date, end_date) of a date-paged extraction, as 'YYYY-MM-DD'.
+    """
+    written, previous = set(), []
+    for root, _, files in os.walk(dataset_path):
+        for file_name in files:
+            if not file_name.startswith(f"{table_name}-") or not file_name.endswith('.parquet'):
+                continue
+            if file_name.startswith(f"{table_name}-{run_id}"):
+                written.add(root)
+            else:
+                previous.append(os.path.join(root, file_name))
+
+    if window is not None:
+        first, last = ((int(day[:4]), int(day[5:7])) for day in window)
+
+    for file_path in previous:
+        root = os.path.dirname(file_path)
+        if window is not None and root not in written:
+            parts = dict(part.split('=', 1) for part in root.split(os.sep) if '=' in part)
+            year, month = parts.get(DATASET_YEAR), parts.get(DATASET_MONTH)
+            if not (year and month and year.isdigit() and month.isdigit()
+                    and first <= (int(year), int(month)) <= last):
+                continue
+        os.remove(file_path)
+        logger.debug(f"Deleted file: {file_path}", extra=throttled('deleted_file'))
+
+
+class BatchFingerprint:
+    """Streaming fingerprint of the record batches written by a sink.
+
+    Combines the row count with a BLAKE2 hash of the schema and of the Arrow
+    buffers of every batch, so it costs one pass over memory that is already
+    there. Equal data fetched the same way gives an equal fingerprint; a
+    difference in layout at worst gives a false "changed" and a reload.
+    """
+
+    def __init__(self, schema: pa.Schema):
+        self.rows = 0
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._hash.update(str(schema).encode())
+
+    def update(self, batch: pa.RecordBatch) -> None:
+        self.rows += batch.num_rows
+        for column in batch.columns:
+            self._update_array(column)
+
+    def _update_array(self, array: pa.Array) -> None:
+        if pa.types.is_dictionary(array.type):
+            self._update_array(array.indices)
+            self._update_array(array.dictionary)
+            return
+        for buffer in array.buffers():
+            if buffer is not None:
+                self._hash.update(buffer)
+
+    @property
+    def value(self) -> str:
+        return f"{self.rows}:{self._hash.hexdigest()}"
+
+
+def parquet_writer_options(schema: pa.Schema, write_options: dict) -> dict:
+    """
+    Keyword arguments of pq.ParquetWriter for the write options of a table.
+
+    Args:
+        schema (pa.Schema): Schema of the file.
+        write_options (dict): Write options of the table, see create_sink().
+    """
+    options = {key: write_options[key]
+               for key in ('compression', 'compression_level', 'use_dictionary')
+               if write_options.get(key) is not None}
+    sort_by = [column for column in write_options.get('sort_by') or [] if column in schema.names]
+    if sort_by:
+        options['sorting_columns'] = pq.SortingColumn.from_ordering(
+            schema, [(column, 'ascending') for column in sort_by])
+    return options
+
+
+class RowGroupWriter:
+    """Parquet writer that writes row groups of a fixed size, each sorted by the sort key.
+
+    Batches are buffered until row_group_size rows are collected, so the row
+    groups do not follow the fetch batch size. Every row group is sorted by
+    sort_by before it is written. Rows are not sorted across row groups, but
+    the date pages arrive in date order, so sorting by date first still gives
+    row groups with narrow min/max statistics. Without row_group_size every
+    batch is written (and sorted) as it arrives. Under a memory budget the
+    row groups are made smaller if the buffer would not fit
+    (el_memory.MemoryGovernor.row_group_rows()).
+    """
+
+    def __init__(self, path: str, schema: pa.Schema, write_options: dict = None):
+        write_options = write_options or {}
+        self.row_group_size = write_options.get('row_group_size')
+        self.sort_by = [(column, 'ascending')
+                        for column in write_options.get('sort_by') or [] if column in schema.names]
+        self.writer = pq.ParquetWriter(path, schema, **parquet_writer_options(schema, write_options))
+        self.buffer = []
+        self.buffered_rows = 0
+        self.sized = False  # row_group_size checked against the memory budget
+
+    def write_batch(self, batch: pa.RecordBatch) -> None:
+        if not self.row_group_size:
+            self._write_row_group(pa.Table.from_batches([batch]))
+            return
+        if not self.sized and batch.num_rows:
+            self.row_group_size = el_memory.governor.row_group_rows(batch.nbytes // batch.num_rows,
+                                                                    self.row_group_size)
+            self.sized = True
+
+        self.buffer.append(batch)
+        self.buffered_rows += batch.num_rows
+        while self.buffered_rows >= self.row_group_size:
+            buffered = pa.Table.from_batches(self.buffer)
+            self._write_row_group(buffered.slice(0, self.row_group_size))
+            rest = buffered.slice(self.row_group_size)
+            self.buffer = rest.to_batches()
+            self.buffered_rows = rest.num_rows
+
+    def _write_row_group(self, table: pa.Table) -> None:
+        if self.sort_by:
+            # Arrow cannot sort by dictionary columns, so they are sorted by their values
+            keys = pa.table({
+                column: (table.column(column).cast(table.schema.field(column).type.value_type)
+                         if pa.types.is_dictionary(table.schema.field(column).type) else table.column(column))
+                for column, _ in self.sort_by
+                })
+            table = table.take(pc.sort_indices(keys, sort_keys=self.sort_by))
+        self.writer.write_table(table, row_group_size=max(table.num_rows, 1))
+
+    def close(self, kv_metadata: dict = None) -> None:
+        """Writes the last, partial row group and the footer."""
+        if self.buffered_rows:
+            self._write_row_group(pa.Table.from_batches(self.buffer))
+        self.buffer, self.buffered_rows = [], 0
+        if kv_metadata:
+            self.writer.add_key_value_metadata(kv_metadata)
+        self.writer.close()
+
+    def abort(self) -> None:
+        """Closes the file without writing the buffered rows."""
+        self.buffer, self.buffered_rows = [], 0
+        self.writer.close()
+
+
+class BatchSink:
+    """Base class for destinations of the record batches streamed from SQL Server.
+
+    A sink is opened once with the cursor description, receives the batches
+    one at a time and is closed after the last one. Used as a context manager
+    it is closed on success and aborted on error, so a failed extraction does
+    not leave a partial output behind.
+    """
+
+    def __init__(self, table_name: str, data_dir: str, temp_dir: str, write_options: dict = None):
+        self.table_name = table_name
+        self.data_dir = data_dir
+        self.temp_dir = temp_dir
+        self.write_options = write_options or {}
+        self.schema = None
+        self.described = False  # schema from el_schema instead of the cursor type codes
+        self.encoders = {}  # el_arrow.DictionaryEncoder of every dictionary column
+        self.fingerprint = None
+        self.reconciliation = None  # el_reconcile.ReconciliationStats with a 'reconcile' write option
+        self.rows_written = 0
+        self.bytes_written = 0
+
+    @property
+    def output_path(self) -> str:
+        """Path of the Parquet file produced by the sink."""
+        return os.path.join(self.data_dir, f"{self.table_name}.parquet")
+
+    def open(self, headers: list, data_types: list, schema: pa.Schema = None, sample: list = None) -> None:
+        """
+        Prepares the sink for the columns described by the cursor, or by the exact schema if given.
+
+        Low-cardinality string columns are built as dictionary arrays (see
+        dictionary_columns()), with their values interned over all batches.
+        """
+        self.described = schema is not None
+        if schema is None:
+            schema = el_arrow.build_arrow_schema(headers=headers, data_types=data_types)
+        self.schema = el_arrow.with_dictionary_columns(schema, self.dictionary_columns(schema, sample or []))
+        self.encoders = {field.name: el_arrow.DictionaryEncoder()
+                         for field in self.schema if pa.types.is_dictionary(field.type)}
+        self.fingerprint = BatchFingerprint(self.schema)
+        if self.write_options.get('reconcile'):
+            self.reconciliation = el_reconcile.ReconciliationStats(self.schema, self.write_options['reconcile'])
+
+    def dictionary_columns(self, schema: pa.Schema, sample: list) -> list:
+        """
+        String columns built as dictionary arrays.
+
+        A 'use_dictionary' list in the write options names them, as the
+        columns dictionary encoded in Parquet are the low-cardinality ones.
+        With use_dictionary False there are none, otherwise they are picked
+        from a sample of the rows (el_arrow.sample_dictionary_columns()).
+        """
+        use_dictionary = self.write_options.get('use_dictionary', True)
+        if use_dictionary is False:
+            return []
+        if use_dictionary is not True:
+            return list(use_dictionary)
+        return el_arrow.sample_dictionary_columns(sample, schema)
+
+    def write_batch(self, batch: pa.RecordBatch) -> None:
+        """Casts a record batch to the mapped target types, writes it and adds it to the fingerprint and statistics."""
+        if batch.schema != self.schema:
+            batch = batch.cast(self.schema)
+        self.fingerprint.update(batch)
+        if self.reconciliation is not None:
+            self.reconciliation.update(batch)
+        self._write_batch(batch)
+        self.rows_written += batch.num_rows
+        self.bytes_written += batch.nbytes
+
+    def _write_batch(self, batch: pa.RecordBatch) -> None:
+        raise NotImplementedError
+
+    def footer_metadata(self) -> dict:
+        """Key-value metadata of the Parquet footer: the fingerprint and the reconciliation statistics."""
+        metadata = {FINGERPRINT_KEY: self.fingerprint.value}
+        if self.reconciliation is not None:
+            metadata[el_reconcile.RECONCILIATION_KEY] = self.reconciliation.to_json()
+        return metadata
+
+    def close(self) -> None:
+        """Finalizes the output after the last batch."""
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        """Removes any partial output after an error."""
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            with el_metrics.stage(el_metrics.STAGE_FINALIZE) as timer:
+                self.close()
+                timer.add(rows=self.rows_written, nbytes=self.bytes_written)
+        else:
+            self.abort()
+
+
+class ParquetWriterSink(BatchSink):
+    """Appends record batches straight to a Parquet file with pyarrow.
+
+    Batches are written as they arrive, so the data is written to disk once and no temporary database is
+    needed. The file is written under a temporary name and renamed when the
+    sink is closed. Row groups, sort order and encoding follow the write
+    options, see RowGroupWriter.
+    """
+
+    def __init__(self, table_name: str, data_dir: str, temp_dir: str, write_options: dict = None):
+        super().__init__(table_name, data_dir, temp_dir, write_options)
+        self.writer = None
+
+    @property
+    def partial_path(self) -> str:
+        return f"{self.output_path}.part"
+
+    def open(self, headers: list, data_types: list, schema: pa.Schema = None, sample: list = None) -> None:
+        super().open(headers, data_types, schema, sample)
+        self.writer = RowGroupWriter(self.partial_path, self.schema, self.write_options)
+
+    def _write_batch(self, batch: pa.RecordBatch) -> None:
+        self.writer.write_batch(batch)
+
+    def close(self) -> None:
+        if self.writer is None:
+            logger.warning(f"No data was written for table {self.table_name}")
+            return
+        self.writer.close(kv_metadata=self.footer_metadata())
+        os.replace(self.partial_path, self.output_path)
+        logger.info(f"Table {self.table_name} written to {self.output_path} ({self.rows_written} rows)")
+
+    def abort(self) -> None:
+        if self.writer is not None:
+            self.writer.abort()
+        if os.path.isfile(self.partial_path):
+            os.remove(self.partial_path)
+            logger.info(f"Deleted file: {self.partial_path}")
+
+
+class ParquetDatasetSink(BatchSink):
+    """Writes record batches into a Hive-partitioned Parquet dataset shared by several tables.
+
+    The dataset is partitioned by the dataset's partition_by columns and by the
+    year and month of its date column, e.g.
+    <data_dir>/accounts_47/firma=.../year=2024/month=3/<table>-<run>.parquet.
+    Partition columns are stored in the directory names only. Every partition
+    written gets its own file, written under a temporary name. On close the
+    files are renamed and the files of earlier extractions of the same table
+    are replaced (see replace_dataset_files()), so the tables of the other
+    companies in the dataset are left alone.
+    """
+
+    def __init__(self, table_name: str, data_dir: str, temp_dir: str, dataset: dict, write_options: dict = None):
+        super().__init__(table_name, data_dir, temp_dir, write_options)
+        self.dataset = dataset
+        self.run_id = uuid.uuid4().hex[:12]
+        self.file_schema = None
+        self.writers = {}  # partition -> RowGroupWriter
+
+    @property
+    def output_path(self) -> str:
+        return dataset_dir(self.data_dir, self.dataset)
+
+    def file_path(self, partition: str) -> str:
+        return os.path.join(self.output_path, partition, f"{self.table_name}-{self.run_id}.parquet")
+
+    def open(self, headers: list, data_types: list, schema: pa.Schema = None, sample: list = None) -> None:
+        super().open(headers, data_types, schema, sample)
+        partition_by = self.dataset['partition_by']
+        self.file_schema = pa.schema([field for field in self.schema if field.name not in partition_by])
+
+    def _write_batch(self, batch: pa.RecordBatch) -> None:
+        for partition, rows in split_batch_by_partition(batch, self.dataset):
+            writer = self.writers.get(partition)
+            if writer is None:
+                partial_path = f"{self.file_path(partition)}.part"
+                os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+                writer = self.writers[partition] = RowGroupWriter(partial_path, self.file_schema,
+                                                                  self.write_options)
+            writer.write_batch(rows.select(self.file_schema.names))
+
+    def close(self) -> None:
+        if self.schema is None:
+            logger.warning(f"No data was written for table {self.table_name}")
+            return
+        for partition, writer in self.writers.items():
+            writer.close()
+            os.replace(f"{self.file_path(partition)}.part", self.file_path(partition))
+        replace_dataset_files(self.output_path, self.table_name, self.run_id, self.dataset.get('window'))
+        logger.info(f"Table {self.table_name} written to {len(self.writers)} partitions "
+                    f"of {self.output_path} ({self.rows_written} rows)")
+
+    def abort(self) -> None:
+        for partition, writer in self.writers.items():
+            writer.abort()
+            partial_path = f"{self.file_path(partition)}.part"
+            if os.path.isfile(partial_path):
+                os.remove(partial_path)
+                logger.debug(f"Deleted file: {partial_path}", extra=throttled('deleted_file'))
+
+
+class DuckDBStagingSink(BatchSink):
+    """Stages record batches in a temporary DuckDB database and exports it to Parquet.
+
+    This is the original extraction path: the batches are inserted into
+    temp/<table>.duckdb and the table is copied to Parquet on close. With a
+    dataset the table is copied into the partitions of the dataset instead,
+    replacing the files of earlier extractions as ParquetDatasetSink does.
+    """
+
+    def __init__(self,
+                 table_name: str,
+                 data_dir: str,
+                 temp_dir: str,
+                 dataset: dict = None,
+                 write_options: dict = None):
+        super().__init__(table_name, data_dir, temp_dir, write_options)
+        self.temp_db = os.path.join(temp_dir, f"{table_name}.duckdb")
+        self.duck_conn = None
+        self.dataset = dataset
+        self.run_id = uuid.uuid4().hex[:12]
+
+    @property
+    def output_path(self) -> str:
+        if self.dataset is not None:
+            return dataset_dir(self.data_dir, self.dataset)
+        return super().output_path
+
+    def open(self, headers: list, data_types: list, schema: pa.Schema = None, sample: list = None) -> None:
+        super().open(headers, data_types, schema, sample)
+
+        if os.path.exists(self.temp_db):
+            os.remove(self.temp_db)  # Remove temp database if it exists
+            logger.info(f"Deleted pre-existing temp database: {self.temp_db}")
+
+        self.duck_conn = duckdb.connect(database=self.temp_db)
+        el_memory.governor.configure_duckdb(self.duck_conn, self.temp_dir)
+        if self.described:
+            el_func.create_table_from_arrow_schema(
+                duck_conn=self.duck_conn,
+                table_name=self.table_name,
+                schema=self.schema
+            )
+            return
+        el_func.create_table_from_cursor_mapping(
+            duck_conn=self.duck_conn,
+            table_name=self.table_name,
+            headers=headers,
+            data_types=data_types,
+            sql_dtypes=MSSQL_TO_DUCKDB_MAP
+        )
+
+    def _write_batch(self, batch: pa.RecordBatch) -> None:
+        el_func.insert_arrow_to_duckdb(
+            duck_conn=self.duck_conn,
+            table_name=self.table_name,
+            arrow_table=batch
+            )
+
+    def close(self) -> None:
+        if self.duck_conn is None:
+            logger.warning(f"No data was written for table {self.table_name}")
+            return
+        try:
+            if self.dataset is None:
+                el_func.export_to_parquet(
+                    duck_conn=self.duck_conn,
+                    table_name=self.table_name,
+                    output_path=self.data_dir,
+                    kv_metadata=self.footer_metadata(),
+                    write_options=self.write_options)
+            else:
+                el_func.export_to_parquet(
+                    duck_conn=self.duck_conn,
+                    table_name=self.table_name,
+                    output_path=self.output_path,
+                    partition_by=self.dataset['partition_by'],
+                    date_column=self.dataset['date_column'],
+                    file_prefix=f"{self.table_name}-{self.run_id}",
+                    write_options=self.write_options)
+                replace_dataset_files(self.output_path, self.table_name, self.run_id, self.dataset.get('window'))
+        finally:
+            self._drop_temp_db()
+
+    def abort(self) -> None:
+        self._drop_temp_db()
+
+    def _drop_temp_db(self) -> None:
+        if self.duck_conn is not None:
+            self.duck_conn.close()
+            self.duck_conn = None
+        if os.path.isfile(self.temp_db):
+            os.remove(self.temp_db)
+            logger.info(f"Deleted file: {self.temp_db}")
+
+
+SINKS = {
+    SINK_PARQUET: ParquetWriterSink,
+    SINK_DUCKDB: DuckDBStagingSink,
+}
+
+
+def create_sink(sink_type: str,
+                table_name: str,
+                data_dir: str,
+                temp_dir: str,
+                dataset: dict = None,
+                write_options: dict = None,
+                loader=None,
+                delta_window: dict = None) -> BatchSink:
+    """
+    Creates a sink by name.
+
+    Args:
+        sink_type (str): One of SINKS ('parquet' or 'duckdb'), or 'postgres' to
+            stream the batches straight into the warehouse through the loader.
+        table_name (str): Name of the target table.
+        data_dir (str): Directory of the Parquet output.
+        temp_dir (str): Directory for temporary files.
+        dataset (dict): Writes into a partitioned dataset instead of <table_name>.parquet:
+            'name' (directory in data_dir), 'partition_by' (list of columns),
+            'date_column' (partitioned by its year and month) and optionally
+            'window' ((start_date, end_date) of a date-paged extraction).
+        write_options (dict): Parquet write options of the table, all optional:
+            'compression' (codec, e.g. 'zstd'), 'compression_level',
+            'row_group_size' (rows), 'use_dictionary' (bool or list of columns,
+            honoured by the pyarrow sinks only), 'sort_by' (list of columns) and
+            'reconcile' (reconciliation statistics written to the footer of a
+            single file output, see el_reconcile.ReconciliationStats).
+        loader (ParquetPostgresLoader): Loader of the 'postgres' sink.
+        delta_window (dict): Window the 'postgres' sink replaces in the table
+            ('column', 'start_date', 'end_date'), None to replace the table.
+    """
+    if sink_type == SINK_POSTGRES:
+        if loader is None or dataset is not None:
+            raise ValueError("The 'postgres' sink needs a loader and does not write a dataset")
+        return loader.stream_sink(table_name=table_name,
+                                  data_dir=data_dir,
+                                  temp_dir=temp_dir,
+                                  write_options=write_options,
+                                  delta_window=delta_window)
+    if sink_type not in SINKS:
+        raise ValueError(f"Unknown sink type '{sink_type}', expected one of {list(SINKS)}")
+    options = {'table_name': table_name, 'data_dir': data_dir, 'temp_dir': temp_dir, 'write_options': write_options}
+    if dataset is None:
+        return SINKS[sink_type](**options)
+    if sink_type == SINK_PARQUET:
+        return ParquetDatasetSink(dataset=dataset, **options)
+    return SINKS[sink_type](dataset=dataset, **options)
+
+
+def combined_fingerprint(paths: list) -> str:
+    """Fingerprint of an output built from several Parquet files, from their fingerprints in the order given."""
+    rows, fingerprints = 0, hashlib.blake2b(digest_size=16)
+    for path in paths:
+        metadata = pq.read_metadata(path)
+        rows += metadata.num_rows
+        fingerprints.update((metadata.metadata or {}).get(FINGERPRINT_KEY.encode(), b''))
+    return f"{rows}:{fingerprints.hexdigest()}"
+
+
+def export_view(duck_conn: duckdb.DuckDBPyConnection,
+                table_name: str,
+                data_dir: str,
+                dataset: dict = None,
+                write_options: dict = None,
+                fingerprint: str = None,
+                reconciliation: dict = None) -> int:
+    """
+    Writes a DuckDB view or table to the output of a table, as the sinks do.
+
+    Without a dataset the view is written to <data_dir>/<table_name>.parquet
+    with the fingerprint and the reconciliation statistics in its footer.
+    With a dataset it is written into the partitions of the dataset and the
+    earlier files of the table are replaced (see replace_dataset_files()).
+
+    Returns:
+        int: Number of rows written.
+    """
+    if dataset is None:
+        kv_metadata = {}
+        if fingerprint:
+            kv_metadata[FINGERPRINT_KEY] = fingerprint
+        if reconciliation:
+            kv_metadata[el_reconcile.RECONCILIATION_KEY] = json.dumps(reconciliation, ensure_ascii=False)
+        return el_func.export_to_parquet(
+            duck_conn=duck_conn,
+            table_name=table_name,
+            output_path=data_dir,
+            kv_metadata=kv_metadata or None,
+            write_options=write_options)
+
+    run_id = uuid.uuid4().hex[:12]
+    rows = el_func.export_to_parquet(
+        duck_conn=duck_conn,
+        table_name=table_name,
+        output_path=dataset_dir(data_dir, dataset),
+        partition_by=dataset['partition_by'],
+        date_column=dataset['date_column'],
+        file_prefix=f"{table_name}-{run_id}",
+        write_options=write_options)
+    replace_dataset_files(dataset_dir(data_dir, dataset), table_name, run_id, dataset.get('window'))
+    return rows
+
+
+def merge_parquet_parts(part_paths: list,
+                        table_name: str,
+                        data_dir: str,
+                        temp_dir: str,
+                        dataset: dict = None,
+                        write_options: dict = None) -> int:
+    """
+    Merges the Parquet parts written by the slices of one table into its output.
+
+    The parts are read by an in-memory DuckDB database, which spills to
+    temp_dir, and written to <table_name>.parquet or into the partitions of
+    a dataset (replacing all earlier files of the table), in the sort order
+    of write_options. The fingerprint of the merged file combines the
+    fingerprints of the parts, so equal slices give an equal fingerprint.
+
+    Args:
+        part_paths (list): Parquet files of the slices, in slice order.
+            Slices without rows may have written no file.
+        table_name (str): Name of the target table.
+        data_dir (str): Directory of the Parquet output.
+        temp_dir (str): Directory for temporary files.
+        dataset (dict): Dataset layout, see create_sink().
+        write_options (dict): Parquet write options, see create_sink().
+
+    Returns:
+        int: Number of rows merged.
+    """
+    part_paths = [path for path in part_paths if os.path.isfile(path)]
+    if not part_paths:
+        logger.warning(f"No data was written for table {table_name}")
+        return 0
+
+    parts = ', '.join(f"'{path}'" for path in part_paths)
+    with el_metrics.stage(el_metrics.STAGE_FINALIZE) as timer, duckdb.connect() as duck_conn:
+        el_memory.governor.configure_duckdb(duck_conn, temp_dir)
+        duck_conn.execute(f"CREATE VIEW {table_name} AS SELECT * FROM read_parquet([{parts}])")
+        rows = export_view(duck_conn, table_name, data_dir, dataset, write_options,
+                           combined_fingerprint(part_paths),
+                           el_reconcile.combine_stats([el_reconcile.read_stats(path) for path in part_paths]))
+        timer.add(rows=rows)
+
+    logger.info(f"Merged {len(part_paths)} parts of table {table_name} ({rows} rows)")
+    return rows
+
+
+def join_dimensions(fact_path: str,
+                    dimension_paths: dict,
+                    join_query: str,
+                    table_name: str,
+                    data_dir: str,
+                    temp_dir: str,
+                    dataset: dict = None,
+                    write_options: dict = None) -> int:
+    """
+    Rebuilds the denormalized rows of a table from its fact rows and dimension tables.
+
+    The fact rows and every dimension are exposed to an in-memory DuckDB
+    database as views named 'facts' and after the dimension, join_query
+    (DuckDB SQL over those views) gives the rows of the table, which are
+    written like a sink would (see export_view()). The fingerprint combines
+    the fingerprints of the facts and of the dimensions.
+
+    Args:
+        fact_path (str): Parquet file of the fact rows; missing if there were none.
+        dimension_paths (dict): Parquet file of every dimension, by view name.
+        join_query (str): SELECT over the view facts and the dimension views.
+        table_name (str): Name of the target table.
+        data_dir (str): Directory of the Parquet output.
+        temp_dir (str): Directory for temporary files.
+        dataset (dict): Dataset layout, see create_sink().
+        write_options (dict): Parquet write options, see create_sink().
+
+    Returns:
+        int: Number of rows written.
+    """
+    if not os.path.isfile(fact_path):
+        logger.warning(f"No data was written for table {table_name}")
+        return 0
+
+    with el_metrics.stage(el_metrics.STAGE_FINALIZE) as timer, duckdb.connect() as duck_conn:
+        el_memory.governor.configure_duckdb(duck_conn, temp_dir)
+        duck_conn.execute(f"CREATE VIEW facts AS SELECT * FROM read_parquet('{fact_path}')")
+        for name, path in dimension_paths.items():
+            duck_conn.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{path}')")
+        duck_conn.execute(f"CREATE VIEW {table_name} AS {join_query}")
+        rows = export_view(duck_conn, table_name, data_dir, dataset, write_options,
+                           combined_fingerprint([fact_path, *dimension_paths.values()]),
+                           el_reconcile.read_stats(fact_path))
+        timer.add(rows=rows)
+
+    logger.info(f"Joined table {table_name} with dimensions {list(dimension_paths)} ({rows} rows)")
+    return rows
@@ -0,0 +1,49 @@
+import json
+import os
+import threading
+from repositorium.logger import logger
+
+
+class JsonStateStore:
+    """Small persistent key-value store kept in a JSON file.
+
+    Used for state that has to survive between runs (watermarks, fingerprints).
+    Every update rewrites the file atomically, so a crash never leaves a
+    half-written state behind. Safe to share between threads of one process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = self._read()
+
+    def _read(self) -> dict:
+        if not os.path.isfile(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        partial_path = f"{self.path}.part"
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2, ensure_ascii=False, default=str)
+        os.replace(partial_path, self.path)
+
+    def get(self, key: str, default=None):
+        """Returns the value stored under key."""
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key: str, value) -> None:
+        """Stores a JSON serializable value under key and saves the file."""
+        with self._lock:
+            self._data[key] = value
+            self._write()
+        logger.debug(f"State {self.path}: {key} = {value}")
+
+    def delete(self, key: str) -> None:
+        """Removes key from the store and saves the file."""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._write()
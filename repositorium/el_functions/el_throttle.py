@@ -0,0 +1,165 @@
+import random
+import time
+import pymssql
+from repositorium.logger import logger, throttled
+from repositorium.el_functions import el_metrics
+
+THROTTLE_ADAPTIVE = 'adaptive'
+THROTTLE_FIXED = 'fixed'
+THROTTLE_OFF = 'off'
+
+# SQL Server / FreeTDS error numbers
+TIMEOUT_ERRORS = {
+    -2,     # query timeout
+    20003,  # Adaptive Server connection timed out
+}
+TRANSIENT_ERRORS = TIMEOUT_ERRORS | {
+    233,    # no process is on the other end of the pipe
+    1205,   # deadlock victim
+    4060,   # cannot open database
+    10053,  # connection aborted
+    10054,  # connection reset by peer
+    20004,  # read from the server failed
+    20006,  # write to the server failed
+    20009,  # unable to connect
+    20047,  # DBPROCESS is dead or not enabled
+    40197,  # service error processing the request
+    40501,  # service busy
+    40613,  # database not currently available
+}
+FATAL_ERRORS = {
+    229,    # permission denied
+    245,    # conversion failed
+    8115,   # arithmetic overflow
+    8134,   # divide by zero
+    18456,  # login failed
+}
+
+# Errors in the query or the data, retrying gives the same result
+FATAL_EXCEPTIONS = (
+    pymssql.ProgrammingError,
+    pymssql.IntegrityError,
+    pymssql.DataError,
+    pymssql.NotSupportedError,
+)
+
+
+def sql_error_number(exc: Exception) -> int:
+    """Returns the SQL Server error number of a pymssql exception, or None."""
+    args = exc.args
+    if args and isinstance(args[0], tuple):
+        args = args[0]
+    if args and isinstance(args[0], int):
+        return args[0]
+    return None
+
+
+def is_timeout_error(exc: Exception) -> bool:
+    """True if the exception is a query or connection timeout."""
+    return isinstance(exc, TimeoutError) or sql_error_number(exc) in TIMEOUT_ERRORS
+
+
+def is_transient_error(exc: Exception) -> bool:
+    """
+    Tells transient errors, worth a retry, from fatal ones.
+
+    Syntax, permission, integrity and data errors are fatal. Timeouts,
+    deadlocks and lost connections are transient, as is any other
+    operational error that is not known to be fatal.
+    """
+    if isinstance(exc, FATAL_EXCEPTIONS):
+        return False
+
+    number = sql_error_number(exc)
+    if number in FATAL_ERRORS:
+        return False
+    if number in TRANSIENT_ERRORS:
+        return True
+
+    return isinstance(exc, (pymssql.OperationalError,
+                            pymssql.InterfaceError,
+                            ConnectionError,
+                            TimeoutError))
+
+
+class ThrottlePolicy:
+    """Pause between queries, to stay polite to the ERP server.
+
+    'adaptive' pauses for factor times the duration of the last query,
+    bounded by min_pause and max_pause, so a busy server gets more time to
+    recover and a quick query costs almost no idle time. 'fixed' always
+    pauses for pause seconds and 'off' never pauses.
+    """
+
+    def __init__(self,
+                 mode: str = THROTTLE_ADAPTIVE,
+                 pause: float = 5,
+                 factor: float = 0.25,
+                 min_pause: float = 0,
+                 max_pause: float = 30):
+        if mode not in (THROTTLE_ADAPTIVE, THROTTLE_FIXED, THROTTLE_OFF):
+            raise ValueError(f"Unknown throttle mode '{mode}'")
+        self.mode = mode
+        self.pause = pause
+        self.factor = factor
+        self.min_pause = min_pause
+        self.max_pause = max_pause
+
+    def pause_after(self, response_seconds: float) -> float:
+        """Returns the pause in seconds after a query that took response_seconds."""
+        if self.mode == THROTTLE_OFF:
+            return 0
+        if self.mode == THROTTLE_FIXED:
+            return self.pause
+        return min(self.max_pause, max(self.min_pause, response_seconds * self.factor))
+
+    def wait(self, response_seconds: float) -> None:
+        """Sleeps for the pause after a query that took response_seconds."""
+        pause = self.pause_after(response_seconds)
+        if pause > 0:
+            logger.info(f'Start pause {pause:.1f} sek. (query took {response_seconds:.1f} sek.)',
+                        extra=throttled(('pause', id(self))))
+            with el_metrics.stage(el_metrics.STAGE_THROTTLE):
+                time.sleep(pause)
+
+
+class RetryPolicy:
+    """Retries with jittered exponential backoff.
+
+    The n-th retry waits base_delay * 2 ** (n - 1) seconds, capped at
+    max_delay and scaled by a random factor between 0.5 and 1.5, so
+    several workers failing together do not retry in lockstep.
+    """
+
+    def __init__(self,
+                 max_retries: int = 3,
+                 base_delay: float = 30,
+                 max_delay: float = 300,
+                 jitter: bool = True,
+                 retry_timeouts: bool = True):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retry_timeouts = retry_timeouts
+
+    def without_timeouts(self) -> 'RetryPolicy':
+        """Returns a copy of the policy that does not retry timeouts."""
+        return RetryPolicy(max_retries=self.max_retries,
+                           base_delay=self.base_delay,
+                           max_delay=self.max_delay,
+                           jitter=self.jitter,
+                           retry_timeouts=False)
+
+    def delay(self, attempt: int) -> float:
+        """Returns the wait in seconds before the retry following a failed attempt (1-based)."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if self.jitter:
+            delay *= random.uniform(0.5, 1.5)
+        return delay
+
+    def should_retry(self, exc: Exception, attempt: int) -> bool:
+        """True if a failed attempt (1-based) should be retried."""
+        if not self.retry_timeouts and is_timeout_error(exc):
+            return False
+        return attempt < self.max_retries and is_transient_error(exc)
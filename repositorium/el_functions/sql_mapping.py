@@ -1,3 +1,5 @@
+import pyarrow as pa
+
 # MS SQL Server → DuckDB Mapping
 MSSQL_TO_DUCKDB_MAP = {
     -7: "BOOLEAN",       # BIT
@@ -6,4 +8,14 @@ MSSQL_TO_DUCKDB_MAP = {
     3: "INTEGER",        # INT 
     4: "DATETIME",
     5: "DECIMAL(38,20)", # DECIMAL
-}
\ No newline at end of file
+}
+
+# MS SQL Server → Arrow Mapping (same target types as MSSQL_TO_DUCKDB_MAP)
+MSSQL_TO_ARROW_MAP = {
+    -7: pa.bool_(),             # BIT
+    1: pa.string(),
+    2: pa.date32(),
+    3: pa.int32(),              # INT
+    4: pa.timestamp("us"),      # DATETIME
+    5: pa.decimal128(38, 20),   # DECIMAL
+}
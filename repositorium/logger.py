@@ -1,5 +1,11 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
 
 # Configurable log level
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
@@ -8,25 +14,145 @@ LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
 LOG_FORMAT = "%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s - %(lineno)d - %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# Records waiting for the writer thread; when the queue is full, records below WARNING are dropped
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# A throttled message is logged at most once per LOG_THROTTLE_SECONDS, see throttled()
+LOG_THROTTLE_SECONDS = float(os.getenv('LOG_THROTTLE_SECONDS', '10'))
+
+# Attributes of every LogRecord, the others come from extra= and are written as fields
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line, with the fields passed in extra= next to the message."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, DATE_FORMAT),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'file': record.filename,
+            'function': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items()
+                      if key not in RECORD_ATTRIBUTES and not key.startswith('_')})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ThrottleFilter(logging.Filter):
+    """Rate limit of the messages logged inside loops.
+
+    A record logged with extra=throttled(key) passes at most once per
+    interval for its key; the ones in between are counted and the count is
+    added to the next record of the key that passes. Records without a key
+    always pass.
+    """
+
+    def __init__(self, interval: float = LOG_THROTTLE_SECONDS):
+        super().__init__()
+        self.interval = interval
+        self.last = {}  # key -> (time of the last record passed, records suppressed since)
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'throttle', None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            passed, suppressed = self.last.get(key, (None, 0))
+            if passed is not None and now - passed < self.interval:
+                self.last[key] = (passed, suppressed + 1)
+                return False
+            self.last[key] = (now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+def throttled(key, **fields) -> dict:
+    """extra= of a message logged at most once per LOG_THROTTLE_SECONDS for key, with optional fields."""
+    return {'throttle': str(key), **fields}
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread without waiting for it.
+
+    The message and the traceback are formatted in the logging thread, so the
+    record does not hold the arguments or the frames. When the queue is full
+    records below WARNING are dropped and counted, the others wait for room.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # The count is taken over by this record; the lock is not held while waiting for room
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            record.dropped = dropped  # reported with the next record that gets through
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                with self._dropped_lock:
+                    self.dropped += dropped + 1  # this record and the ones it was to report
+                return
+            self.queue.put(record)
+
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener whose stop() waits for room in a full queue, so the queued records are written."""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
 # Create logger
 logger = logging.getLogger("ETL_Logger")
 logger.setLevel(getattr(logging, LOG_LEVEL, logging.DEBUG))  # Default DEBUG
+logger.propagate = False
+logger.addFilter(ThrottleFilter())
 
 # Console handler
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 console_formatter = logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
 console_handler.setFormatter(console_formatter)
-logger.addHandler(console_handler)
 
-# File handler
+# File handler, one JSON record per line
 log_dir = "/app/logs" if os.getenv('ENV') == 'production' else "./logs"
 os.makedirs(log_dir, exist_ok=True)
 
 file_handler = logging.FileHandler(f"{log_dir}/etl.log", encoding="utf-8")
 file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(console_formatter)
-logger.addHandler(file_handler)
+file_handler.setFormatter(JsonFormatter())
+
+# The threads only put records on the queue, a listener thread writes them to the handlers
+queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+logger.addHandler(queue_handler)
+listener = DrainingQueueListener(queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)  # writes the records still queued at exit
 
 def log_exception(exc):
     """Logs exceptions with traceback"""
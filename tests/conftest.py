@@ -0,0 +1,75 @@
+"""
+Shared fixtures.
+
+The loader tests need a throwaway Postgres database, given as a libpq
+connection string in ETL_TEST_POSTGRES, and are skipped without it:
+
+    docker compose --profile test up -d postgres_test
+    ETL_TEST_POSTGRES="host=localhost port=5433 user=postgres password=postgres dbname=postgres" pytest
+"""
+import logging
+import os
+import uuid
+import pytest
+from repositorium.logger import logger, ThrottleFilter
+from repositorium.el_functions.el_loader import ParquetPostgresLoader, sql_literal
+
+POSTGRES_ENV = 'ETL_TEST_POSTGRES'
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+@pytest.fixture
+def log_records():
+    """Records that pass the ETL logger's filters, as the handlers receive them."""
+    for log_filter in logger.filters:
+        if isinstance(log_filter, ThrottleFilter):
+            log_filter.last.clear()
+    handler = ListHandler()
+    logger.addHandler(handler)
+    yield handler.records
+    logger.removeHandler(handler)
+
+
+@pytest.fixture
+def postgres():
+    """Connection string of the test database."""
+    dsn = os.getenv(POSTGRES_ENV)
+    if not dsn:
+        pytest.skip(f"{POSTGRES_ENV} is not set")
+    return dsn
+
+
+@pytest.fixture
+def make_loader(postgres):
+    """Creates ParquetPostgresLoaders on the test database, closed after the test."""
+    loaders = []
+
+    def make(**kwargs) -> ParquetPostgresLoader:
+        loader = ParquetPostgresLoader(
+            attach_string=f"ATTACH {sql_literal(postgres)} AS st_db (TYPE POSTGRES, SCHEMA 'public');",
+            db_alias='st_db',
+            **kwargs)
+        loaders.append(loader)
+        return loader
+
+    yield make
+    for loader in loaders:
+        loader.close()
+
+
+@pytest.fixture
+def table_name(make_loader):
+    """Name of a table of its own for the test, dropped with everything on it afterwards."""
+    name = f"accounts_test_{uuid.uuid4().hex[:8]}"
+    yield name
+    loader = make_loader()
+    with loader.connection() as conn:
+        loader.postgres_execute(conn, f'DROP TABLE IF EXISTS "{name}", "{name}__staging", "{name}__old" CASCADE;')
@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from benchmarks.duckdb_target import DuckDBTargetLoader
+
+
+def write_file(path, rows: int) -> str:
+    pq.write_table(pa.table({
+        'Data': pa.array([date(2024, 1, 1) + timedelta(days=i % 60) for i in range(rows)], pa.date32()),
+        'n': pa.array(range(rows), pa.int64()),
+    }), path)
+    return str(path)
+
+
+def test_concurrent_loads_share_one_database(tmp_path):
+    database = str(tmp_path / 'target.duckdb')
+    files = [write_file(tmp_path / f'table_{i}.parquet', rows=1_000 + i) for i in range(8)]
+
+    with DuckDBTargetLoader(database, max_workers=4) as loader:
+        for _ in range(3):
+            stats, failed = loader.load_files(files)
+            assert not failed
+
+    with duckdb.connect(database, read_only=True) as conn:
+        for i in range(8):
+            assert conn.execute(f"SELECT count(*) FROM table_{i}").fetchone()[0] == 1_000 + i
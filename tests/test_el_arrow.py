@@ -0,0 +1,108 @@
+from datetime import date, datetime
+from decimal import Decimal
+import pyarrow as pa
+from repositorium.el_functions import el_arrow
+
+
+HEADERS = ['Data', 'Symbol', 'Kwota', 'Dzien', 'Ilosc', 'Aktywny']
+DATA_TYPES = [4, 1, 5, 2, 3, -7]
+ROWS = [
+    (datetime(2024, 3, 1, 12, 30), '401-01', Decimal('12.50'), date(2024, 3, 1), 3, True),
+    (datetime(2024, 3, 2), None, None, None, None, None),
+    (datetime(2024, 3, 3), '702-01', Decimal('-0.01'), date(2024, 3, 3), -7, False),
+]
+
+
+def test_build_arrow_schema_maps_type_codes():
+    schema = el_arrow.build_arrow_schema(HEADERS + ['Inny'], DATA_TYPES + [99])
+
+    assert schema.names == HEADERS + ['Inny']
+    assert schema.types == [pa.timestamp('us'), pa.string(), pa.decimal128(38, 20), pa.date32(),
+                            pa.int32(), pa.bool_(), pa.string()]
+
+
+def test_rows_to_record_batch_builds_declared_types():
+    schema = el_arrow.build_arrow_schema(HEADERS, DATA_TYPES)
+
+    batch = el_arrow.rows_to_record_batch(ROWS, schema)
+
+    assert batch.schema == schema
+    assert batch.to_pylist()[0] == {
+        'Data': datetime(2024, 3, 1, 12, 30), 'Symbol': '401-01', 'Kwota': Decimal('12.50'),
+        'Dzien': date(2024, 3, 1), 'Ilosc': 3, 'Aktywny': True}
+    assert batch.column('Kwota').null_count == 1
+    assert batch.column('Kwota')[2].as_py() == Decimal('-0.01')
+
+
+def test_rows_to_record_batch_without_rows():
+    schema = el_arrow.build_arrow_schema(HEADERS, DATA_TYPES)
+
+    batch = el_arrow.rows_to_record_batch([], schema)
+
+    assert batch.num_rows == 0
+    assert batch.schema == schema
+
+
+def test_column_to_arrow_infers_type_of_values_that_do_not_fit(log_records):
+    for _ in range(3):
+        array = el_arrow.column_to_arrow(['1', 'x'], pa.int32())
+
+    assert array.type == pa.string()
+    warnings = [record for record in log_records if 'inferring type' in record.getMessage()]
+    assert len(warnings) == 1  # the fallback of every batch is throttled
+
+
+def test_sample_dictionary_columns_picks_low_cardinality_strings():
+    rows = [(f'name {i}', 'PLN' if i % 3 else 'EUR', i) for i in range(el_arrow.DICTIONARY_MIN_SAMPLE_ROWS)]
+    schema = pa.schema([('name', pa.string()), ('currency', pa.string()), ('n', pa.int32())])
+
+    assert el_arrow.sample_dictionary_columns(rows, schema) == ['currency']
+    assert el_arrow.sample_dictionary_columns(rows[:10], schema) == []
+
+    dictionary_schema = el_arrow.with_dictionary_columns(schema, ['currency', 'n'])
+    assert dictionary_schema.field('currency').type == el_arrow.DICTIONARY_TYPE
+    assert dictionary_schema.field('n').type == pa.int32()
+
+
+def test_dictionary_encoder_keeps_codes_across_batches():
+    encoder = el_arrow.DictionaryEncoder()
+
+    first = encoder.encode(['PLN', 'EUR', None, 'PLN'])
+    second = encoder.encode(['USD', 'PLN'])
+
+    assert first.to_pylist() == ['PLN', 'EUR', None, 'PLN']
+    assert second.to_pylist() == ['USD', 'PLN']
+    assert second.indices.to_pylist() == [2, 0]
+    assert second.dictionary.to_pylist() == ['PLN', 'EUR', 'USD']
+
+
+def test_dictionary_encoder_encodes_per_batch_past_max_size():
+    encoder = el_arrow.DictionaryEncoder(max_size=2)
+    encoder.encode(['a', 'b'])
+
+    array = encoder.encode(['c', 'c'])
+
+    assert array.to_pylist() == ['c', 'c']
+    assert array.dictionary.to_pylist() == ['c']
+
+
+def test_dictionary_encoder_converts_only_new_values(monkeypatch):
+    encoder = el_arrow.DictionaryEncoder()
+    encoder.encode([f'account {i}' for i in range(1000)])
+
+    converted = []
+    array = pa.array
+
+    def recording_array(values, type=None, **kwargs):
+        if type == pa.string():
+            converted.append(list(values))
+        return array(values, type=type, **kwargs)
+
+    monkeypatch.setattr(el_arrow.pa, 'array', recording_array)
+    second = encoder.encode(['account 5', 'account 1000', None, 'account 1000'])
+    third = encoder.encode(['account 7'])
+
+    assert converted == [['account 1000']]
+    assert second.to_pylist() == ['account 5', 'account 1000', None, 'account 1000']
+    assert third.indices.to_pylist() == [7]
+    assert len(third.dictionary) == 1001
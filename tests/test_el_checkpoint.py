@@ -0,0 +1,158 @@
+import os
+from datetime import date, timedelta
+import pyarrow.parquet as pq
+import pymssql
+import pytest
+from benchmarks.fake_mssql import FakeMssqlConnection
+from repositorium.el_functions import el_func, el_throttle
+from repositorium.el_functions.el_checkpoint import PageManifest
+from repositorium.el_functions.el_mssql_classes import DatabaseTablesExtractor
+
+DATE_RANGE = {'start_date': '2023-01-01', 'end_date': '2023-04-10', 'days_per_page': 10}
+
+
+class FailingConnection(FakeMssqlConnection):
+    """Fake connection whose fail_on-th query fails with a syntax error, which is not retried."""
+
+    def __init__(self, rows: int, fail_on: int = None, **kwargs):
+        super().__init__(rows, **kwargs)
+        self.fail_on = fail_on
+
+    def cursor(self):
+        cursor = super().cursor()
+        execute = cursor.execute
+
+        def failing_execute(query, params=None):
+            if self.queries + 1 == self.fail_on:
+                self.queries += 1
+                raise pymssql.ProgrammingError(102, b'Incorrect syntax')
+            execute(query, params)
+        cursor.execute = failing_execute
+        return cursor
+
+
+def days_ago(days: int) -> str:
+    return (date.today() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def manifest_with_pages(tmp_path, pages: list) -> PageManifest:
+    """Manifest of completed pages given as (start_date, end_date, extracted_on), with their part files."""
+    manifest = PageManifest(str(tmp_path), 'accounts', 'SELECT', '2024-01-01')
+    records = []
+    for i, (start_date, end_date, extracted_on) in enumerate(pages):
+        part = f"part-{i:05d}"
+        open(os.path.join(manifest.dir, f"{part}.parquet"), 'w').close()
+        records.append({'start_date': start_date, 'end_date': end_date, 'part': part, 'rows': 1, 'bytes': 1,
+                        'next_days_per_page': 31, 'extracted_on': extracted_on})
+    manifest.store.set('pages', records)
+    return manifest
+
+
+def test_new_manifest_starts_at_the_first_day(tmp_path):
+    manifest = PageManifest(str(tmp_path), 'accounts', 'SELECT', '2024-01-01')
+
+    assert manifest.resume() == (date(2024, 1, 1), None)
+
+
+def test_resume_after_the_last_completed_page(tmp_path):
+    manifest_with_pages(tmp_path, [('2024-01-01', '2024-01-31', '2024-06-01'),
+                                   ('2024-02-01', '2024-02-29', '2024-06-01')])  # long settled
+
+    manifest = PageManifest(str(tmp_path), 'accounts', 'SELECT', '2024-01-01')
+
+    assert manifest.resume(lookback_days=62) == (date(2024, 3, 1), 31)
+    assert manifest.part_name() == 'part-00002'
+
+
+def test_other_query_discards_the_checkpoint(tmp_path):
+    manifest_with_pages(tmp_path, [('2024-01-01', '2024-01-31', '2024-06-01')])
+
+    manifest = PageManifest(str(tmp_path), 'accounts', 'SELECT 1', '2024-01-01')
+
+    assert manifest.pages == []
+    assert os.listdir(manifest.dir) == ['manifest.json']
+
+
+def test_resume_extracts_pages_that_missed_back_dated_rows_again(tmp_path):
+    manifest = manifest_with_pages(tmp_path, [(days_ago(60), days_ago(41), days_ago(5)),
+                                              (days_ago(40), days_ago(21), days_ago(5)),
+                                              (days_ago(20), days_ago(11), days_ago(5)),
+                                              (days_ago(10), days_ago(6), days_ago(5))])
+
+    # Rows posted since the pages were extracted are dated from 15 days ago on, the next
+    # run re-reads them from 10 days ago on: the page with the days in between is stale
+    assert manifest.resume(lookback_days=10) == (date.today() - timedelta(days=20), 31)
+    assert [page['part'] for page in manifest.pages] == ['part-00000', 'part-00001']
+    assert sorted(os.listdir(manifest.dir)) == ['manifest.json', 'part-00000.parquet', 'part-00001.parquet']
+
+
+def test_resume_on_the_day_of_extraction_keeps_all_pages(tmp_path):
+    manifest = manifest_with_pages(tmp_path, [(days_ago(63), days_ago(32), days_ago(0)),
+                                              (days_ago(31), days_ago(1), days_ago(0))])
+
+    assert manifest.resume(lookback_days=62) == (date.today(), 31)
+    assert len(manifest.pages) == 2
+
+
+def test_resume_extracts_pages_without_extraction_day_again(tmp_path):
+    manifest = manifest_with_pages(tmp_path, [('2024-01-01', '2024-01-31', None)])
+
+    assert manifest.resume(lookback_days=0) == (date(2024, 1, 1), None)
+
+
+def test_failed_extraction_resumes_from_the_first_incomplete_page(tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    options = dict(date_range={**DATE_RANGE, 'lookback_days': 62},
+                   sql_query='SELECT',
+                   table_name='accounts',
+                   data_dir=str(tmp_path),
+                   temp_dir=str(tmp_path),
+                   throttle=el_throttle.ThrottlePolicy(mode='off'),
+                   checkpoint_dir=checkpoint_dir)
+
+    with pytest.raises(pymssql.ProgrammingError):
+        el_func.fetch_data_to_parquet(conn_sql=FailingConnection(rows=2_000, days=100, fail_on=4), **options)
+    assert len(PageManifest(checkpoint_dir, 'accounts', 'SELECT', DATE_RANGE['start_date']).pages) == 3
+
+    conn = FailingConnection(rows=2_000, days=100)
+    rows = el_func.fetch_data_to_parquet(conn_sql=conn, **options)
+
+    assert rows == 2_000
+    assert conn.queries == 7
+    assert pq.read_metadata(tmp_path / 'accounts.parquet').num_rows == 2_000
+    assert not os.path.exists(os.path.join(checkpoint_dir, 'accounts'))
+
+
+def test_failed_incremental_extraction_resumes_on_the_same_day(tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    watermark = days_ago(1)
+    first_day = days_ago(99)  # the ledger ends today
+
+    def extract(conn) -> dict:
+        extractor = DatabaseTablesExtractor(data_dir=str(tmp_path),
+                                            temp_dir=str(tmp_path),
+                                            throttle=el_throttle.ThrottlePolicy(mode='off'),
+                                            checkpoint_dir=checkpoint_dir)
+        extractor.set_connection(conn)
+        return extractor.create_parquet_incremental(table_query='SELECT',
+                                                    date_table_query='SELECT',
+                                                    table_name='accounts',
+                                                    watermark=watermark,
+                                                    lookback_days=62,
+                                                    days_per_page=10)
+
+    # 64 days from watermark - lookback to today in pages of 10 days, the 4th fails
+    with pytest.raises(pymssql.ProgrammingError):
+        extract(FailingConnection(rows=2_000, days=100, start_date=first_day, fail_on=4))
+    assert len(PageManifest(checkpoint_dir, 'accounts', 'SELECT', days_ago(63)).pages) == 3
+
+    conn = FailingConnection(rows=2_000, days=100, start_date=first_day)
+    date_range = extract(conn)
+
+    assert conn.queries == 4
+    assert date_range['start_date'] == days_ago(63)
+    rows = pq.read_table(tmp_path / 'accounts.parquet')
+    full = FakeMssqlConnection(rows=2_000, days=100, start_date=first_day).cursor()
+    full.execute('SELECT', (days_ago(63), days_ago(0)))
+    assert rows.num_rows == len(full.fetchall())
+    assert not os.path.exists(os.path.join(checkpoint_dir, 'accounts'))
@@ -0,0 +1,101 @@
+import os
+import pyarrow.parquet as pq
+from repositorium.el_functions import el_throttle
+from repositorium.el_functions.el_dimensions import DimensionCache
+
+QUERY = 'SELECT ID, Nazwa FROM dbo.Kontrahenci'
+DESCRIPTION = [('ID', 3, None, None, None, None, None), ('Nazwa', 1, None, None, None, None, None)]
+
+
+class DimensionCursor:
+    """Cursor answering the version query and the dimension query from the rows of its connection."""
+
+    def __init__(self, connection: 'DimensionSource'):
+        self.connection = connection
+        self.description = None
+        self.rows = []
+
+    def execute(self, query: str, params: tuple = None) -> None:
+        rows = list(self.connection.rows)
+        if query.startswith('SELECT COUNT_BIG(*)'):
+            self.rows = [(len(rows), hash(tuple(rows)))]
+            return
+        self.connection.extractions += 1
+        self.description = DESCRIPTION
+        self.rows = rows
+
+    def fetchone(self) -> tuple:
+        return self.rows.pop(0)
+
+    def fetchmany(self, size: int) -> list:
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self) -> None:
+        pass
+
+
+class DimensionSource:
+    """Connection to a source database with one dimension table."""
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.extractions = 0
+
+    def cursor(self) -> DimensionCursor:
+        return DimensionCursor(self)
+
+
+def dimension_cache(tmp_path) -> DimensionCache:
+    return DimensionCache(cache_dir=str(tmp_path / 'dimensions'),
+                          temp_dir=str(tmp_path),
+                          throttle=el_throttle.ThrottlePolicy(mode='off'))
+
+
+def names(path: str) -> list:
+    return pq.read_table(path).column('Nazwa').to_pylist()
+
+
+def test_unchanged_dimension_is_extracted_once(tmp_path):
+    source = DimensionSource([(1, 'Alfa'), (2, 'Beta')])
+
+    path = dimension_cache(tmp_path).fetch(source, 'enova_47', 'contractors', QUERY)
+    assert path == str(tmp_path / 'dimensions' / 'enova_47' / 'contractors.parquet')
+    assert names(path) == ['Alfa', 'Beta']
+
+    # a later run reads the versions from disk
+    assert dimension_cache(tmp_path).fetch(source, 'enova_47', 'contractors', QUERY) == path
+    assert source.extractions == 1
+
+
+def test_changed_dimension_is_extracted_again(tmp_path):
+    source = DimensionSource([(1, 'Alfa'), (2, 'Beta')])
+    cache = dimension_cache(tmp_path)
+    cache.fetch(source, 'enova_47', 'contractors', QUERY)
+
+    source.rows = [(1, 'Alfa'), (2, 'Beta sp. z o.o.')]
+    path = cache.fetch(source, 'enova_47', 'contractors', QUERY)
+
+    assert source.extractions == 2
+    assert names(path) == ['Alfa', 'Beta sp. z o.o.']
+
+
+def test_deleted_file_is_extracted_again(tmp_path):
+    source = DimensionSource([(1, 'Alfa')])
+    cache = dimension_cache(tmp_path)
+    path = cache.fetch(source, 'enova_47', 'contractors', QUERY)
+    os.remove(path)
+
+    assert names(cache.fetch(source, 'enova_47', 'contractors', QUERY)) == ['Alfa']
+    assert source.extractions == 2
+
+
+def test_dimensions_are_cached_per_source(tmp_path):
+    cache = dimension_cache(tmp_path)
+    first = DimensionSource([(1, 'Alfa')])
+    second = DimensionSource([(1, 'Gamma')])
+
+    assert names(cache.fetch(first, 'enova_47', 'contractors', QUERY)) == ['Alfa']
+    assert names(cache.fetch(second, 'enova_48', 'contractors', QUERY)) == ['Gamma']
+    assert names(cache.fetch(first, 'enova_47', 'contractors', QUERY)) == ['Alfa']
+    assert (first.extractions, second.extractions) == (1, 1)
@@ -0,0 +1,58 @@
+from decimal import Decimal
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from repositorium.el_functions import el_arrow, el_func, el_schema
+from repositorium.el_functions.el_sinks import DuckDBStagingSink, ParquetWriterSink
+
+SCHEMA = pa.schema([
+    pa.field('AccountNo', pa.string()),
+    pa.field('Amount', pa.decimal128(18, 2)),
+    pa.field('Description', el_arrow.DICTIONARY_TYPE),
+    ])
+
+# Described by the server as not nullable, e.g. before an outer join was added to the query.
+COLUMNS = [
+    {'name': 'AccountNo', 'type': 'varchar(20)', 'nullable': False,
+     'precision': 0, 'scale': 0, 'max_length': 20},
+    {'name': 'Amount', 'type': 'decimal(18,2)', 'nullable': False,
+     'precision': 18, 'scale': 2, 'max_length': 9},
+    ]
+HEADERS = ['AccountNo', 'Amount']
+DATA_TYPES = [1, 5]
+
+
+def test_create_table_from_arrow_schema_keeps_types():
+    conn = duckdb.connect()
+    el_func.create_table_from_arrow_schema(duck_conn=conn, table_name='accounts', schema=SCHEMA)
+
+    columns = conn.execute(
+        "SELECT column_name, data_type, is_nullable FROM information_schema.columns "
+        "WHERE table_name = 'accounts' ORDER BY ordinal_position").fetchall()
+    assert columns == [('AccountNo', 'VARCHAR', 'YES'),
+                       ('Amount', 'DECIMAL(18,2)', 'YES'),
+                       ('Description', 'VARCHAR', 'YES')]
+
+
+def test_described_fields_are_nullable():
+    schema = el_schema.described_arrow_schema(COLUMNS, HEADERS, DATA_TYPES)
+
+    assert schema.field('Amount').type == pa.decimal128(18, 2)
+    assert all(field.nullable for field in schema)
+
+
+@pytest.mark.parametrize('sink_class', [ParquetWriterSink, DuckDBStagingSink])
+def test_nulls_in_columns_described_as_not_null_are_written(tmp_path, sink_class):
+    batches = [(HEADERS, DATA_TYPES, [('201-01', Decimal('1.50')), (None, None)]),
+               (HEADERS, DATA_TYPES, [('201-02', None)])]
+    sink = sink_class('accounts', str(tmp_path), str(tmp_path), write_options={'use_dictionary': False})
+
+    with sink:
+        rows = el_func.stream_batches_to_sink(sink, iter(batches), columns=COLUMNS)
+
+    assert rows == 3
+    assert sink.described
+    table = pq.read_table(sink.output_path)
+    assert table.column('AccountNo').to_pylist() == ['201-01', None, '201-02']
+    assert table.column('Amount').to_pylist() == [Decimal('1.50'), None, None]
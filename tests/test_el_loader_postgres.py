@@ -0,0 +1,203 @@
+from datetime import date
+from decimal import Decimal
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from repositorium.el_functions.el_loader import sql_literal
+from repositorium.el_functions.el_state import JsonStateStore
+
+ACCOUNTS_SCHEMA = pa.schema([
+    ('Data', pa.date32()),
+    ('firma', pa.string()),
+    ('Wn_KwotaOperacji', pa.decimal128(18, 2)),
+    ])
+WINDOW = {'column': 'Data', 'start_date': '2024-01-02', 'end_date': '2024-01-03'}
+
+
+def accounts_table(days: list, amount: int = None) -> pa.Table:
+    """One row per day, amounts 1, 2, 3... or all the given amount."""
+    amounts = [Decimal(amount if amount is not None else i + 1) for i in range(len(days))]
+    return pa.table([days, ['SAVVY'] * len(days), amounts], schema=ACCOUNTS_SCHEMA)
+
+
+def write_accounts(path, days: list, amount: int = None) -> str:
+    """Parquet file of accounts_table()."""
+    pq.write_table(accounts_table(days, amount), path)
+    return str(path)
+
+
+def stream_accounts(loader, table_name: str, tmp_path, batches: list, delta_window: dict = None) -> None:
+    """Streams one record batch per list of days into table_name."""
+    sink = loader.stream_sink(table_name, str(tmp_path), str(tmp_path), {'use_dictionary': False}, delta_window)
+    sink.open(headers=ACCOUNTS_SCHEMA.names, data_types=[], schema=ACCOUNTS_SCHEMA)
+    for days in batches:
+        sink.write_batch(accounts_table(days).to_batches()[0])
+    sink.close()
+
+
+def january(*numbers) -> list:
+    return [date(2024, 1, number) for number in numbers]
+
+
+def query(loader, sql: str) -> list:
+    """Rows of a query run on Postgres itself."""
+    with loader.connection() as conn:
+        return conn.execute(
+            f"SELECT * FROM postgres_query({sql_literal(loader.db_alias)}, {sql_literal(sql)})").fetchall()
+
+
+def execute(loader, sql: str) -> None:
+    with loader.connection() as conn:
+        loader.postgres_execute(conn, sql)
+
+
+def add_views(loader, table_name: str) -> None:
+    execute(loader, f'''
+        CREATE VIEW "{table_name}_totals" AS SELECT count(*) AS n, sum("Wn_KwotaOperacji") AS total FROM "{table_name}";
+        CREATE VIEW "{table_name}_report" AS SELECT n FROM "{table_name}_totals";
+        COMMENT ON VIEW "{table_name}_totals" IS 'Totals of the ledger';
+        GRANT SELECT ON "{table_name}_report" TO PUBLIC;
+    ''')
+
+
+def assert_views_recreated(loader, table_name: str, rows: int) -> None:
+    assert query(loader, f'SELECT n FROM "{table_name}_report"') == [(rows,)]
+    assert query(loader, f"SELECT obj_description('{table_name}_totals'::regclass, 'pg_class')") == [
+        ('Totals of the ledger',)]
+    assert query(loader, f"SELECT has_table_privilege('public', '{table_name}_report', 'SELECT')") == [(True,)]
+
+
+def tables(loader, table_name: str) -> list:
+    """Tables whose name starts with table_name: the live table and any staging leftovers."""
+    return [name for name, in query(loader, f"SELECT tablename FROM pg_tables WHERE tablename LIKE '{table_name}%' "
+                                            "ORDER BY tablename")]
+
+
+def amounts_by_day(loader, table_name: str) -> list:
+    return query(loader, f'SELECT "Data", sum("Wn_KwotaOperacji") FROM "{table_name}" GROUP BY 1 ORDER BY 1')
+
+
+@pytest.mark.parametrize('staged', [True, False])
+def test_full_load_recreates_dependent_views(tmp_path, make_loader, table_name, staged):
+    loader = make_loader(staged=staged)
+    loader.load_file(write_accounts(tmp_path / 'first.parquet', [date(2024, 1, 1), date(2024, 1, 2)]), table_name)
+    add_views(loader, table_name)
+
+    loader.load_file(write_accounts(tmp_path / 'second.parquet', [date(2024, 1, d) for d in (1, 2, 3)]), table_name)
+
+    assert_views_recreated(loader, table_name, rows=3)
+
+
+def test_full_load_fails_on_a_materialized_view(tmp_path, make_loader, table_name):
+    loader = make_loader()
+    loader.load_file(write_accounts(tmp_path / 'first.parquet', [date(2024, 1, 1)]), table_name)
+    execute(loader, f'CREATE MATERIALIZED VIEW "{table_name}_mv" AS SELECT count(*) FROM "{table_name}";')
+
+    with pytest.raises(RuntimeError, match='depend on it'):
+        loader.load_file(write_accounts(tmp_path / 'second.parquet', [date(2024, 1, 1), date(2024, 1, 2)]),
+                         table_name)
+
+    assert query(loader, f'SELECT count(*) FROM "{table_name}"') == [(1,)]
+
+
+def test_staged_load_swaps_in_the_indexed_staging_table(tmp_path, make_loader, table_name):
+    loader = make_loader(staged=True, indexes={table_name: [['Data'], ['firma', 'Data']]})
+    loader.load_file(write_accounts(tmp_path / 'first.parquet', january(1, 2)), table_name)
+
+    stats = loader.load_file(write_accounts(tmp_path / 'second.parquet', january(1, 2, 3)), table_name)
+
+    assert stats['rows'] == 3
+    assert tables(loader, table_name) == [table_name]
+    assert query(loader, f'SELECT count(*) FROM "{table_name}"') == [(3,)]
+    assert query(loader, f"SELECT indexname FROM pg_indexes WHERE tablename = '{table_name}' ORDER BY 1") == [
+        (f'{table_name}_idx0',), (f'{table_name}_idx1',)]
+    assert query(loader, f"SELECT relpersistence FROM pg_class WHERE relname = '{table_name}'") == [('u',)]
+
+
+def test_failed_swap_is_rolled_back(tmp_path, make_loader, table_name):
+    loader = make_loader(staged=True)
+    loader.load_file(write_accounts(tmp_path / 'first.parquet', january(1, 2)), table_name)
+    # A foreign key is not a view, so the old table cannot be dropped and the swap fails after the renames
+    execute(loader, f'''
+        ALTER TABLE "{table_name}" ADD UNIQUE ("Data");
+        CREATE UNLOGGED TABLE "{table_name}_refs" ("Data" DATE REFERENCES "{table_name}" ("Data"));
+    ''')
+
+    with pytest.raises(Exception, match='depend'):
+        loader.load_file(write_accounts(tmp_path / 'second.parquet', january(1, 2, 3)), table_name)
+
+    assert tables(loader, table_name) == [table_name, f'{table_name}__staging', f'{table_name}_refs']
+    assert query(loader, f'SELECT count(*) FROM "{table_name}"') == [(2,)]
+
+    execute(loader, f'DROP TABLE "{table_name}_refs";')
+    loader.load_file(write_accounts(tmp_path / 'second.parquet', january(1, 2, 3)), table_name)
+    assert query(loader, f'SELECT count(*) FROM "{table_name}"') == [(3,)]
+
+def test_staged_load_sets_the_table_logged(tmp_path, make_loader, table_name):
+    loader = make_loader(staged=True, set_logged=True)
+
+    loader.load_file(write_accounts(tmp_path / 'first.parquet', january(1)), table_name)
+
+    assert query(loader, f"SELECT relpersistence FROM pg_class WHERE relname = '{table_name}'") == [('p',)]
+
+
+def test_load_file_replaces_the_rows_of_the_window(tmp_path, make_loader, table_name):
+    loader = make_loader()
+    loader.load_file(write_accounts(tmp_path / 'full.parquet', january(1, 2, 3, 4), amount=1), table_name)
+
+    loader.load_file(write_accounts(tmp_path / 'window.parquet', january(2, 2, 3), amount=5), table_name,
+                     delta_window=WINDOW)
+
+    assert amounts_by_day(loader, table_name) == [
+        (date(2024, 1, 1), Decimal(1)), (date(2024, 1, 2), Decimal(10)),
+        (date(2024, 1, 3), Decimal(5)), (date(2024, 1, 4), Decimal(1))]
+
+
+@pytest.mark.parametrize('staged', [True, False])
+def test_stream_replaces_the_table(tmp_path, make_loader, table_name, staged):
+    loader = make_loader(staged=staged)
+    stream_accounts(loader, table_name, tmp_path, [january(1, 2)])
+    add_views(loader, table_name)
+
+    stream_accounts(loader, table_name, tmp_path, [january(1, 2), january(3)])
+
+    assert tables(loader, table_name) == [table_name]
+    assert_views_recreated(loader, table_name, rows=3)
+
+
+def test_stream_replaces_the_rows_of_the_window(tmp_path, make_loader, table_name):
+    loader = make_loader()
+    loader.load_file(write_accounts(tmp_path / 'full.parquet', january(1, 2, 3, 4), amount=1), table_name)
+
+    stream_accounts(loader, table_name, tmp_path, [january(2), january(3, 3)], delta_window=WINDOW)
+
+    assert tables(loader, table_name) == [table_name]
+    assert amounts_by_day(loader, table_name) == [
+        (date(2024, 1, 1), Decimal(1)), (date(2024, 1, 2), Decimal(1)),
+        (date(2024, 1, 3), Decimal(3)), (date(2024, 1, 4), Decimal(1))]
+
+
+@pytest.mark.parametrize('staged', [True, False])
+def test_aborted_stream_keeps_the_live_table(tmp_path, make_loader, table_name, staged):
+    loader = make_loader(staged=staged)
+    stream_accounts(loader, table_name, tmp_path, [january(1, 2)])
+
+    with pytest.raises(RuntimeError):
+        with loader.stream_sink(table_name, str(tmp_path), str(tmp_path), {'use_dictionary': False}) as sink:
+            sink.open(headers=ACCOUNTS_SCHEMA.names, data_types=[], schema=ACCOUNTS_SCHEMA)
+            sink.write_batch(accounts_table(january(1, 2, 3)).to_batches()[0])
+            raise RuntimeError('extraction failed')
+
+    assert tables(loader, table_name) == [table_name]
+    assert query(loader, f'SELECT count(*) FROM "{table_name}"') == [(2,)]
+
+
+def test_unchanged_stream_is_not_swapped_in(tmp_path, make_loader, table_name):
+    loader = make_loader(fingerprints=JsonStateStore(str(tmp_path / 'fingerprints.json')))
+    stream_accounts(loader, table_name, tmp_path, [january(1, 2)])
+    oid = query(loader, f"SELECT '{table_name}'::regclass::oid")
+
+    stream_accounts(loader, table_name, tmp_path, [january(1, 2)])
+
+    assert tables(loader, table_name) == [table_name]
+    assert query(loader, f"SELECT '{table_name}'::regclass::oid") == oid
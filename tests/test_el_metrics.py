@@ -0,0 +1,31 @@
+import sys
+import pytest
+from repositorium.el_functions import el_metrics
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='the peak is reset through /proc')
+
+
+def test_reset_starts_the_peak_rss_of_a_new_run():
+    report = el_metrics.RunReport(job='test')
+    ballast = bytearray(256 * 2**20)  # touched by the zero fill, so it is resident
+    before = el_metrics.peak_rss_bytes()
+    del ballast
+
+    report.reset()
+
+    assert report.peak_rss_scope == 'run'
+    assert el_metrics.peak_rss_bytes() < before - 128 * 2**20
+    assert report.to_dict()['peak_rss_scope'] == 'run'
+
+
+def test_prometheus_labels_a_process_peak(tmp_path, monkeypatch):
+    monkeypatch.setattr(el_metrics, 'reset_peak_rss', lambda: False)
+    report = el_metrics.RunReport(job='test')
+    report.reset()
+    path = tmp_path / 'etl.prom'
+
+    report.write_prometheus(str(path), status=0)
+
+    text = path.read_text()
+    assert 'etl_process_peak_rss_bytes{job="test"}' in text
+    assert 'etl_run_peak_rss_bytes' not in text
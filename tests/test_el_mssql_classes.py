@@ -0,0 +1,122 @@
+import logging
+import duckdb
+import pyarrow.parquet as pq
+import pytest
+from repositorium.el_functions import el_throttle
+from repositorium.el_functions.el_mssql_classes import DatabaseTablesExtractor, SLICE_DATE
+
+# pymssql type codes of the ledger columns
+TYPE_CODES = {'ID': 3, 'Data': 2, 'Kwota': 5}
+DATE_QUERY = 'SELECT * FROM ledger WHERE "Data" >= CAST(%s AS DATE) AND "Data" < CAST(%s AS DATE) + 1'
+OUTSIDE_QUERY = ('SELECT * FROM ledger WHERE "Data" IS NULL OR "Data" < CAST(%s AS DATE) '
+                 'OR "Data" >= CAST(%s AS DATE) + 1')
+MODULO_QUERY = 'SELECT * FROM ledger WHERE "ID" % %s = %s'
+DATE_RANGE = {'start_date': '2024-01-01', 'end_date': '2024-01-31', 'days_per_page': 7}
+
+
+class DuckDBCursor:
+    """DB-API cursor of a DuckDB database with the type codes of pymssql, for queries with %s parameters."""
+
+    def __init__(self, database):
+        self.cursor = database.cursor()
+        self.description = None
+
+    def execute(self, query: str, params: tuple = None) -> None:
+        self.cursor.execute(query.replace('%s', '?'), list(params or ()))
+        self.description = [(column[0], TYPE_CODES[column[0]], None, None, None, None, None)
+                            for column in self.cursor.description]
+
+    def fetchmany(self, size: int) -> list:
+        return self.cursor.fetchmany(size)
+
+    def close(self) -> None:
+        self.cursor.close()
+
+
+class DuckDBSource:
+    """Connection standing in for SQL Server, on a DuckDB database shared by the slices."""
+
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self) -> DuckDBCursor:
+        return DuckDBCursor(self.database)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+@pytest.fixture
+def ledger():
+    """400 ledger rows from 2023-12-27 to 2024-02-04, 5 of them without a date."""
+    database = duckdb.connect()
+    database.execute('''
+        CREATE TABLE ledger AS
+        SELECT i::INTEGER AS "ID",
+               CASE WHEN i % 80 = 7 THEN NULL ELSE DATE '2023-12-27' + (i // 10)::INTEGER END AS "Data",
+               (i / 100)::DECIMAL(18, 2) AS "Kwota"
+        FROM range(400) t(i)
+    ''')
+    yield database
+    database.close()
+
+
+def sliced_extractor(tmp_path, ledger, slices: int = 3, offload: dict = None) -> DatabaseTablesExtractor:
+    return DatabaseTablesExtractor(data_dir=str(tmp_path),
+                                   temp_dir=str(tmp_path),
+                                   throttle=el_throttle.ThrottlePolicy(mode='off'),
+                                   slices=slices,
+                                   connection_factory=lambda: DuckDBSource(ledger),
+                                   offload=offload)
+
+
+def extracted_ids(tmp_path) -> list:
+    return sorted(pq.read_table(tmp_path / 'ledger.parquet').column('ID').to_pylist())
+
+
+def test_date_slices_extract_all_rows(tmp_path, ledger):
+    sliced_extractor(tmp_path, ledger).create_parquet_sliced(table_query=DATE_QUERY,
+                                                             table_name='ledger',
+                                                             slice_by=SLICE_DATE,
+                                                             date_range=DATE_RANGE,
+                                                             outside_query=OUTSIDE_QUERY)
+
+    assert extracted_ids(tmp_path) == list(range(400))
+    assert pq.read_table(tmp_path / 'ledger.parquet').column('Data').null_count == 5
+
+
+def test_date_slices_need_the_outside_query(tmp_path, ledger):
+    with pytest.raises(ValueError, match='outside_query'):
+        sliced_extractor(tmp_path, ledger).create_parquet_sliced(table_query=DATE_QUERY,
+                                                                 table_name='ledger',
+                                                                 slice_by=SLICE_DATE,
+                                                                 date_range=DATE_RANGE)
+
+
+def test_modulo_slices_extract_all_rows(tmp_path, ledger):
+    sliced_extractor(tmp_path, ledger, slices=4).create_parquet_sliced(table_query=MODULO_QUERY, table_name='ledger')
+
+    assert extracted_ids(tmp_path) == list(range(400))
+    assert not (tmp_path / 'ledger__parts').exists()
+
+
+def test_failed_slice_writes_no_output(tmp_path, ledger):
+    with pytest.raises(duckdb.Error):
+        sliced_extractor(tmp_path, ledger).create_parquet_sliced(table_query=MODULO_QUERY + ' AND "Missing"',
+                                                                 table_name='ledger')
+
+    assert not (tmp_path / 'ledger.parquet').exists()
+    assert not (tmp_path / 'ledger__parts').exists()
+
+
+def test_sliced_extraction_tells_that_dimensions_are_not_offloaded(tmp_path, ledger, log_records):
+    extractor = sliced_extractor(tmp_path, ledger, slices=2, offload={'dimensions': {}})
+
+    extractor.create_parquet_sliced(table_query=MODULO_QUERY, table_name='ledger')
+
+    assert [record.getMessage() for record in log_records if record.levelno == logging.WARNING] == [
+        'Dimensions are not offloaded in the sliced extraction of ledger']
+    assert extracted_ids(tmp_path) == list(range(400))
@@ -0,0 +1,76 @@
+from datetime import date
+from repositorium.el_functions.el_paging import AdaptiveDatePager, split_date_range
+
+
+def pages_of(pager: AdaptiveDatePager, rows_per_day: int = 0) -> list:
+    pages = []
+    while not pager.done:
+        start, end = pager.next_page()
+        pages.append((start, end))
+        pager.record(rows=rows_per_day * ((end - start).days + 1), nbytes=0)
+    return pages
+
+
+def test_split_date_range_covers_the_range():
+    ranges = split_date_range(date(2024, 1, 1), date(2024, 1, 10), 3)
+
+    assert ranges == [(date(2024, 1, 1), date(2024, 1, 3)),
+                      (date(2024, 1, 4), date(2024, 1, 6)),
+                      (date(2024, 1, 7), date(2024, 1, 10))]
+    assert split_date_range(date(2024, 1, 1), date(2024, 1, 2), 5) == [
+        (date(2024, 1, 1), date(2024, 1, 1)), (date(2024, 1, 2), date(2024, 1, 2))]
+
+
+def test_fixed_pages_without_a_target():
+    pager = AdaptiveDatePager(date(2024, 1, 1), date(2024, 3, 1), days_per_page=31)
+
+    assert pages_of(pager, rows_per_day=1_000) == [(date(2024, 1, 1), date(2024, 1, 31)),
+                                                   (date(2024, 2, 1), date(2024, 3, 1))]
+    assert not pager.adaptive
+
+
+def test_pages_are_sized_to_the_target_rows():
+    pager = AdaptiveDatePager(date(2024, 1, 1), date(2024, 12, 31), days_per_page=10,
+                              target_rows_per_page=5_000)
+
+    pages = pages_of(pager, rows_per_day=1_000)
+
+    assert pages[0] == (date(2024, 1, 1), date(2024, 1, 10))
+    assert all((end - start).days + 1 == 5 for start, end in pages[1:-1])
+    assert pages[-1][1] == date(2024, 12, 31)
+
+
+def test_page_growth_is_bounded():
+    pager = AdaptiveDatePager(date(2024, 1, 1), date(2024, 12, 31), days_per_page=2,
+                              target_rows_per_page=1_000_000, max_days_per_page=30)
+
+    pager.next_page()
+    pager.record(rows=10, nbytes=100)
+    assert pager.days == 8  # MAX_GROWTH
+
+    for _ in range(3):
+        pager.next_page()
+        pager.record(rows=10, nbytes=100)
+    assert pager.days == 30
+
+
+def test_byte_budget_shrinks_the_next_page():
+    pager = AdaptiveDatePager(date(2024, 1, 1), date(2024, 12, 31), days_per_page=20,
+                              max_bytes_per_page=1_000_000)
+
+    pager.next_page()
+    pager.record(rows=20_000, nbytes=2_000_000)
+
+    assert pager.days == 10
+
+
+def test_split_halves_the_current_window():
+    pager = AdaptiveDatePager(date(2024, 1, 1), date(2024, 1, 31), days_per_page=8,
+                              target_rows_per_page=100, min_days_per_page=2)
+
+    assert pager.next_page() == (date(2024, 1, 1), date(2024, 1, 8))
+    pager.split()
+    assert pager.next_page() == (date(2024, 1, 1), date(2024, 1, 4))
+    pager.split()
+    assert pager.next_page() == (date(2024, 1, 1), date(2024, 1, 2))
+    assert not pager.can_split()
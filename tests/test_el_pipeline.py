@@ -0,0 +1,141 @@
+import threading
+import time
+import pyarrow.parquet as pq
+import pytest
+from benchmarks.fake_mssql import FakeMssqlConnection
+from repositorium.el_functions import el_func, el_throttle
+from repositorium.el_functions.el_pipeline import ExtractLoadPipeline
+
+DATE_RANGE = {'start_date': '2023-01-01', 'end_date': '2023-01-30', 'days_per_page': 30}
+COMPANIES = ['SAVVY', 'BDG', 'ENOVA', 'HURT']
+
+
+class StubLoader:
+    """Loader that reads the row count of a file, fails for the fail companies and waits for release."""
+
+    def __init__(self, fail: tuple = ()):
+        self.fail = fail
+        self.release = threading.Event()
+        self.release.set()
+        self.loaded = []
+
+    def load(self, company, path):
+        self.release.wait(timeout=10)
+        if company in self.fail:
+            raise RuntimeError(f'load of {company} failed')
+        self.loaded.append(company)
+        return pq.read_metadata(path).num_rows
+
+
+def extractor(data_dir, fail: tuple = (), interrupt: tuple = ()):
+    """extract(company) writing the company's ledger from a fake SQL Server to <data_dir>/accounts_<company>.parquet."""
+    def extract(company):
+        if company in interrupt:
+            raise KeyboardInterrupt
+        if company in fail:
+            raise ConnectionError(f'{company} is not reachable')
+        el_func.fetch_data_to_parquet(conn_sql=FakeMssqlConnection(rows=300, company_name=company, days=30),
+                                      date_range=DATE_RANGE,
+                                      sql_query='SELECT',
+                                      table_name=f'accounts_{company}',
+                                      data_dir=str(data_dir),
+                                      temp_dir=str(data_dir),
+                                      throttle=el_throttle.ThrottlePolicy(mode='off'))
+        return str(data_dir / f'accounts_{company}.parquet')
+    return extract
+
+
+def written(data_dir) -> list:
+    """Companies whose Parquet file is written."""
+    return [company for company in COMPANIES if (data_dir / f'accounts_{company}.parquet').exists()]
+
+
+def wait_until(condition, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def run_in_thread(pipeline: ExtractLoadPipeline) -> tuple:
+    """Starts pipeline.run(COMPANIES) in a thread; the result is in results[0] after the join."""
+    results = []
+    runner = threading.Thread(target=lambda: results.append(pipeline.run(COMPANIES)))
+    runner.start()
+    return runner, results
+
+
+def load_threads() -> list:
+    return [thread for thread in threading.enumerate() if thread.name.startswith('load_')]
+
+
+def test_every_extracted_company_is_loaded(tmp_path):
+    loader = StubLoader()
+    pipeline = ExtractLoadPipeline(extractor(tmp_path), loader.load, extract_workers=2, load_workers=2)
+
+    result = pipeline.run(COMPANIES)
+
+    assert result.loaded == {company: 300 for company in COMPANIES}
+    assert not result.failed_extract and not result.failed_load and not result.skipped
+
+
+def test_failed_extraction_is_not_loaded(tmp_path):
+    loader = StubLoader()
+    pipeline = ExtractLoadPipeline(extractor(tmp_path, fail=('BDG',)), loader.load)
+
+    result = pipeline.run(COMPANIES)
+
+    assert result.failed_extract == ['BDG']
+    assert sorted(result.loaded) == sorted(set(COMPANIES) - {'BDG'})
+
+
+def test_failed_load_does_not_stop_the_queued_companies(tmp_path):
+    loader = StubLoader(fail=('SAVVY',))
+    loader.release.clear()  # the first load waits until the queue is full
+    pipeline = ExtractLoadPipeline(extractor(tmp_path), loader.load, queue_size=2)
+    runner, results = run_in_thread(pipeline)
+    wait_until(lambda: written(tmp_path) == COMPANIES)
+    loader.release.set()
+    runner.join(timeout=10)
+
+    assert results[0].failed_load == ['SAVVY']
+    assert loader.loaded == COMPANIES[1:]
+    assert not load_threads()
+
+
+def test_full_queue_holds_back_the_extraction(tmp_path):
+    loader = StubLoader()
+    loader.release.clear()
+    pipeline = ExtractLoadPipeline(extractor(tmp_path), loader.load, queue_size=1)
+    runner, results = run_in_thread(pipeline)
+
+    # One company is loading, one waits in the queue and one waits for room in it
+    wait_until(lambda: len(written(tmp_path)) == 3)
+    time.sleep(0.3)
+    assert written(tmp_path) == COMPANIES[:3]
+
+    loader.release.set()
+    runner.join(timeout=10)
+    assert sorted(results[0].loaded) == sorted(COMPANIES)
+
+
+def test_interrupt_stops_the_pipeline_and_joins_the_loaders(tmp_path):
+    loader = StubLoader()
+    pipeline = ExtractLoadPipeline(extractor(tmp_path, interrupt=('ENOVA',)), loader.load)
+
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.run(COMPANIES)
+
+    assert 'HURT' not in loader.loaded
+    assert not (tmp_path / 'accounts_HURT.parquet').exists()
+    assert not load_threads()
+
+
+def test_loads_overlap_the_next_extractions():
+    def slow(*args):
+        time.sleep(0.2)
+
+    start = time.perf_counter()
+    ExtractLoadPipeline(slow, slow).run(COMPANIES)
+
+    # 4 extractions and 4 loads of 0.2 s take 1.6 s one after another, 1.0 s overlapped
+    assert time.perf_counter() - start < 1.4
@@ -0,0 +1,119 @@
+import json
+from datetime import date
+from decimal import Decimal
+import duckdb
+import pyarrow as pa
+import pytest
+from repositorium.el_functions import el_reconcile
+from repositorium.el_functions.el_sinks import ParquetWriterSink
+
+SCHEMA = pa.schema([
+    ('Data', pa.date32()),
+    ('firma', pa.string()),
+    ('Wn_KwotaOperacji', pa.decimal128(18, 2)),
+    ('Opis', pa.string()),
+    ])
+SPEC = {'group_by': ['firma'], 'date_column': 'Data', 'sum_columns': ['Wn_KwotaOperacji']}
+
+
+def ledger_batch(rows: list) -> pa.RecordBatch:
+    """Batch of (day, company, amount) rows, every second row without a description."""
+    return pa.RecordBatch.from_arrays([
+        pa.array([row[0] for row in rows], pa.date32()),
+        pa.array([row[1] for row in rows]),
+        pa.array([Decimal(row[2]) for row in rows], pa.decimal128(18, 2)),
+        pa.array(['x' if i % 2 == 0 else None for i in range(len(rows))]),
+        ], schema=SCHEMA)
+
+
+FIRST = ledger_batch([(date(2024, 1, 5), 'A', '1.10'), (date(2024, 1, 6), 'A', '2.20'),
+                      (date(2024, 2, 1), 'B', '5.00')])
+SECOND = ledger_batch([(date(2024, 1, 31), 'A', '0.70')])
+
+
+def ledger_stats(*batches) -> el_reconcile.ReconciliationStats:
+    stats = el_reconcile.ReconciliationStats(SCHEMA, SPEC)
+    for batch in batches:
+        stats.update(batch)
+    return stats
+
+
+def ledger_table(*batches) -> duckdb.DuckDBPyConnection:
+    """DuckDB connection with the batches in table ledger."""
+    conn = duckdb.connect()
+    conn.register('batches', pa.Table.from_batches(batches))
+    conn.execute("CREATE TABLE ledger AS SELECT * FROM batches")
+    return conn
+
+
+def test_stats_aggregate_rows_nulls_and_sums_per_group():
+    stats = ledger_stats(FIRST, SECOND).to_dict()
+
+    assert stats['rows'] == 4
+    assert stats['keys'] == ['firma', 'year', 'month']
+    assert stats['nulls'] == {'Data': 0, 'firma': 0, 'Wn_KwotaOperacji': 0, 'Opis': 1}
+    assert stats['groups'] == {
+        '["A", 2024, 1]': {'rows': 3, 'sums': {'Wn_KwotaOperacji': Decimal('4.00')}},
+        '["B", 2024, 2]': {'rows': 1, 'sums': {'Wn_KwotaOperacji': Decimal('5.00')}},
+        }
+
+
+def test_stats_leave_out_columns_missing_from_the_schema():
+    stats = el_reconcile.ReconciliationStats(SCHEMA, {'group_by': ['mpk'], 'date_column': 'firma',
+                                                      'sum_columns': ['Ma_KwotaOperacji']})
+    stats.update(FIRST)
+
+    assert stats.keys == []
+    assert stats.to_dict()['groups'] == {'[]': {'rows': 3, 'sums': {}}}
+
+
+def test_sink_writes_the_stats_to_the_footer(tmp_path):
+    sink = ParquetWriterSink('ledger', str(tmp_path), str(tmp_path), {'use_dictionary': False, 'reconcile': SPEC})
+    with sink:
+        sink.open(headers=SCHEMA.names, data_types=[], schema=SCHEMA)
+        sink.write_batch(FIRST)
+        sink.write_batch(SECOND)
+
+    assert el_reconcile.read_stats(str(tmp_path / 'ledger.parquet')) == json.loads(ledger_stats(FIRST, SECOND).to_json())
+
+
+def test_combine_stats_adds_the_outputs():
+    combined = el_reconcile.combine_stats([json.loads(ledger_stats(FIRST).to_json()),
+                                           json.loads(ledger_stats(SECOND).to_json())])
+
+    assert combined == json.loads(ledger_stats(FIRST, SECOND).to_json())
+
+
+def test_combine_stats_of_different_outputs():
+    stats = json.loads(ledger_stats(FIRST).to_json())
+
+    assert el_reconcile.combine_stats([stats, None]) is None
+    assert el_reconcile.combine_stats([stats, {**stats, 'sum_columns': []}]) is None
+
+
+def test_verify_table_accepts_the_extracted_rows():
+    conn = ledger_table(FIRST, SECOND)
+
+    assert el_reconcile.verify_table(conn, 'ledger', ledger_stats(FIRST, SECOND).to_dict()) == {'rows': 4, 'groups': 2}
+
+
+def test_verify_table_reports_the_differences():
+    conn = ledger_table(FIRST, SECOND)
+    conn.execute("""UPDATE ledger SET "Wn_KwotaOperacji" = 9 WHERE firma = 'B'""")
+    conn.execute("""DELETE FROM ledger WHERE "Data" = DATE '2024-01-31'""")
+
+    with pytest.raises(el_reconcile.ReconciliationError) as error:
+        el_reconcile.verify_table(conn, 'ledger', json.loads(ledger_stats(FIRST, SECOND).to_json()))
+
+    assert 'rows: extracted 4, loaded 3' in str(error.value)
+    assert 'rows of ["A", 2024, 1]: extracted 3, loaded 2' in str(error.value)
+    assert 'sum of Wn_KwotaOperacji in ["B", 2024, 2]: extracted 5.00, loaded 9.00' in str(error.value)
+
+
+def test_verify_table_checks_only_the_window():
+    conn = ledger_table(FIRST, SECOND)
+
+    result = el_reconcile.verify_table(conn, 'ledger', ledger_stats(SECOND).to_dict(),
+                                       {'column': 'Data', 'start_date': '2024-01-07', 'end_date': '2024-01-31'})
+
+    assert result == {'rows': 1, 'groups': 1}
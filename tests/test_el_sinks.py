@@ -0,0 +1,91 @@
+import os
+from datetime import date
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+from repositorium.el_functions.el_sinks import ParquetDatasetSink, replace_dataset_files
+
+DATASET = {'name': 'accounts_47', 'partition_by': ['firma'], 'date_column': 'Data'}
+SCHEMA = pa.schema([('Data', pa.date32()), ('firma', pa.string()), ('Kwota', pa.int64())])
+
+
+def touch(dataset_path, partition: str, file_name: str) -> str:
+    path = os.path.join(dataset_path, partition, file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+    return path
+
+
+def files(dataset_path) -> list:
+    """Files of the dataset, relative to its directory."""
+    return sorted(os.path.relpath(os.path.join(root, name), dataset_path)
+                  for root, _, names in os.walk(dataset_path) for name in names)
+
+
+def month_partition(month: int, company: str = 'A') -> str:
+    return os.path.join(f'firma={company}', 'year=2024', f'month={month}')
+
+
+def test_full_extraction_replaces_all_files_of_the_table(tmp_path):
+    for month in (1, 2):
+        touch(tmp_path, month_partition(month), 'accounts_a-old.parquet')
+        touch(tmp_path, month_partition(month, 'B'), 'accounts_b-old.parquet')
+    touch(tmp_path, month_partition(2), 'accounts_a-new.parquet')
+
+    replace_dataset_files(str(tmp_path), 'accounts_a', 'new')
+
+    assert files(tmp_path) == sorted([os.path.join(month_partition(1, 'B'), 'accounts_b-old.parquet'),
+                                      os.path.join(month_partition(2), 'accounts_a-new.parquet'),
+                                      os.path.join(month_partition(2, 'B'), 'accounts_b-old.parquet')])
+
+
+def test_window_replaces_only_the_files_of_its_months(tmp_path):
+    for month in (1, 2, 3, 4, 5):
+        touch(tmp_path, month_partition(month), 'accounts_a-old.parquet')
+    touch(tmp_path, month_partition(3, 'B'), 'accounts_b-old.parquet')
+    touch(tmp_path, month_partition(3), 'accounts_a-new.parquet')
+    touch(tmp_path, month_partition(5), 'accounts_a-new.parquet')  # a row dated outside the window
+
+    replace_dataset_files(str(tmp_path), 'accounts_a', 'new', ('2024-02-10', '2024-03-05'))
+
+    assert files(tmp_path) == sorted([os.path.join(month_partition(1), 'accounts_a-old.parquet'),
+                                      os.path.join(month_partition(3), 'accounts_a-new.parquet'),
+                                      os.path.join(month_partition(3, 'B'), 'accounts_b-old.parquet'),
+                                      os.path.join(month_partition(4), 'accounts_a-old.parquet'),
+                                      os.path.join(month_partition(5), 'accounts_a-new.parquet')])
+
+
+def write_dataset(data_dir, days: list, window: tuple = None, fail: bool = False) -> None:
+    """Writes one row per day of company A into the dataset through a ParquetDatasetSink."""
+    batch = pa.RecordBatch.from_arrays([pa.array(days, pa.date32()), pa.array(['A'] * len(days)),
+                                        pa.array(range(len(days)), pa.int64())], schema=SCHEMA)
+    with ParquetDatasetSink('accounts_a', str(data_dir), str(data_dir),
+                            {**DATASET, 'window': window}, {'use_dictionary': False}) as sink:
+        sink.open(headers=SCHEMA.names, data_types=[], schema=SCHEMA)
+        sink.write_batch(batch)
+        if fail:
+            raise RuntimeError('extraction failed')
+
+
+def dataset_days(data_dir) -> list:
+    table = ds.dataset(os.path.join(data_dir, DATASET['name']), format='parquet', partitioning='hive').to_table()
+    return sorted(table.column('Data').to_pylist())
+
+
+def test_sink_replaces_the_months_of_the_window(tmp_path):
+    write_dataset(tmp_path, [date(2024, 1, 15), date(2024, 2, 15), date(2024, 3, 15)])
+
+    write_dataset(tmp_path, [date(2024, 2, 1)], window=('2024-02-01', '2024-02-29'))
+
+    assert dataset_days(tmp_path) == [date(2024, 1, 15), date(2024, 2, 1), date(2024, 3, 15)]
+
+
+def test_failed_write_keeps_the_old_files(tmp_path):
+    write_dataset(tmp_path, [date(2024, 1, 15), date(2024, 2, 15)])
+    old_files = files(tmp_path)
+
+    with pytest.raises(RuntimeError):
+        write_dataset(tmp_path, [date(2024, 1, 1), date(2024, 2, 1)], fail=True)
+
+    assert files(tmp_path) == old_files
+    assert dataset_days(tmp_path) == [date(2024, 1, 15), date(2024, 2, 15)]
@@ -0,0 +1,50 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from repositorium.el_functions.el_state import JsonStateStore
+
+
+def test_values_survive_a_new_store(tmp_path):
+    path = str(tmp_path / 'state' / 'watermarks.json')
+    store = JsonStateStore(path)
+
+    store.set('savvy/accounts_47_savvy', '2024-03-31')
+    store.set('fingerprints', {'rows': 3})
+
+    reopened = JsonStateStore(path)
+    assert reopened.get('savvy/accounts_47_savvy') == '2024-03-31'
+    assert reopened.get('fingerprints') == {'rows': 3}
+    assert reopened.get('missing', 'default') == 'default'
+
+
+def test_delete_removes_the_key(tmp_path):
+    path = str(tmp_path / 'state.json')
+    store = JsonStateStore(path)
+    store.set('a', 1)
+    store.set('b', 2)
+
+    store.delete('a')
+    store.delete('not there')
+
+    assert JsonStateStore(path).get('a') is None
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == {'b': 2}
+
+
+def test_write_leaves_no_partial_file(tmp_path):
+    path = str(tmp_path / 'state.json')
+
+    JsonStateStore(path).set('key', 'value')
+
+    assert os.listdir(tmp_path) == ['state.json']
+
+
+def test_concurrent_updates_are_all_saved(tmp_path):
+    path = str(tmp_path / 'state.json')
+    store = JsonStateStore(path)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: store.set(f'key{i}', i), range(50)))
+
+    assert JsonStateStore(path).get('key49') == 49
+    assert all(JsonStateStore(path).get(f'key{i}') == i for i in range(50))
@@ -0,0 +1,96 @@
+import logging
+import pyarrow.parquet as pq
+import pymssql
+import pytest
+from benchmarks.fake_mssql import FakeMssqlConnection
+from repositorium.el_functions import el_func, el_throttle
+
+
+class TimingOutConnection(FakeMssqlConnection):
+    """Fake connection whose queries over more than max_days days time out."""
+
+    def __init__(self, rows: int, max_days: int, **kwargs):
+        super().__init__(rows, **kwargs)
+        self.max_days = max_days
+        self.timeouts = 0
+
+    def cursor(self):
+        cursor = super().cursor()
+        execute = cursor.execute
+
+        def timed_execute(query, params=None):
+            if params and self.day_of(params[1]) - self.day_of(params[0]) + 1 > self.max_days:
+                self.timeouts += 1
+                raise pymssql.OperationalError(-2, b'Query timeout expired')
+            execute(query, params)
+        cursor.execute = timed_execute
+        return cursor
+
+
+def test_error_classification():
+    assert el_throttle.is_timeout_error(pymssql.OperationalError(-2, b'timeout'))
+    assert el_throttle.is_timeout_error(TimeoutError())
+    assert el_throttle.is_transient_error(pymssql.OperationalError(1205, b'deadlock victim'))
+    assert el_throttle.is_transient_error(ConnectionResetError())
+    assert not el_throttle.is_transient_error(pymssql.OperationalError(18456, b'login failed'))
+    assert not el_throttle.is_transient_error(pymssql.ProgrammingError(102, b'syntax error'))
+    assert not el_throttle.is_transient_error(ValueError())
+
+
+def test_throttle_pauses():
+    assert el_throttle.ThrottlePolicy(mode='off').pause_after(10) == 0
+    assert el_throttle.ThrottlePolicy(mode='fixed', pause=5).pause_after(100) == 5
+    adaptive = el_throttle.ThrottlePolicy(mode='adaptive', factor=0.5, min_pause=1, max_pause=10)
+    assert adaptive.pause_after(0.1) == 1
+    assert adaptive.pause_after(8) == 4
+    assert adaptive.pause_after(100) == 10
+    with pytest.raises(ValueError):
+        el_throttle.ThrottlePolicy(mode='sometimes')
+
+
+def test_retry_delays_grow_up_to_max_delay():
+    retry = el_throttle.RetryPolicy(base_delay=10, max_delay=35, jitter=False)
+
+    assert [retry.delay(attempt) for attempt in (1, 2, 3)] == [10, 20, 35]
+    assert 5 <= el_throttle.RetryPolicy(base_delay=10).delay(1) <= 15
+
+
+def test_retry_only_transient_errors_and_optionally_timeouts():
+    retry = el_throttle.RetryPolicy(max_retries=3)
+    timeout = pymssql.OperationalError(-2, b'timeout')
+
+    assert retry.should_retry(timeout, attempt=1)
+    assert not retry.should_retry(timeout, attempt=3)
+    assert not retry.should_retry(pymssql.ProgrammingError(102, b'syntax error'), attempt=1)
+    assert not retry.without_timeouts().should_retry(timeout, attempt=1)
+    assert retry.without_timeouts().should_retry(ConnectionResetError(), attempt=1)
+
+
+def test_fetch_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(el_func.time, 'sleep', lambda seconds: None)
+    conn = TimingOutConnection(rows=100, max_days=10, days=20)
+
+    with pytest.raises(pymssql.OperationalError):
+        list(el_func.fetch_data_batches(conn, 'SELECT', retry=el_throttle.RetryPolicy(max_retries=2),
+                                        start_date='2023-01-01', end_date='2023-01-20'))
+
+    assert conn.timeouts == 2
+
+
+def test_split_timeouts_are_not_logged_as_errors(tmp_path, log_records):
+    conn = TimingOutConnection(rows=2_000, max_days=20, days=100)
+    date_range = {'start_date': '2023-01-01', 'end_date': '2023-04-10', 'days_per_page': 100,
+                  'target_rows_per_page': 1_000}
+
+    rows = el_func.fetch_data_to_parquet(conn_sql=conn,
+                                         date_range=date_range,
+                                         sql_query='SELECT',
+                                         table_name='accounts',
+                                         data_dir=str(tmp_path),
+                                         temp_dir=str(tmp_path),
+                                         throttle=el_throttle.ThrottlePolicy(mode='off'))
+
+    assert rows == 2_000
+    assert pq.read_metadata(tmp_path / 'accounts.parquet').num_rows == 2_000
+    assert conn.timeouts > 0
+    assert not [record for record in log_records if record.levelno >= logging.ERROR]
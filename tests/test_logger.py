@@ -0,0 +1,40 @@
+import logging
+import queue
+import threading
+from repositorium.logger import NonBlockingQueueHandler
+
+
+def debug_record(msg: str = 'page written') -> logging.LogRecord:
+    return logging.LogRecord('ETL_Logger', logging.DEBUG, __file__, 1, msg, None, None)
+
+
+def test_dropped_records_are_reported_with_the_next_record():
+    log_queue = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.handle(debug_record())
+
+    for _ in range(3):
+        handler.handle(debug_record())
+    assert handler.dropped == 3
+
+    log_queue.get_nowait()
+    handler.handle(debug_record())
+    assert log_queue.get_nowait().dropped == 3
+    assert handler.dropped == 0
+
+
+def test_records_dropped_by_several_threads_are_all_counted():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(debug_record())
+
+    def log_many():
+        for _ in range(5_000):
+            handler.enqueue(debug_record())
+
+    threads = [threading.Thread(target=log_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert handler.dropped == 40_000
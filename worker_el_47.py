@@ -1,14 +1,36 @@
+import argparse
 import os
 import sys
-import duckdb
+from contextlib import nullcontext
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from repositorium.config_modul import config
-from repositorium.logger import logger
+from repositorium.logger import logger, log_dir
 from data_source.sql_tables_data import (
     COMPANY_DATABASE_LIST,
-    ACCOUNTS_47_QUERY)
+    ACCOUNTS_47_QUERY,
+    ACCOUNTS_47_DATE_QUERY,
+    ACCOUNTS_47_OUTSIDE_QUERY,
+    ACCOUNTS_47_SLICE_QUERY,
+    ACCOUNTS_47_INDEXES,
+    ACCOUNTS_47_DATASET,
+    ACCOUNTS_47_DATASET_INDEXES,
+    ACCOUNTS_47_WRITE_OPTIONS,
+    ACCOUNTS_47_OFFLOAD)
 from repositorium.el_functions.el_mssql_classes import (
     MssqlConnection,
-    DatabaseTablesExtractor)
+    MssqlConnectionPool,
+    DatabaseTablesExtractor,
+    SLICE_DATE)
+from repositorium.el_functions.el_loader import ParquetPostgresLoader
+from repositorium.el_functions.el_dimensions import DimensionCache
+from repositorium.el_functions.el_pipeline import ExtractLoadPipeline
+from repositorium.el_functions.el_schema import SchemaCache
+from repositorium.el_functions.el_scheduler import IntervalJob, IntervalScheduler
+from repositorium.el_functions.el_sinks import dataset_dir, SINK_POSTGRES
+from repositorium.el_functions.el_state import JsonStateStore
+from repositorium.el_functions.el_throttle import ThrottlePolicy, RetryPolicy
+from repositorium.el_functions import el_memory, el_metrics
 
 # Source db
 server = config.get('enova_finance_database', 'server')
@@ -23,73 +45,479 @@ dbpassword = config.get('dw_database', 'db_password')
 
 data_dir = './parquet2load'
 temp_dir = './temp'
+state_dir = './state'
+dimension_dir = './dimensions'
+checkpoint_dir = './checkpoints'
 
-def main():
+# Worker settings
+fetch_batch_size = config.getint('worker_el_47', 'fetch_batch_size', fallback=50_000)
+sink_type = config.get('worker_el_47', 'sink_type', fallback='parquet')  # parquet | duckdb | postgres
+# postgres: the batches are loaded straight into the warehouse while they are extracted,
+# without Parquet files; stream_archive keeps writing the files as well
+streaming = sink_type == SINK_POSTGRES
+stream_archive = config.getboolean('worker_el_47', 'stream_archive', fallback=False)
+max_concurrency = config.getint('worker_el_47', 'max_concurrency', fallback=1)  # companies extracted at once
+load_concurrency = config.getint('worker_el_47', 'load_concurrency', fallback=2)  # files loaded at once
+# Load files into staging and swap (streamed tables always go through staging)
+staged_load = config.getboolean('worker_el_47', 'staged_load', fallback=True)
+staged_set_logged = config.getboolean('worker_el_47', 'staged_set_logged', fallback=False)
+# Load each company while the next ones are still extracted (files output only)
+pipelined = config.getboolean('worker_el_47', 'pipelined', fallback=False)
+pipeline_queue_size = config.getint('worker_el_47', 'pipeline_queue_size', fallback=1)  # files waiting to load
 
-    # Extract data
-    for company_name, table_name, company_db in COMPANY_DATABASE_LIST:
+# files: one Parquet file and table per company
+# dataset: one dataset partitioned by company and month, loaded into one table
+output_mode = config.get('worker_el_47', 'output_mode', fallback='files')
+dataset = ACCOUNTS_47_DATASET if output_mode == 'dataset' else None
+if streaming and dataset is not None:
+    logger.warning("The postgres sink loads one table per company, output_mode 'dataset' is ignored")
+    dataset = None
+
+# Parquet write options of the accounts files, codec and row group size can be overridden
+write_options = {
+    **ACCOUNTS_47_WRITE_OPTIONS,
+    'compression': config.get('worker_el_47', 'parquet_compression',
+                              fallback=ACCOUNTS_47_WRITE_OPTIONS['compression']),
+    'compression_level': config.getint('worker_el_47', 'parquet_compression_level',
+                                       fallback=ACCOUNTS_47_WRITE_OPTIONS['compression_level']),
+    'row_group_size': config.getint('worker_el_47', 'parquet_row_group_size',
+                                    fallback=ACCOUNTS_47_WRITE_OPTIONS['row_group_size']),
+}
+
+# Row counts, null counts and amount sums per company and month, collected during the
+# extraction and compared with one aggregate query on the loaded rows before they go live
+reconcile = config.getboolean('worker_el_47', 'reconcile', fallback=False)
+if not reconcile:
+    write_options.pop('reconcile', None)
+
+# Pause after each query and retries of transient errors
+throttle = ThrottlePolicy(
+    mode=config.get('worker_el_47', 'throttle_mode', fallback='adaptive'),  # adaptive | fixed | off
+    pause=config.getfloat('worker_el_47', 'throttle_pause', fallback=5),
+    factor=config.getfloat('worker_el_47', 'throttle_factor', fallback=0.25),
+    max_pause=config.getfloat('worker_el_47', 'throttle_max_pause', fallback=30))
+retry = RetryPolicy(
+    max_retries=config.getint('worker_el_47', 'retry_max', fallback=3),
+    base_delay=config.getfloat('worker_el_47', 'retry_base_delay', fallback=30))
+
+# Incremental extraction on the 'Data' column
+incremental = config.getboolean('worker_el_47', 'incremental', fallback=False)
+lookback_days = config.getint('worker_el_47', 'lookback_days', fallback=62)  # re-read for back-dated postings
+days_per_page = config.getint('worker_el_47', 'days_per_page', fallback=31)
+target_rows_per_page = config.getint('worker_el_47', 'target_rows_per_page', fallback=0)  # 0 = fixed pages
+# Keep the completed date pages of an incremental extraction in checkpoint_dir, a rerun resumes from the
+# first incomplete one; the pages are merged into the table file at the end, which costs one more write.
+# A full extraction is a single query and is not checkpointed.
+checkpoint_pages = config.getboolean('worker_el_47', 'checkpoint_pages', fallback=False)
+watermarks = JsonStateStore(os.path.join(state_dir, 'watermarks.json'))
+
+# Full extraction of one company over several connections at once, overridable
+# per table with slices.<table_name>, e.g. slices.accounts_47_savvy = 4
+slices = config.getint('worker_el_47', 'slices', fallback=1)
+slice_by = config.get('worker_el_47', 'slice_by', fallback='modulo')  # modulo (by entry id) | date
+history_start_date = config.get('worker_el_47', 'history_start_date', fallback='2000-01-01')  # first day of date slices, older rows are one more slice
+
+# Tables whose data has not changed since the last load are skipped unless forced
+force_load = config.getboolean('worker_el_47', 'force_load', fallback=False)
+fingerprints = JsonStateStore(os.path.join(state_dir, 'fingerprints.json'))
+
+# Exact column types (decimal precision and scale, integer widths, nullability) asked
+# from the server once per query text; delete state/schemas.json after a source schema change
+describe_schema = config.getboolean('worker_el_47', 'describe_schema', fallback=False)
+schema_cache = SchemaCache(os.path.join(state_dir, 'schemas.json')) if describe_schema else None
+
+# Extract the ledger rows with dimension keys only, and join the names (accounts,
+# contractors, document definitions, cost centres) locally from cached dimension tables
+offload_dimensions = config.getboolean('worker_el_47', 'offload_dimensions', fallback=False)
+dimension_cache = DimensionCache(cache_dir=dimension_dir,
+                                 temp_dir=temp_dir,
+                                 fetch_batch_size=fetch_batch_size,
+                                 throttle=throttle,
+                                 retry=retry)
+
+# One memory budget for the worker (e.g. 14g under the container's mem_limit of 16g), split
+# between fetch batches, Arrow buffers and DuckDB, which spills to temp_dir; empty = no limit
+memory_budget = config.get('worker_el_47', 'memory_budget', fallback='')
+
+# Run report with the timings of every stage, and optionally a node_exporter textfile
+report_dir = os.path.join(log_dir, 'run_reports')
+prometheus_textfile = config.get('worker_el_47', 'prometheus_textfile', fallback='')
+
+# Daemon mode (--daemon): runs every daemon_interval_minutes, keeping its connections open
+daemon_interval_minutes = config.getfloat('worker_el_47', 'daemon_interval_minutes', fallback=60)
+health_check_interval = config.getfloat('worker_el_47', 'health_check_interval', fallback=60)  # seconds idle
+mssql_pool = None  # MssqlConnectionPool of the daemon
+
+
+def source_connection(company_db: str):
+    """Connection to a company database: lent from the pool in daemon mode, opened for the run otherwise."""
+    if mssql_pool is not None:
+        return mssql_pool.connection(company_db)
+    return MssqlConnection(server=server,
+                           username=username,
+                           password=password,
+                           database=company_db)
+
+
+def watermark_key(company_db: str, table_name: str) -> str:
+    return f"{company_db}/{table_name}"
+
+
+def table_slices(table_name: str) -> int:
+    if streaming:
+        return 1  # slices are merged from Parquet parts
+    return config.getint('worker_el_47', f'slices.{table_name}', fallback=slices)
+
+
+def extract_company(company_name: str,
+                    table_name: str,
+                    company_db: str,
+                    loader: ParquetPostgresLoader = None) -> tuple[str, dict]:
+    """
+    Extracts one company over its own connection.
+
+    With the postgres sink the company is loaded into the warehouse by loader
+    as it is extracted.
+
+    Returns:
+        tuple: (table_name, delta_window)
+            - table_name (str): Extracted table.
+            - delta_window (dict): Date window of an incremental extraction,
+              None when the whole table was extracted.
+    """
+    el_metrics.set_context(company=company_name, table=table_name)
+
+    extractor = DatabaseTablesExtractor(data_dir=data_dir,
+                                        temp_dir=temp_dir,
+                                        fetch_batch_size=fetch_batch_size,
+                                        sink_type=sink_type,
+                                        throttle=throttle,
+                                        retry=retry,
+                                        dataset=dataset,
+                                        write_options=write_options,
+                                        slices=table_slices(table_name),
+                                        connection_factory=lambda: source_connection(company_db),
+                                        schema_cache=schema_cache,
+                                        offload={**ACCOUNTS_47_OFFLOAD,
+                                                 'join_query': ACCOUNTS_47_OFFLOAD['join_query'].format(
+                                                     company_name=company_name),
+                                                 'source': company_db}
+                                        if offload_dimensions and not streaming else None,
+                                        dimension_cache=dimension_cache,
+                                        loader=loader,
+                                        checkpoint_dir=checkpoint_dir if checkpoint_pages else None)
+    watermark = watermarks.get(watermark_key(company_db, table_name)) if incremental else None
+
+    if watermark is None and extractor.slices > 1:
+        # Full extraction split over several connections
+        if slice_by == SLICE_DATE:
+            extractor.create_parquet_sliced(
+                table_query=ACCOUNTS_47_DATE_QUERY.format(company_name=company_name),
+                table_name=table_name,
+                slice_by=SLICE_DATE,
+                date_range={'start_date': history_start_date,
+                            'end_date': datetime.now().strftime('%Y-%m-%d'),
+                            'days_per_page': days_per_page},
+                outside_query=ACCOUNTS_47_OUTSIDE_QUERY.format(company_name=company_name))
+        else:
+            extractor.create_parquet_sliced(
+                table_query=ACCOUNTS_47_SLICE_QUERY.format(company_name=company_name),
+                table_name=table_name)
+        return table_name, None
+
+    with source_connection(company_db) as conn:
         
-        with MssqlConnection(server=server,
-                            username=username,
-                            password=password,
-                            database=company_db) as conn:
-            
-            extractor = DatabaseTablesExtractor(data_dir=data_dir,
-                                                temp_dir=temp_dir)
-            
-            
-            extractor.set_connection(conn_sql=conn)
+        extractor.set_connection(conn_sql=conn)
+
+        if not incremental:
             extractor.create_parquet(
                 table_query=ACCOUNTS_47_QUERY.format(
                     company_name=company_name
                     ),
                 table_name=table_name
             )
+            return table_name, None
+
+        date_range = extractor.create_parquet_incremental(
+            table_query=ACCOUNTS_47_QUERY.format(company_name=company_name),
+            date_table_query=ACCOUNTS_47_DATE_QUERY.format(company_name=company_name),
+            table_name=table_name,
+            watermark=watermark,
+            lookback_days=lookback_days,
+            days_per_page=days_per_page,
+            page_options={'column': 'Data',
+                          **({'target_rows_per_page': target_rows_per_page} if target_rows_per_page else {})}
+        )
+
+    if date_range is None:
+        return table_name, None
+
+    return table_name, {
+        'column': 'Data',
+        'start_date': date_range['start_date'],
+        'end_date': date_range['end_date']
+    }
+
+
+def extract_companies(company_list: list,
+                      max_workers: int,
+                      loader: ParquetPostgresLoader = None) -> tuple[dict, list]:
+    """
+    Extracts the companies concurrently, at most max_workers at a time.
+
+    With the postgres sink, loader loads them as they are extracted.
+
+    A failure of one company is logged and does not stop the others.
+
+    Returns:
+        tuple: (succeeded, failed)
+            - succeeded (dict): delta_window (or None) per table extracted successfully.
+            - failed (list): Names of the companies that failed.
+    """
+    succeeded, failed = {}, []
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='extract') as pool:
+        futures = {
+            pool.submit(extract_company, company_name, table_name, company_db, loader): company_name
+            for company_name, table_name, company_db in company_list
+        }
+        for future in as_completed(futures):
+            company_name = futures[future]
+            try:
+                table_name, delta_window = future.result()
+                succeeded[table_name] = delta_window
+                logger.info(f'Extraction finished for {company_name}')
+            except Exception as e:
+                failed.append(company_name)
+                logger.error(f'Extraction failed for {company_name}: {e}', exc_info=True)
+
+    logger.info(f'Extraction summary: {len(succeeded)} succeeded {list(succeeded)}, '
+                f'{len(failed)} failed {failed}')
+    return succeeded, failed
 
-    # Load data
+
+def extract_and_load(loader: ParquetPostgresLoader, company_list: list) -> tuple[dict, list, list, list]:
+    """
+    Extracts the companies and loads each file as soon as it is written.
+
+    Up to max_concurrency companies are extracted and load_concurrency files
+    loaded at once. A file waits in a queue of pipeline_queue_size for a free
+    loader; while the queue is full no new extraction starts.
+
+    Returns:
+        tuple: (extracted_tables, failed_companies, load_stats, failed_files)
+            as extract_companies() and ParquetPostgresLoader.load_files() return them.
+    """
+    def extract(company):
+        company_name, table_name, company_db = company
+        return extract_company(company_name, table_name, company_db)
+
+    def load(company, extracted):
+        table_name, delta_window = extracted
+        return loader.load_file(os.path.join(data_dir, f"{table_name}.parquet"), delta_window=delta_window)
+
+    pipeline = ExtractLoadPipeline(extract=extract,
+                                   load=load,
+                                   extract_workers=max_concurrency,
+                                   load_workers=load_concurrency,
+                                   queue_size=pipeline_queue_size)
+    result = pipeline.run(tuple(company) for company in company_list)
+
+    extracted_tables = dict(result.extracted.values())
+    failed_companies = [company_name for company_name, _, _ in result.failed_extract]
+    failed_files = [os.path.join(data_dir, f"{table_name}.parquet") for _, table_name, _ in result.failed_load]
+    return extracted_tables, failed_companies, list(result.loaded.values()), failed_files
+
+
+def load_dataset(loader: ParquetPostgresLoader, extracted_tables: dict) -> tuple[list, list, set]:
+    """
+    Loads the partitioned dataset of all companies into one table.
+
+    When every company was extracted in full the table is recreated. Otherwise
+    only the extracted companies are refreshed: their delta windows, or all of
+    their rows after a full extraction.
+
+    Returns:
+        tuple: (load_stats, failed, loaded_tables)
+    """
+    if not extracted_tables:
+        return [], [], set()
+
+    company_of = {table_name: company_name for company_name, table_name, _ in COMPANY_DATABASE_LIST}
+    all_full = (len(extracted_tables) == len(COMPANY_DATABASE_LIST)
+                and not any(extracted_tables.values()))
+    refresh = None if all_full else {
+        company_of[table_name]: window for table_name, window in extracted_tables.items()
+    }
+
+    try:
+        stats = loader.load_dataset(dataset_path=dataset_dir(data_dir, dataset),
+                                    partition_by=dataset['partition_by'],
+                                    refresh=refresh)
+    except Exception as e:
+        logger.error(f"Error occurred while loading dataset {dataset['name']}: {e}", exc_info=True)
+        return [], [dataset['name']], set()
+    return [stats], [], set(extracted_tables)
+
+
+def create_loader(force: bool = force_load) -> ParquetPostgresLoader:
+    """Loader into the warehouse, with Postgres attached to DuckDB on first use."""
     ATTACH_STRING = f'''ATTACH 'dbname={dbname}
             user={dbuser}
             password={dbpassword}
             host={dbhost}'
             AS st_db (TYPE POSTGRES, SCHEMA 'public');'''
-              
-  
-    try:
-        with duckdb.connect(':memory:') as conn:
-            conn.execute(ATTACH_STRING)
-            logger.info(f'The db {dbname} has been attached')
 
-            for file_name in os.listdir(data_dir):
-                if file_name.endswith('.parquet'):
-                    table_name = os.path.splitext(file_name)[0]
-                    file_path = os.path.join(data_dir, file_name)
+    return ParquetPostgresLoader(attach_string=ATTACH_STRING,
+                                 db_alias='st_db',
+                                 max_workers=load_concurrency,
+                                 staged=staged_load,
+                                 indexes={table_name: ACCOUNTS_47_INDEXES
+                                          for _, table_name, _ in COMPANY_DATABASE_LIST}
+                                         | {ACCOUNTS_47_DATASET['name']: ACCOUNTS_47_DATASET_INDEXES},
+                                 set_logged=staged_set_logged,
+                                 fingerprints=fingerprints,
+                                 force=force,
+                                 health_check_interval=health_check_interval,
+                                 archive_files=stream_archive,
+                                 reconcile=reconcile)
 
-                    # Drop table if it exists
-                    conn.execute(f"""
-                        DROP TABLE IF EXISTS st_db.{table_name} CASCADE;
-                    """)
 
-                    # Create empty table based on schema
-                    conn.execute(f"""
-                        CREATE TABLE st_db.{table_name} AS 
-                        SELECT * FROM read_parquet('{file_path}') WHERE 1=0;
-                    """)
+def run(force: bool = force_load, shared_loader: ParquetPostgresLoader = None) -> int:
+    """
+    Extracts and loads all companies once.
 
-                    # Load data into the table
-                    conn.execute(f"""
-                        COPY st_db.{table_name} FROM '{file_path}' (FORMAT PARQUET);
-                    """)
+    Args:
+        force (bool): Loads every table, even if its data has not changed.
+        shared_loader (ParquetPostgresLoader): Loader kept open by the daemon;
+            by default a loader is created and closed for this run.
+    """
+    extraction_date = datetime.now().strftime('%Y-%m-%d')
 
-                    logger.info(f'The file {file_name} has been successfully loaded to the database {dbname}')
+    with create_loader(force) if shared_loader is None else nullcontext(shared_loader) as loader:
+        loader.force = force
+        if streaming:
+            # Extract and load in one pass, every company is loaded when its extraction succeeds
+            extracted_tables, failed_companies = extract_companies(
+                company_list=COMPANY_DATABASE_LIST,
+                max_workers=max_concurrency,
+                loader=loader
+                )
+            load_stats, failed_files, loaded_tables = [], [], set(extracted_tables)
+        elif pipelined and dataset is None:
+            # Extract and load data at the same time
+            extracted_tables, failed_companies, load_stats, failed_files = extract_and_load(
+                loader, COMPANY_DATABASE_LIST)
+            loaded_tables = {stats['table'] for stats in load_stats}
+        else:
+            # Extract data
+            extracted_tables, failed_companies = extract_companies(
+                company_list=COMPANY_DATABASE_LIST,
+                max_workers=max_concurrency
+                )
 
-    except Exception as e:
-        logger.error(f'Error occurred while loading parquet files to database {dbname}: {e}', exc_info=False)
-        raise
+            # Load data
+            if dataset is None:
+                file_paths = [
+                    os.path.join(data_dir, file_name)
+                    for file_name in os.listdir(data_dir)
+                    if file_name.endswith('.parquet') and os.path.splitext(file_name)[0] in extracted_tables
+                ]
+                load_stats, failed_files = loader.load_files(
+                    file_paths,
+                    delta_windows={table: window for table, window in extracted_tables.items() if window}
+                    )
+                loaded_tables = {stats['table'] for stats in load_stats}
+            else:
+                load_stats, failed_files, loaded_tables = load_dataset(loader, extracted_tables)
+
+    for stats in load_stats:
+        if not stats['skipped']:
+            logger.info(f"The table {stats['table']} has been successfully loaded to the database {dbname}")
+
+    # Move the watermarks only after a successful load
+    if incremental:
+        for _, table_name, company_db in COMPANY_DATABASE_LIST:
+            if table_name in loaded_tables:
+                watermarks.set(watermark_key(company_db, table_name), extraction_date)
+
+    if failed_files:
+        logger.error(f'Error occurred while loading parquet files to database {dbname}: {failed_files}')
+        return 1
+
+    if failed_companies:
+        logger.error(f"Task finished with failed companies: {failed_companies}")
+        return 1
 
     logger.info("Task finished successfully, exiting now")    
     return 0            
-        
+
+
+def configure_memory() -> None:
+    """Splits memory_budget between the extractions and DuckDB connections that run at once."""
+    el_memory.governor.configure(
+        budget_bytes=el_memory.parse_bytes(memory_budget) if memory_budget else None,
+        temp_dir=temp_dir,
+        extract_workers=max_concurrency * max(table_slices(table_name)
+                                              for _, table_name, _ in COMPANY_DATABASE_LIST),
+        duckdb_connections=max_concurrency + load_concurrency)
+
+
+def main(force: bool = force_load, shared_loader: ParquetPostgresLoader = None) -> int:
+    """Runs the job and writes its run report, also when the job fails."""
+    el_metrics.run_report.reset(job='worker_el_47')
+    configure_memory()
+    exit_code = 1
+    try:
+        exit_code = run(force=force, shared_loader=shared_loader)
+    finally:
+        el_metrics.run_report.write_json(report_dir, status=exit_code)
+        if prometheus_textfile:
+            el_metrics.run_report.write_prometheus(prometheus_textfile, status=exit_code)
+    return exit_code
+
+
+def daemon(force: bool = force_load) -> int:
+    """
+    Runs the job every daemon_interval_minutes until SIGTERM or SIGINT.
+
+    The MSSQL connections (per company database) and the DuckDB connections
+    with Postgres attached stay open between runs and are health checked
+    instead of reopened.
+    """
+    global mssql_pool
+    mssql_pool = MssqlConnectionPool(server=server,
+                                     username=username,
+                                     password=password,
+                                     max_idle=max(table_slices(table_name)
+                                                  for _, table_name, _ in COMPANY_DATABASE_LIST),
+                                     health_check_interval=health_check_interval)
+    loader = create_loader(force)
+    scheduler = IntervalScheduler([
+        IntervalJob(name='worker_el_47',
+                    interval_seconds=daemon_interval_minutes * 60,
+                    func=lambda: main(force=force, shared_loader=loader)),
+    ])
+    try:
+        scheduler.run_forever()
+    finally:
+        loader.close()
+        mssql_pool.close()
+        mssql_pool = None
+    return 0
+
+
 if __name__ == '__main__':
-    exit_code = main()
+    parser = argparse.ArgumentParser(description='Enova accounts 47 EL worker')
+    parser.add_argument('--force', action='store_true', default=force_load,
+                        help='load every table, even if its data has not changed')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running and repeat the job every daemon_interval_minutes')
+    args = parser.parse_args()
+
+    if args.daemon:
+        exit_code = daemon(force=args.force)
+    else:
+        exit_code = main(force=args.force)
     logger.info(f"Exiting with code {exit_code}")
     sys.exit(exit_code)
\ No newline at end of file